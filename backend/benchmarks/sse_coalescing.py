@@ -0,0 +1,114 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Compare per-token and coalesced SSE writes of `/api/chat`
+
+Every simulated client streams `--tokens` completion events through `iter_frames` and `EventStreamResponse`,
+the same path as the chat route. The engine produces a token every `--interval-ms` and the network hands them
+over in bursts of up to `--burst` events, like llama.cpp behind a busy connection.
+
+Run from the `backend` directory:
+
+    python -m benchmarks.sse_coalescing --clients 200 --tokens 256 --window-ms 5
+"""
+
+import argparse
+import asyncio
+import random
+import socket
+import statistics
+import time
+
+from src.utilities.httpkit.sse_kit import CompletionEvent, iter_frames
+from src.utilities.httpkit.sse_response import EventStreamResponse
+
+
+async def completion_events(n_tokens: int, interval: float, burst: int):
+    sent = 0
+    while sent < n_tokens:
+        n_burst = min(random.randint(1, burst), n_tokens - sent)
+        await asyncio.sleep(interval * n_burst)
+        for _ in range(n_burst):
+            sent += 1
+            stop = sent == n_tokens
+            yield CompletionEvent(
+                content="" if stop else " tok",
+                stop=stop,
+                id_slot=0,
+                payload={},
+                data='{"content":" tok","stop":false,"id_slot":0}',
+            )
+
+
+async def client(args: argparse.Namespace, window: float) -> tuple[int, float]:
+    writes = 0
+    first_write = None
+    start = time.perf_counter()
+    # Every write is a real syscall, like the transport of the ASGI server
+    server, peer = socket.socketpair()
+    server.setblocking(False)
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message: dict):
+        nonlocal writes, first_write
+        if message["type"] == "http.response.body" and message.get("body"):
+            server.send(message["body"])
+            writes += 1
+            if first_write is None:
+                first_write = time.perf_counter() - start
+
+    events = completion_events(args.tokens, args.interval_ms / 1000, args.burst)
+    response = EventStreamResponse(iter_frames(events, coalesce_window=window))
+    try:
+        await response({"type": "http"}, receive, send)
+    finally:
+        server.close()
+        peer.close()
+    return writes, first_write
+
+
+async def run(args: argparse.Namespace, window: float) -> dict:
+    random.seed(0)
+    wall, cpu = time.perf_counter(), time.process_time()
+    results = await asyncio.gather(*(client(args, window) for _ in range(args.clients)))
+    return {
+        "writes": sum(writes for writes, _ in results),
+        "ttft_ms": statistics.median(first for _, first in results) * 1000,
+        "wall_s": time.perf_counter() - wall,
+        "cpu_s": time.process_time() - cpu,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=256)
+    parser.add_argument("--interval-ms", type=float, default=2)
+    parser.add_argument("--burst", type=int, default=4)
+    parser.add_argument("--window-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'writes':>10}{'median TTFT ms':>18}{'wall s':>10}{'CPU s':>10}")
+    for mode, window in (("per-token", 0), (f"{args.window_ms:g}ms", args.window_ms / 1000)):
+        result = asyncio.run(run(args, window))
+        print(
+            f"{mode:<12}{result['writes']:>10}{result['ttft_ms']:>18.2f}{result['wall_s']:>10.2f}{result['cpu_s']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -13,15 +13,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections.abc import AsyncGenerator
+
 import fastapi
 import loguru
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.responses import StreamingResponse
-from starlette.responses import ContentStream
+from starlette.background import BackgroundTask
 from src.api.dependencies.repository import get_rag_repository, get_repository
 from src.securities.authorizations.jwt import jwt_required
 from src.utilities.exceptions.database import EntityDoesNotExist
 from src.utilities.exceptions.http.exc_404 import http_404_exc_uuid_not_found_request
+from src.utilities.exceptions.http.exc_429 import http_429_exc_too_many_requests
+from src.utilities.exceptions.http.exc_503 import http_503_exc_service_unavailable
 from src.config.settings.const import ANONYMOUS_USER
 from src.config.manager import settings
 from src.models.schemas.chat import (
@@ -33,10 +37,14 @@ from src.models.schemas.chat import (
     ChatUUIDResponse,
     SaveChatHistory,
 )
+from src.repository.admission import AdmissionRejected, chat_admission
+from src.repository.chat_history_writer import chat_history_writer
 from src.repository.crud.chat import ChatHistoryCRUDRepository, SessionCRUDRepository
 from src.repository.crud.account import AccountCRUDRepository
 from src.repository.rag.chat import RAGChatModelRepository
 from src.utilities.formatters.ds_formatter import DatasetFormatter
+from src.utilities.httpkit.sse_kit import CompletionEvent, iter_frames
+from src.utilities.httpkit.sse_response import EventStreamResponse
 
 router = fastapi.APIRouter(prefix="/chat", tags=["chatbot"])
 # Automatically get the token from the request header for Swagger UI
@@ -221,6 +229,14 @@ async def chat(
     }'
     ```
 
+    The user message and the streamed answer are saved to the chat history of the session after the stream
+    ends, there is no need to call `/api/chat/save` for them.
+
+    When the inference engines are busy the request waits for a free one. It is rejected with `429` if too many
+    requests are already waiting, or with `503` if it waited too long. Both carry a `Retry-After` header.
+
+    Closing the connection in the middle of the answer stops the generation on the inference engine.
+
     **Return StreamingResponse:**
     data: {"content":" Yes","stop":false,"id_slot":0,"multimodal":false}
 
@@ -247,7 +263,7 @@ async def chat(
 
     match session.session_type:
         case "rag":
-            stream_func: ContentStream = rag_chat_repo.inference_with_rag(
+            stream_func: AsyncGenerator[CompletionEvent, None] = rag_chat_repo.inference_with_rag(
                 session_id=session.id,
                 input_msg=chat_in_msg.message,
                 collection_name=chat_in_msg.collection_name,
@@ -257,7 +273,7 @@ async def chat(
                 n_predict=chat_in_msg.n_predict,
             )
         case _:  # default is chat robot
-            stream_func: ContentStream = rag_chat_repo.inference(
+            stream_func: AsyncGenerator[CompletionEvent, None] = rag_chat_repo.inference(
                 session_id=session.id,
                 input_msg=chat_in_msg.message,
                 temperature=chat_in_msg.temperature,
@@ -266,9 +282,21 @@ async def chat(
                 n_predict=chat_in_msg.n_predict,
             )
 
-    # Buffering (the real problem) https://serverfault.com/questions/801628/for-server-sent-events-sse-what-nginx-proxy-configuration-is-appropriate/801629#
-    return StreamingResponse(
-        stream_func, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}, media_type="text/event-stream"
+    # The finished turn is saved in the background, the client doesn't need to call `/chat/save`
+    stream_func = chat_history_writer.record(stream_func, session_id=session.id, user_message=chat_in_msg.message)
+
+    # Wait for a free engine before the stream starts, so an overload is answered with a status code
+    try:
+        lease = await chat_admission.acquire()
+    except AdmissionRejected as e:
+        if e.queue_full:
+            raise await http_429_exc_too_many_requests(retry_after=e.retry_after)
+        raise await http_503_exc_service_unavailable(retry_after=e.retry_after)
+
+    # A client disconnect stops the generation on the engine, the lease is released in every case
+    return EventStreamResponse(
+        iter_frames(stream_func, coalesce_window=settings.SSE_COALESCE_WINDOW_MS / 1000),
+        background=BackgroundTask(lease.release),
     )
 
 
@@ -403,6 +431,7 @@ async def save_chats(
     
     **Note:**
     
+    Turns streamed by `/api/chat` are saved automatically, use this API to import other chat histories
     No overlap chat histories
     Messages longer than 4096 characters will be truncated
         
@@ -6,7 +6,7 @@ import fastapi
 from fastapi import BackgroundTasks
 
 from src.api.dependencies.repository import get_repository
-from src.config.settings.const import UPLOAD_FILE_PATH
+from src.config.manager import settings
 from src.models.schemas.file import FileInResponse
 from src.repository.crud.file import UploadedFileCRUDRepository
 from src.utilities.exceptions.database import EntityAlreadyExists
@@ -38,6 +38,8 @@ async def upload_and_return_id(
     """
     Uploads a file and returns the file ID
 
+    CSV, JSONL and Parquet files can then be loaded into the vector database with `/api/ds/load`.
+
     ```bash
     curl -X 'POST' 'http://127.0.0.1:8000/file'
     -H 'accept: application/json'
@@ -51,12 +53,13 @@ async def upload_and_return_id(
     filename = file.filename
     try:
         new_file = await file_repo.create_uploadfile(file_name=filename)
-        save_path = UPLOAD_FILE_PATH
+        # Where `/api/ds/load` reads the CSV, JSONL and Parquet files from
+        save_path = settings.LOCAL_DATASETS_PATH
     except EntityAlreadyExists:
         raise await http_400_exc_bad_file_name_request(filename)
 
     if not os.path.exists(save_path):
-        os.mkdir(save_path)
+        os.makedirs(save_path)
     save_file = os.path.join(save_path, filename)
     contents = await file.read()
     background_tasks.add_task(save_upload_file, contents, save_file)
@@ -0,0 +1,45 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fastapi
+
+from src.models.schemas.metrics import MetricsResponse
+from src.utilities.metrics.registry import metrics
+
+router = fastapi.APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get(
+    path="",
+    name="metrics:get-metrics",
+    response_model=MetricsResponse,
+    status_code=fastapi.status.HTTP_200_OK,
+)
+async def get_metrics() -> MetricsResponse:
+    """
+    Get the in-process metrics of the worker
+
+    Each uvicorn worker keeps its own metrics, the values are those of the worker which served the request.
+
+    ```bash
+    curl http://localhost:8000/api/metrics
+    ```
+
+    Return MetricsResponse:
+    - **counters**: e.g. `slot_hits`, `slot_misses`
+    - **gauges**: current values
+    - **histograms**: distributions with cumulative buckets
+    """
+    return MetricsResponse(**metrics.snapshot())
@@ -1,15 +1,28 @@
-from src.models.schemas.dataset import DatasetCreate
-from src.repository.crud.dataset_db import DataSetCRUDRepository
+import asyncio
+
 import fastapi
-import threading
-from src.api.dependencies.repository import get_rag_repository, get_repository
+from fastapi.security import OAuth2PasswordBearer
+
+from src.api.dependencies.repository import get_repository
 from src.models.schemas.train import TrainFileIn, TrainFileInResponse
-from src.repository.crud.ai_model import AiModelCRUDRepository
+from src.repository.crud.account import AccountCRUDRepository
+from src.repository.crud.dataset_db import DataSetCRUDRepository
 from src.repository.crud.file import UploadedFileCRUDRepository
-from src.repository.rag.chat import RAGChatModelRepository
+from src.repository.database import async_db
+from src.repository.dataset_sources import LOCAL_FORMATS, collection_name, is_local_source
+from src.repository.ingestion_jobs import IngestionJob, IngestionJobConflict, ingestion_jobs
+from src.repository.rag_datasets_eng import DatasetEng
+from src.securities.authorizations.jwt import jwt_required
+from src.utilities.exceptions.http.exc_400 import (
+    http_400_exc_bad_file_format_request,
+    http_400_exc_no_train_data_request,
+)
+from src.utilities.exceptions.http.exc_409 import http_409_exc_dataset_loading_request
 
 router = fastapi.APIRouter(prefix="/train", tags=["train"])
 
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/verify")
+
 
 @router.post(
     "",
@@ -20,10 +33,10 @@ router = fastapi.APIRouter(prefix="/train", tags=["train"])
 )
 async def save(
     train_in_msg: TrainFileIn,
-    aimodel_repo: AiModelCRUDRepository = fastapi.Depends(get_repository(repo_type=AiModelCRUDRepository)),
+    token: str = fastapi.Depends(oauth2_scheme),
     file_repo: UploadedFileCRUDRepository = fastapi.Depends(get_repository(repo_type=UploadedFileCRUDRepository)),
-    rag_chat_repo: RAGChatModelRepository = fastapi.Depends(get_rag_repository(repo_type=RAGChatModelRepository)),
-    dataset_repo: DataSetCRUDRepository = fastapi.Depends(get_rag_repository(repo_type=DataSetCRUDRepository)),
+    account_repo: AccountCRUDRepository = fastapi.Depends(get_repository(repo_type=AccountCRUDRepository)),
+    jwt_payload: dict = fastapi.Depends(jwt_required),
 ) -> TrainFileInResponse:
     """
     Save file or dataset to DB for training
@@ -31,6 +44,7 @@ async def save(
     ```bash
     curl -X 'POST' 'http://127.0.0.1:8000/train'
     -H 'accept: application/json'
+    -H 'Authorization: Bearer <token>'
     -H 'Content-Type: application/json'
     -d '{
         "modelID": "model_id",
@@ -41,27 +55,44 @@ async def save(
 
     Returns TrainFileInResponse:
     - **msg**: The status of the training
-    """
-    # 1, either fileID or dataset should be shown in input
-    # 2, validate fileID or dataset
-    # 3, use file and or dataset perform the training logic (csv id done)
+    - **jobId**: The job loading the data
+
+    The uploaded CSV, JSONL or Parquet file, or else the dataset of the HF hub, is loaded into the vector
+    database in the background. The `embedField` column is embedded, `INGESTION_TEXT_FIELD` by default. The
+    progress can be followed with `/api/ds/jobs/{jobId}` by the same account.
 
-    if train_in_msg.modelID is not None and train_in_msg.fileID is not None:
-        # if contains file ID and modelID,  then load file
-        ai_model = await aimodel_repo.read_aimodel_by_id(id=train_in_msg.modelID)
-        file_csv = await file_repo.read_uploadedfiles_by_id(id=train_in_msg.fileID)
-        await rag_chat_repo.load_csv_file(file_name=file_csv.name, model_name=ai_model.name)
+    `modelID` is ignored: the rows are embedded by the embedding engine, with `EMBEDDING_MODEL_NAME`.
+    """
+    current_user = await account_repo.read_account_by_username(username=jwt_payload.username)
+    if train_in_msg.fileID is None and train_in_msg.dataSet is None:
+        raise await http_400_exc_no_train_data_request()
+    if train_in_msg.fileID is not None:
+        uploaded_file = await file_repo.read_uploadedfiles_by_id(id=train_in_msg.fileID)
+        name = uploaded_file.name
+        # Any other name would be looked up on the HF hub
+        if not is_local_source(name):
+            raise await http_400_exc_bad_file_format_request(file_name=name, formats=list(LOCAL_FORMATS))
     else:
-        # Else, load dataset
-        db_dataset = await dataset_repo.get_dataset_by_name(train_in_msg.dataSet)
-        if not db_dataset:
-            dataload_thread = threading.Thread(target=rag_chat_repo.load_data_set, args=(train_in_msg,))
-            dataload_thread.daemon = True
-            dataload_thread.start()
-            await dataset_repo.create_dataset(
-                DatasetCreate(dataset_name=train_in_msg.dataSet, des=train_in_msg.dataSet)
+        name = train_in_msg.dataSet
+
+    async def record_dataset(job: IngestionJob) -> None:
+        async with async_db.async_session_maker() as async_session:
+            await DataSetCRUDRepository(async_session=async_session).record_dataset_embedding(
+                dataset_name=collection_name(name),
+                account_id=current_user.id,
+                embedding_model=job.embedding_model,
+                embedding_dim=job.embedding_dim,
             )
 
-    return TrainFileInResponse(
-        msg="successful",
-    )
+    loop = asyncio.get_running_loop()
+    try:
+        job = ingestion_jobs.submit(
+            IngestionJob(dataset_name=name, account_id=current_user.id),
+            work=lambda job: DatasetEng.load_dataset(name, loop=loop, job=job, text_field=train_in_msg.embedField),
+            on_success=record_dataset,
+            key=collection_name(name),
+        )
+    except IngestionJobConflict as e:
+        raise await http_409_exc_dataset_loading_request(dataset_name=name, job_id=e.job.id)
+
+    return TrainFileInResponse(trainID=None, msg="successful", job_id=job.id)
@@ -19,7 +19,12 @@ import fastapi
 import loguru
 
 from src.repository.events import (
+    dispose_chat_history_writer,
     dispose_db_connection,
+    dispose_ingestion_jobs,
+    dispose_vectordb_connection,
+    initialize_chat_history_writer,
+    initialize_inference_slots,
     initialize_db_connection,
     initialize_vectordb_collection,
     dispose_httpx_client,
@@ -32,6 +37,8 @@ def execute_backend_server_event_handler(backend_app: fastapi.FastAPI) -> typing
         await initialize_db_connection(backend_app=backend_app)
         await initialize_vectordb_collection()
         await initialize_default_data()
+        await initialize_chat_history_writer()
+        await initialize_inference_slots()
 
     return launch_backend_server_events
 
@@ -39,7 +46,11 @@ def execute_backend_server_event_handler(backend_app: fastapi.FastAPI) -> typing
 def terminate_backend_server_event_handler(backend_app: fastapi.FastAPI) -> typing.Any:
     @loguru.logger.catch
     async def stop_backend_server_events() -> None:
+        # Flush pending chat history before the database connections go away
+        await dispose_chat_history_writer()
+        await dispose_ingestion_jobs()
         await dispose_db_connection(backend_app=backend_app)
+        await dispose_vectordb_connection()
         await dispose_httpx_client()
 
     return stop_backend_server_events
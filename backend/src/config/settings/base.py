@@ -20,6 +20,8 @@ import decouple
 import pydantic
 from pydantic_settings import BaseSettings
 
+from src.config.settings.const import LOAD_BATCH_SIZE, RAG_NUM, UPLOAD_FILE_PATH
+
 ROOT_DIR: pathlib.Path = pathlib.Path(__file__).parent.parent.parent.parent.parent.resolve()
 
 
@@ -39,9 +41,41 @@ class BackendBaseSettings(BaseSettings):
     REDOC_URL: str = "/redoc"
     OPENAPI_PREFIX: str = ""
 
+    # `milvus`, or `numpy` for the in-process store persisted under VECTOR_STORE_PATH, no extra service needed
+    VECTOR_STORE: str = decouple.config("VECTOR_STORE", default="milvus", cast=str)  # type: ignore
+    VECTOR_STORE_PATH: str = decouple.config("VECTOR_STORE_PATH", default="./vector_store/", cast=str)  # type: ignore
+    # Search the large collections of the `numpy` store with an IVF index instead of comparing every vector
+    VECTOR_STORE_IVF: bool = decouple.config("VECTOR_STORE_IVF", default=False, cast=bool)  # type: ignore
+    # Threads running the searches of the `numpy` store
+    VECTOR_STORE_SEARCH_WORKERS: int = decouple.config("VECTOR_STORE_SEARCH_WORKERS", default=4, cast=int)  # type: ignore
     MILVUS_HOST: str = decouple.config("MILVUS_HOST", cast=str)  # type: ignore
     MILVUS_PORT: int = decouple.config("MILVUS_PORT", cast=int)  # type: ignore
     MILVUS_VERSION: str = decouple.config("MILVUS_VERSION", cast=str)  # type: ignore
+    # Datasets loaded at once in the background, the others wait
+    INGESTION_WORKERS: int = decouple.config("INGESTION_WORKERS", default=2, cast=int)  # type: ignore
+    # Rows read, embedded and inserted together by the ingestion pipeline
+    INGESTION_BATCH_SIZE: int = decouple.config("INGESTION_BATCH_SIZE", default=LOAD_BATCH_SIZE, cast=int)  # type: ignore
+    # Column of the datasets embedded and searched, the vectors are computed by the embedding engines
+    INGESTION_TEXT_FIELD: str = decouple.config("INGESTION_TEXT_FIELD", default="question", cast=str)  # type: ignore
+    # Passages longer than this many tokens are split into chunks embedded on their own, 0 to keep them whole
+    INGESTION_CHUNK_TOKENS: int = decouple.config("INGESTION_CHUNK_TOKENS", default=256, cast=int)  # type: ignore
+    # Tokens of a chunk repeated at the start of the next one
+    INGESTION_CHUNK_OVERLAP: int = decouple.config("INGESTION_CHUNK_OVERLAP", default=32, cast=int)  # type: ignore
+    # Directory of the CSV, JSONL and Parquet datasets loaded without the HF hub, the uploaded files land there
+    LOCAL_DATASETS_PATH: str = decouple.config("LOCAL_DATASETS_PATH", default=UPLOAD_FILE_PATH, cast=str)  # type: ignore
+    # Chunks of documents sent to the embedding engines at once by every ingestion
+    INGESTION_EMBED_CONCURRENCY: int = decouple.config("INGESTION_EMBED_CONCURRENCY", default=4, cast=int)  # type: ignore
+    # Index of the collections created by Milvus: HNSW, IVF_FLAT or FLAT
+    MILVUS_INDEX_TYPE: str = decouple.config("MILVUS_INDEX_TYPE", default="HNSW", cast=str)  # type: ignore
+    MILVUS_HNSW_M: int = decouple.config("MILVUS_HNSW_M", default=16, cast=int)  # type: ignore
+    MILVUS_HNSW_EF_CONSTRUCTION: int = decouple.config("MILVUS_HNSW_EF_CONSTRUCTION", default=200, cast=int)  # type: ignore
+    MILVUS_HNSW_EF: int = decouple.config("MILVUS_HNSW_EF", default=64, cast=int)  # type: ignore
+    MILVUS_IVF_NLIST: int = decouple.config("MILVUS_IVF_NLIST", default=1024, cast=int)  # type: ignore
+    MILVUS_IVF_NPROBE: int = decouple.config("MILVUS_IVF_NPROBE", default=16, cast=int)  # type: ignore
+    # Bounded lets searches skip waiting for the latest inserts, the RAG collections are read-mostly
+    MILVUS_CONSISTENCY_LEVEL: str = decouple.config("MILVUS_CONSISTENCY_LEVEL", default="Bounded", cast=str)  # type: ignore
+    # Threads running the blocking Milvus searches
+    MILVUS_SEARCH_WORKERS: int = decouple.config("MILVUS_SEARCH_WORKERS", default=4, cast=int)  # type: ignore
 
     POSTGRES_HOST: str = decouple.config("POSTGRES_HOST", cast=str)  # type: ignore
     DB_MAX_POOL_CON: int = decouple.config("DB_MAX_POOL_CON", cast=int)  # type: ignore
@@ -93,6 +127,19 @@ class BackendBaseSettings(BaseSettings):
     INFERENCE_ENG: str = decouple.config("INFERENCE_ENG", cast=str)  # type: ignore
     INFERENCE_ENG_PORT: int = decouple.config("INFERENCE_ENG_PORT", cast=int)  # type: ignore
     INFERENCE_ENG_VERSION: str = decouple.config("INFERENCE_ENG_VERSION", cast=str)  # type: ignore
+    # Should be the same as the `-c` argument of llama.cpp
+    INFERENCE_ENG_CTX_SIZE: int = decouple.config("INFERENCE_ENG_CTX_SIZE", default=8192, cast=int)  # type: ignore
+    # Should be the same as the `--parallel` argument of llama.cpp, the context is split between the slots
+    INFERENCE_ENG_PARALLEL: int = decouple.config("INFERENCE_ENG_PARALLEL", default=1, cast=int)  # type: ignore
+    # Comma separated `host:port` of the llama.cpp servers, empty to only use INFERENCE_ENG:INFERENCE_ENG_PORT
+    INFERENCE_ENG_URLS: str = decouple.config("INFERENCE_ENG_URLS", default="", cast=str)  # type: ignore
+    # Generations sent to one engine at once, more requests wait in the queue of `/api/chat`. 0 for the slots of
+    # the engine read from `/props`. Only the healthy engines count
+    CHAT_MAX_IN_FLIGHT_PER_ENGINE: int = decouple.config("CHAT_MAX_IN_FLIGHT_PER_ENGINE", default=0, cast=int)  # type: ignore
+    # Requests waiting for a free engine, more requests are rejected with 429
+    CHAT_MAX_QUEUE: int = decouple.config("CHAT_MAX_QUEUE", default=32, cast=int)  # type: ignore
+    # Seconds a request waits for a free engine before it is rejected with 503
+    CHAT_MAX_QUEUE_WAIT: float = decouple.config("CHAT_MAX_QUEUE_WAIT", default=30, cast=float)  # type: ignore
 
     # Configurations for language model
     LANGUAGE_MODEL_NAME: str = decouple.config("LANGUAGE_MODEL_NAME", cast=str)  # type: ignore
@@ -113,8 +160,40 @@ class BackendBaseSettings(BaseSettings):
 
     EMBEDDING_ENG: str = decouple.config("EMBEDDING_ENG", cast=str)  # type: ignore
     EMBEDDING_ENG_PORT: int = decouple.config("EMBEDDING_ENG_PORT", cast=int)  # type: ignore
+    # Comma separated `host:port` of the embedding servers, empty to only use EMBEDDING_ENG:EMBEDDING_ENG_PORT
+    EMBEDDING_ENG_URLS: str = decouple.config("EMBEDDING_ENG_URLS", default="", cast=str)  # type: ignore
+    # Serve the answer generated for a similar question on the same collection again
+    RAG_SEMANTIC_CACHE: bool = decouple.config("RAG_SEMANTIC_CACHE", default=False, cast=bool)  # type: ignore
+    # Min cosine similarity between two questions sharing an answer
+    RAG_SEMANTIC_CACHE_THRESHOLD: float = decouple.config("RAG_SEMANTIC_CACHE_THRESHOLD", default=0.95, cast=float)  # type: ignore
+    # Passages fetched from the vector database for a question, and the min cosine similarity of those kept
+    RAG_TOP_K: int = decouple.config("RAG_TOP_K", default=RAG_NUM, cast=int)  # type: ignore
+    RAG_MIN_SIMILARITY: float = decouple.config("RAG_MIN_SIMILARITY", default=0.5, cast=float)  # type: ignore
+    # Tokens of the prompt given to the retrieved passages
+    RAG_CONTEXT_TOKENS: int = decouple.config("RAG_CONTEXT_TOKENS", default=512, cast=int)  # type: ignore
+    # Texts sent to the embedding engine in one request, and milliseconds a text waits for others to join it
+    EMBEDDING_BATCH_MAX_SIZE: int = decouple.config("EMBEDDING_BATCH_MAX_SIZE", default=32, cast=int)  # type: ignore
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = decouple.config("EMBEDDING_BATCH_MAX_WAIT_MS", default=2, cast=float)  # type: ignore
+    # Seconds a query embedding stays in the cache
+    EMBEDDING_CACHE_TTL: float = decouple.config("EMBEDDING_CACHE_TTL", default=3600, cast=float)  # type: ignore
     NUM_CPU_CORES_EMBEDDING: int = decouple.config("NUM_CPU_CORES_EMBEDDING", cast=str)  # type: ignore
 
+    # Frames of `/api/chat` arriving within this many milliseconds are written together, 0 to write every frame
+    SSE_COALESCE_WINDOW_MS: float = decouple.config("SSE_COALESCE_WINDOW_MS", default=5, cast=float)  # type: ignore
+
+    # Connection pools of the clients in `HttpxKit`, one per upstream
+    HTTP_CONNECT_TIMEOUT: float = decouple.config("HTTP_CONNECT_TIMEOUT", default=5, cast=float)  # type: ignore
+    HTTP_POOL_TIMEOUT: float = decouple.config("HTTP_POOL_TIMEOUT", default=10, cast=float)  # type: ignore
+    # Below the 5s keep-alive timeout of the llama.cpp server, so a connection is never reused while it is closed
+    HTTP_KEEPALIVE_EXPIRY: float = decouple.config("HTTP_KEEPALIVE_EXPIRY", default=4, cast=float)  # type: ignore
+    INFERENCE_HTTP_MAX_CONNECTIONS: int = decouple.config("INFERENCE_HTTP_MAX_CONNECTIONS", default=64, cast=int)  # type: ignore
+    INFERENCE_HTTP_MAX_KEEPALIVE: int = decouple.config("INFERENCE_HTTP_MAX_KEEPALIVE", default=16, cast=int)  # type: ignore
+    # Longest pause between two chunks of a completion stream, the prompt evaluation comes before the first one
+    INFERENCE_HTTP_READ_TIMEOUT: float = decouple.config("INFERENCE_HTTP_READ_TIMEOUT", default=300, cast=float)  # type: ignore
+    EMBEDDING_HTTP_MAX_CONNECTIONS: int = decouple.config("EMBEDDING_HTTP_MAX_CONNECTIONS", default=32, cast=int)  # type: ignore
+    EMBEDDING_HTTP_MAX_KEEPALIVE: int = decouple.config("EMBEDDING_HTTP_MAX_KEEPALIVE", default=16, cast=int)  # type: ignore
+    EMBEDDING_HTTP_READ_TIMEOUT: float = decouple.config("EMBEDDING_HTTP_READ_TIMEOUT", default=30, cast=float)  # type: ignore
+
     METRICS_PATHS: str = decouple.config("METRICS_PATHS", cast=str)  # type: ignore
     DEFAULT_RAG_DS_NAME: str = decouple.config("DEFAULT_RAG_DS_NAME", cast=str)  # type: ignore
 
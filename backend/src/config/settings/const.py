@@ -11,8 +11,92 @@ DEFAULT_DIM = 384
 CONVERSATION_INACTIVE_SEC = 300
 RAG_NUM = 5
 
+# PROMPT
+# Min previous messages read from the chat history for a prompt, up to PROMPT_HISTORY_PAGE - 1 more are read
+PROMPT_HISTORY_MAX_MESSAGES = 50
+# The oldest message read moves by this many messages at once, the prompt prefix stays identical in between
+PROMPT_HISTORY_PAGE = 26
+# The history window moves by multiples of this many tokens, so the prompt prefix stays cacheable
+PROMPT_WINDOW_STRIDE = 512
+# Tokens kept free for the differences between counting messages apart and together
+PROMPT_TOKEN_MARGIN = 32
+# Token counts cached per message
+TOKEN_COUNT_CACHE_SIZE = 100000
+# Concurrent requests to the `/tokenize` endpoint
+TOKENIZE_MAX_CONCURRENCY = 8
+
+# STREAMING
+# Upper bound of an unterminated SSE line from the inference engine
+SSE_MAX_BUFFER_SIZE = 1024 * 1024
+
+# DATABASE
+# Key of the Postgres advisory lock held while the migrations run at startup, one worker migrates at a time
+DB_MIGRATION_LOCK_KEY = 8260412019
+
+# CHAT HISTORY
+# Messages are truncated to the length of the `chat_history.message` column
+CHAT_MESSAGE_MAX_LENGTH = 4096
+
+# CHAT HISTORY WRITER
+# Finished turns waiting to be persisted, turns beyond it are dropped with an error log
+CHAT_HISTORY_QUEUE_SIZE = 10000
+# Max turns inserted in one transaction
+CHAT_HISTORY_BATCH_SIZE = 100
+
+# ENGINE POOL
+# Seconds before an ejected engine is probed again, doubled after every failed probe
+ENGINE_REPROBE_SECONDS = 5
+ENGINE_REPROBE_MAX_SECONDS = 60
+# Sessions remembering the engine they used last
+ENGINE_STICKY_SESSIONS = 10000
+
+# ADMISSION
+# `Retry-After` of the requests rejected by the admission control of `/api/chat`
+ADMISSION_RETRY_AFTER_SECONDS = 5
+
+# EMBEDDING
+# Query embeddings cached per worker, about 1.5KB each for 384 dimensions
+EMBEDDING_CACHE_SIZE = 10000
+
+# SEMANTIC CACHE
+# Answers kept per collection, a lookup compares the question with all of them
+SEMANTIC_CACHE_MAX_ANSWERS = 1000
+# Seconds a worker keeps the epoch of a collection before reading it again, a reload by another worker is
+# noticed after at most this long
+SEMANTIC_CACHE_EPOCH_SECONDS = 5
+# Collections whose epoch is kept
+SEMANTIC_CACHE_EPOCH_COLLECTIONS = 1024
+
+# RETRIEVAL
+# Passages whose word sets overlap this much (Jaccard) with a better passage are dropped as duplicates
+RAG_DEDUPE_SIMILARITY = 0.9
+
+# MILVUS
+# Entities read or deleted per request, Milvus caps the results of a query at 16384
+MILVUS_PAGE_SIZE = 4096
+
+# NUMPY VECTOR STORE
+# Collections smaller than this are searched by brute force even with VECTOR_STORE_IVF
+IVF_MIN_ROWS = 10000
+# Lists of the IVF index searched per query
+IVF_NPROBE = 8
+# k-means iterations when the IVF index is trained
+IVF_TRAIN_ITERATIONS = 10
+# The IVF index is retrained once this fraction of the rows were inserted after it, they are brute-forced meanwhile
+IVF_RETRAIN_GROWTH = 0.1
+
+# DOCUMENT EMBEDDING
+# Retries of the documents the embedding engines failed to embed during an ingestion
+INGESTION_EMBED_RETRIES = 3
+# Seconds before the first retry, doubled for every next one
+INGESTION_EMBED_BACKOFF = 0.5
+
 # DATASET LOADBATCH
 LOAD_BATCH_SIZE = 100
+# Batches waiting between two stages of the ingestion pipeline
+INGESTION_QUEUE_BATCHES = 2
+# Finished dataset loads whose status can still be read
+INGESTION_JOBS_KEPT = 1000
 
 # ANONYMOUS USER
 ANONYMOUS_USER = "anonymous"
@@ -56,6 +56,8 @@ class ChatHistory(Base):  # type: ignore
         sqlalchemy.Enum("user", "assistant", name="role"), nullable=False, default="user"
     )
     message: SQLAlchemyMapped[str] = sqlalchemy_mapped_column(sqlalchemy.String(length=4096), nullable=False)
+    # Tokens of the message as formatted in the prompt, counted once by the background writer
+    token_count: SQLAlchemyMapped[int] = sqlalchemy_mapped_column(sqlalchemy.Integer, nullable=True)
     created_at: SQLAlchemyMapped[datetime.datetime] = sqlalchemy_mapped_column(
         sqlalchemy.DateTime(timezone=True), nullable=False, server_default=sqlalchemy_functions.now()
     )
@@ -50,6 +50,27 @@ class RagDatasetResponse(BaseSchemaModel):
 class LoadRAGDSResponse(BaseSchemaModel):
     dataset_name: str = Field(..., title="DataSet Name", description="DataSet Name")
     status: bool = Field(default=False, title="Status", description="Status")
+    job_id: str | None = Field(default=None, title="Job ID", description="Job loading the dataset in the background")
     # created_at: datetime.datetime | None = Field(..., title="Creation time", description="Creation time")
     # updated_at: datetime.datetime | None = Field(..., title="Update  time", description="Update time")
     # ratio: Optional[float] = Field(..., title="Ratio", description="Ratio")
+
+
+class IngestionJobResponse(BaseSchemaModel):
+    job_id: str = Field(..., title="Job ID", description="Job ID")
+    dataset_name: str = Field(..., title="DataSet Name", description="DataSet Name")
+    status: str = Field(..., title="Status", description="pending, running, succeeded or failed")
+    rows_read: int = Field(..., title="Rows read", description="Rows read from the dataset")
+    rows_embedded: int = Field(..., title="Rows embedded", description="Rows embedded by the backend")
+    rows_inserted: int = Field(..., title="Rows inserted", description="Rows inserted into the vector database")
+    rows_unchanged: int = Field(default=0, title="Rows unchanged", description="Rows already loaded, kept as is")
+    rows_duplicate: int = Field(default=0, title="Rows duplicate", description="Rows repeating an earlier row")
+    rows_deleted: int = Field(default=0, title="Rows deleted", description="Rows removed or changed")
+    rows_per_second: float = Field(..., title="Throughput", description="Rows inserted per second")
+    elapsed_seconds: float = Field(..., title="Elapsed", description="Seconds since the job started")
+    embedding_model: str | None = Field(default=None, title="Embedding model", description="Model of the vectors")
+    embedding_dim: int | None = Field(default=None, title="Embedding dimension", description="Dimension of the vectors")
+    stages: dict[str, dict[str, float]] = Field(
+        default={}, title="Stages", description="Rows, seconds and rows per second of every pipeline stage"
+    )
+    error: str | None = Field(default=None, title="Error", description="Why the job failed")
@@ -0,0 +1,38 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pydantic import Field
+
+from src.models.schemas.base import BaseSchemaModel
+
+
+class HistogramSnapshot(BaseSchemaModel):
+    count: int = Field(..., title="Count", description="Number of observations")
+    sum: float = Field(..., title="Sum", description="Sum of the observations")
+    buckets: dict[str, int] = Field(..., title="Buckets", description="Cumulative count per upper bound")
+
+
+class MetricsResponse(BaseSchemaModel):
+    """
+    The in-process metrics of the worker which served the request
+
+    - **counters**: monotonically increasing values
+    - **gauges**: current values
+    - **histograms**: distributions of observed values
+    """
+
+    counters: dict[str, float] = Field(..., title="Counters", description="Counters")
+    gauges: dict[str, float] = Field(..., title="Gauges", description="Gauges")
+    histograms: dict[str, HistogramSnapshot] = Field(..., title="Histograms", description="Histograms")
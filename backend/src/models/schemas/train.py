@@ -14,3 +14,4 @@ class TrainFileIn(BaseSchemaModel):
 class TrainFileInResponse(BaseSchemaModel):
     trainID: int | None = Field(..., title="TrainID", description="trainID")
     msg: str = Field(..., title="Message", description="Message")
+    job_id: str | None = Field(default=None, title="Job ID", description="Job loading the data in the background")
@@ -0,0 +1,175 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import collections
+import time
+import typing
+
+import loguru
+
+from src.config.manager import settings
+from src.config.settings.const import ADMISSION_RETRY_AFTER_SECONDS
+from src.repository.engine_pool import EnginePool, inference_pool
+from src.utilities.metrics.registry import metrics
+
+
+class AdmissionRejected(Exception):
+    """
+    The request can't be served now
+
+    Attributes:
+    -----------
+    queue_full: bool
+        True if the wait queue was full, False if the request waited too long
+    retry_after: int
+        Seconds the client should wait before retrying
+    """
+
+    def __init__(self, queue_full: bool, retry_after: int = ADMISSION_RETRY_AFTER_SECONDS):
+        super().__init__("wait queue is full" if queue_full else "waited too long for a free engine")
+        self.queue_full = queue_full
+        self.retry_after = retry_after
+
+
+class AdmissionLease:
+    """
+    A running generation, `release` can be called more than once
+    """
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._controller._release()
+
+
+def engine_capacity(pool: EnginePool = inference_pool, per_engine: int = settings.CHAT_MAX_IN_FLIGHT_PER_ENGINE) -> int:
+    """
+    Generations the healthy engines of the pool can run at once
+
+    The pool sends every generation to its least loaded engine, so with at most `per_engine` generations per
+    healthy engine admitted, none of them runs more than `per_engine`. With `per_engine` 0, it is the number of
+    slots of the engines, read from `/props`, the smallest one if they differ.
+    """
+    healthy = [backend for backend in pool.backends if backend.healthy] or pool.backends
+    if per_engine <= 0:
+        per_engine = min(backend.slots.n_slots for backend in healthy)
+    return per_engine * len(healthy)
+
+
+class AdmissionController:
+    """
+    Limit the generations running on the inference engines
+
+    Up to `max_in_flight` requests run at once, the next `max_queue` ones wait in arrival order and are admitted
+    one by one as running generations finish. Requests beyond the queue are rejected at once and requests that
+    waited longer than `max_wait` seconds give up, so the engines never queue more work than they can finish
+    in a predictable time. `max_in_flight` can be a function, read again on every admission, e.g. to follow
+    the engines ejected from the pool.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int | typing.Callable[[], int],
+        max_queue: int,
+        max_wait: float,
+        name: str = "chat",
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._in_flight = 0
+        self._waiters: collections.deque[asyncio.Future] = collections.deque()
+        self._in_flight_gauge = metrics.gauge(f"{name}_in_flight", "Generations running on the engines")
+        self._queued_gauge = metrics.gauge(f"{name}_queued", "Requests waiting for a free engine")
+        self._wait_seconds = metrics.histogram(f"{name}_queue_wait_seconds", "Time spent in the wait queue")
+        self._rejected_full = metrics.counter(f"{name}_rejected_queue_full", "Requests rejected, queue was full")
+        self._rejected_timeout = metrics.counter(f"{name}_rejected_timeout", "Requests which waited too long")
+
+    @property
+    def limit(self) -> int:
+        return self.max_in_flight() if callable(self.max_in_flight) else self.max_in_flight
+
+    async def acquire(self) -> AdmissionLease:
+        """
+        Wait for a free place on the engines
+
+        Returns:
+        AdmissionLease: release it when the generation is finished
+
+        Raises:
+        AdmissionRejected: the queue is full or the request waited longer than `max_wait`
+        """
+        # The limit may have grown since the waiters were queued
+        self._admit_waiters()
+        if self._in_flight < self.limit and not self._waiters:
+            self._admit()
+            self._wait_seconds.observe(0)
+            return AdmissionLease(self)
+
+        if len(self._waiters) >= self.max_queue:
+            self._rejected_full.inc()
+            raise AdmissionRejected(queue_full=True)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._queued_gauge.inc()
+        start = time.perf_counter()
+        try:
+            # The place is handed over by `_admit_waiters`, `_in_flight` already counts us
+            await asyncio.wait_for(waiter, timeout=self.max_wait)
+        except TimeoutError:
+            self._rejected_timeout.inc()
+            loguru.logger.warning(f"Admission --- Rejected after waiting {self.max_wait}s for a free engine")
+            raise AdmissionRejected(queue_full=False) from None
+        except asyncio.CancelledError:
+            # The client went away, give the place to the next one if it was already handed over
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._queued_gauge.dec()
+            self._wait_seconds.observe(time.perf_counter() - start)
+        return AdmissionLease(self)
+
+    def _admit(self) -> None:
+        self._in_flight += 1
+        self._in_flight_gauge.inc()
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._in_flight_gauge.dec()
+        self._admit_waiters()
+
+    def _admit_waiters(self) -> None:
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            self._queued_gauge.dec()
+            if not waiter.done():
+                self._admit()
+                waiter.set_result(None)
+
+
+chat_admission: AdmissionController = AdmissionController(
+    max_in_flight=engine_capacity,
+    max_queue=settings.CHAT_MAX_QUEUE,
+    max_wait=settings.CHAT_MAX_QUEUE_WAIT,
+)
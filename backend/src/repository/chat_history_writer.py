@@ -0,0 +1,141 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import contextlib
+from collections.abc import AsyncGenerator
+
+import loguru
+
+from src.config.settings.const import CHAT_HISTORY_BATCH_SIZE, CHAT_HISTORY_QUEUE_SIZE, CHAT_MESSAGE_MAX_LENGTH
+from src.repository.crud.chat import ChatHistoryCRUDRepository
+from src.repository.database import async_db
+from src.repository.rag.prompt import format_message
+from src.repository.tokenizer import token_counter
+from src.utilities.httpkit.sse_kit import CompletionEvent, CompletionSummary
+
+
+class ChatHistoryWriter:
+    """
+    Persist finished chat turns in the background
+
+    The chat route hands every finished turn (user message + streamed answer) to an in-memory queue, a single
+    worker task drains it, counts the tokens of every message and bulk-inserts the rows through
+    `ChatHistoryCRUDRepository`. The token stream never waits for the database or the tokenizer.
+    """
+
+    def __init__(self, queue_size: int = CHAT_HISTORY_QUEUE_SIZE, batch_size: int = CHAT_HISTORY_BATCH_SIZE):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self._queue: asyncio.Queue[list[dict]] | None = None
+        self._worker: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """
+        Start the worker, must be called inside the running event loop
+        """
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._worker = asyncio.create_task(self._run(), name="chat-history-writer")
+
+    async def stop(self) -> None:
+        """
+        Flush the pending turns and stop the worker
+        """
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    def submit(self, session_id: int, user_message: str, assistant_message: str) -> bool:
+        """
+        Queue a finished turn without waiting
+
+        Returns:
+        bool: False if the turn was dropped because the writer isn't running or the queue is full
+        """
+        if self._queue is None:
+            loguru.logger.error("Chat History Writer --- Not started, dropping turn")
+            return False
+        rows = [
+            {"session_id": session_id, "role": "user", "message": user_message[:CHAT_MESSAGE_MAX_LENGTH]},
+            {"session_id": session_id, "role": "assistant", "message": assistant_message[:CHAT_MESSAGE_MAX_LENGTH]},
+        ]
+        try:
+            self._queue.put_nowait(rows)
+        except asyncio.QueueFull:
+            loguru.logger.error(f"Chat History Writer --- Queue is full, dropping turn of session {session_id}")
+            return False
+        return True
+
+    async def record(
+        self, events: AsyncGenerator[CompletionEvent, None], session_id: int, user_message: str
+    ) -> AsyncGenerator[CompletionEvent, None]:
+        """
+        Pass the completion events through and queue the turn once the stream ends
+
+        Args:
+        events (AsyncGenerator[CompletionEvent, None]): events from `RAGChatModelRepository`
+        session_id (int): session id
+        user_message (str): the message of the user
+
+        Returns:
+        AsyncGenerator[CompletionEvent, None]: the same events
+        """
+        summary = CompletionSummary()
+        try:
+            async with contextlib.aclosing(events):
+                async for event in events:
+                    summary.add(event)
+                    yield event
+        finally:
+            # The answer is saved even if the client went away in the middle
+            if summary.text:
+                self.submit(session_id=session_id, user_message=user_message, assistant_message=summary.text)
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                await self._write([row for turn in batch for row in turn])
+            except Exception as e:
+                loguru.logger.error(f"Chat History Writer --- Failed to save {len(batch)} turns: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, rows: list[dict]) -> None:
+        # Count once here, so building the prompt of the next turns needs no request to the tokenizer
+        token_counts = await token_counter.count_many(
+            [format_message(row["role"], row["message"]) for row in rows], fallback=False
+        )
+        for row, token_count in zip(rows, token_counts):
+            row["token_count"] = token_count
+
+        async with async_db.async_session_maker() as async_session:
+            chat_repo = ChatHistoryCRUDRepository(async_session=async_session)
+            await chat_repo.bulk_create_chat_history(chat_histories=rows)
+
+
+chat_history_writer: ChatHistoryWriter = ChatHistoryWriter()
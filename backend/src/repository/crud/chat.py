@@ -18,6 +18,7 @@ from typing import Optional
 import loguru
 import sqlalchemy
 from sqlalchemy.sql import functions as sqlalchemy_functions
+from src.config.settings.const import CHAT_MESSAGE_MAX_LENGTH
 from src.models.db.chat import ChatHistory, Session
 from src.models.schemas.chat import SessionUpdate, Chats
 from src.repository.crud.base import BaseCRUDRepository
@@ -160,18 +161,68 @@ class ChatHistoryCRUDRepository(BaseCRUDRepository):
         stmt = (
             sqlalchemy.select(ChatHistory)
             .where(ChatHistory.session_id == id)
-            .order_by(ChatHistory.created_at.asc())
+            # rows of the same turn share the transaction timestamp, the id keeps their order
+            .order_by(ChatHistory.created_at.asc(), ChatHistory.id.asc())
             .limit(limit_num)
         )
         query = await self.async_session.execute(statement=stmt)
         return query.scalars().all()  # type: ignore
 
+    async def count_chat_history_by_session_id(self, id: int) -> int:
+        stmt = (
+            sqlalchemy.select(sqlalchemy_functions.count()).select_from(ChatHistory).where(ChatHistory.session_id == id)
+        )
+        query = await self.async_session.execute(statement=stmt)
+        return query.scalar_one()
+
+    async def read_chat_history_from_offset_by_session_id(self, id: int, offset: int) -> typing.Sequence[ChatHistory]:
+        """
+        Read the messages of the session after the first `offset` ones
+
+        Args:
+            id (int): Session ID
+            offset (int): number of oldest messages skipped
+
+        Returns:
+            typing.Sequence[ChatHistory]: messages, oldest first
+        """
+        stmt = (
+            sqlalchemy.select(ChatHistory)
+            .where(ChatHistory.session_id == id)
+            .order_by(ChatHistory.created_at, ChatHistory.id)
+            .offset(offset)
+        )
+        query = await self.async_session.execute(statement=stmt)
+        return query.scalars().all()
+
     async def load_create_chat_history(self, session_id: int, chats: list[Chats]):
         try:
             for chat in chats:
-                new_chat_history = ChatHistory(session_id=session_id, role=chat.role, message=chat.message[:4096])
+                new_chat_history = ChatHistory(
+                    session_id=session_id, role=chat.role, message=chat.message[:CHAT_MESSAGE_MAX_LENGTH]
+                )
                 self.async_session.add(instance=new_chat_history)
             await self.async_session.commit()
         except Exception as e:
             await self.async_session.rollback()
             loguru.logger.error(f"Error: {e}")
+
+    async def bulk_create_chat_history(self, chat_histories: list[dict]) -> int:
+        """
+        Insert many chat history rows with a single executemany statement
+
+        Args:
+            chat_histories (list[dict]): rows with `session_id`, `role`, `message` and optionally `token_count`
+
+        Returns:
+            int: number of inserted rows
+        """
+        if not chat_histories:
+            return 0
+        rows = [
+            {"token_count": None, **chat, "message": chat["message"][:CHAT_MESSAGE_MAX_LENGTH]}
+            for chat in chat_histories
+        ]
+        await self.async_session.execute(sqlalchemy.insert(ChatHistory), rows)
+        await self.async_session.commit()
+        return len(rows)
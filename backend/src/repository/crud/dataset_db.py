@@ -17,7 +17,10 @@ from src.repository.crud.base import BaseCRUDRepository
 from src.models.schemas.dataset import DatasetCreate
 from src.models.db.dataset import DataSet
 import sqlalchemy
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.sql import functions as sqlalchemy_functions
 
+import datetime
 import typing
 
 
@@ -31,11 +34,46 @@ class DataSetCRUDRepository(BaseCRUDRepository):
 
         return new_dataset
 
+    async def record_dataset_embedding(
+        self, dataset_name: str, account_id: int | None, embedding_model: str | None, embedding_dim: int | None
+    ) -> None:
+        """
+        Record which embedding model and dimension produced the collection of the dataset
+
+        The dataset is created if it wasn't loaded before, a reload overwrites the previous model. `updated_at` is
+        set either way, it versions the answers cached for the collection.
+        """
+        stmt = postgresql_insert(DataSet).values(
+            name=dataset_name,
+            account_id=account_id,
+            embedding_model=embedding_model,
+            embedding_dim=embedding_dim,
+            updated_at=sqlalchemy_functions.now(),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DataSet.name],
+            set_={
+                "embedding_model": stmt.excluded.embedding_model,
+                "embedding_dim": stmt.excluded.embedding_dim,
+                "updated_at": sqlalchemy_functions.now(),
+            },
+        )
+        await self.async_session.execute(statement=stmt)
+        await self.async_session.commit()
+
     async def get_dataset_by_name(self, dataset_name: str) -> typing.Sequence[DataSet]:
         stmt = sqlalchemy.select(DataSet).where(DataSet.name == dataset_name)
         query = await self.async_session.execute(statement=stmt)
         return query.scalars().all()
 
+    async def get_dataset_updated_at(self, dataset_name: str) -> datetime.datetime | None:
+        """
+        When the dataset was last loaded, None if it never was
+        """
+        stmt = sqlalchemy.select(DataSet.updated_at).where(DataSet.name == dataset_name)
+        query = await self.async_session.execute(statement=stmt)
+        return query.scalar_one_or_none()
+
     async def get_dataset_list(self) -> typing.Sequence[DataSet]:
         stmt = sqlalchemy.select(DataSet).order_by(DataSet.updated_at.desc())
         query = await self.async_session.execute(statement=stmt)
@@ -0,0 +1,177 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import pathlib
+from collections.abc import Iterator
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from datasets import load_dataset
+
+from src.config.manager import settings
+from src.repository.ingestion_pipeline import Batch, iter_batches
+from src.utilities.formatters.ds_formatter import DatasetFormatter
+
+LOCAL_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet"}
+
+
+def is_local_source(name: str) -> bool:
+    """
+    Names ending with `.csv`, `.jsonl` or `.parquet` are files under `LOCAL_DATASETS_PATH`, the others are
+    datasets of the HF hub
+    """
+    return pathlib.PurePath(name).suffix.lower() in LOCAL_FORMATS
+
+
+def collection_name(name: str) -> str:
+    """
+    Name of the collection the dataset is loaded into, the collections of the HF hub datasets keep their "."
+    """
+    if is_local_source(name):
+        return DatasetFormatter.format_file_dataset_by_name(name)
+    return DatasetFormatter.format_dataset_by_name(name)
+
+
+def resolve_local_source(name: str, root: str | None = None) -> pathlib.Path:
+    """
+    Path of a local dataset, it must stay under `root` whatever the name, e.g. `../../etc/passwd.csv`
+
+    Raises:
+    FileNotFoundError: if the file doesn't exist or is outside of `root`
+    """
+    root_path = pathlib.Path(root or settings.LOCAL_DATASETS_PATH).resolve()
+    path = (root_path / name).resolve()
+    if not path.is_relative_to(root_path) or not path.is_file():
+        raise FileNotFoundError(f"No dataset file {name} under {root_path}")
+    return path
+
+
+class DatasetSource:
+    """
+    Rows of a dataset read in batches, so the memory doesn't grow with the dataset
+
+    Attributes:
+    -----------
+    name: str
+        Name the dataset was requested with
+    column_names: list[str]
+        Columns of every row
+    """
+
+    name: str
+    column_names: list[str]
+
+    def iter_batches(self, batch_size: int) -> Iterator[Batch]:
+        raise NotImplementedError
+
+
+class HubSource(DatasetSource):
+    """
+    Dataset of the HF hub, downloaded once then memory-mapped by HF datasets
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        # TODO: validation isn't make sense, it should be removed
+        self.dataset = load_dataset(name, split="validation")
+        self.column_names = list(self.dataset.column_names)
+
+    def iter_batches(self, batch_size: int) -> Iterator[Batch]:
+        for columns in self.dataset.iter(batch_size=batch_size):
+            yield [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+class ParquetSource(DatasetSource):
+    """
+    Parquet file, memory-mapped and decoded one record batch at a time
+    """
+
+    def __init__(self, name: str, path: pathlib.Path):
+        self.name = name
+        self.path = path
+        self.column_names = pq.ParquetFile(path, memory_map=True).schema_arrow.names
+
+    def iter_batches(self, batch_size: int) -> Iterator[Batch]:
+        parquet_file = pq.ParquetFile(self.path, memory_map=True)
+        for record_batch in parquet_file.iter_batches(batch_size=batch_size):
+            yield record_batch.to_pylist()
+
+
+class CSVSource(DatasetSource):
+    """
+    CSV file with a header line, memory-mapped and parsed by the streaming reader of Arrow
+
+    Every column is read as text, the types Arrow infers from the first block may not hold for the next ones.
+    """
+
+    def __init__(self, name: str, path: pathlib.Path):
+        self.name = name
+        self.path = path
+        with pa_csv.open_csv(pa.memory_map(str(path))) as reader:
+            self.column_names = reader.schema.names
+
+    def iter_batches(self, batch_size: int) -> Iterator[Batch]:
+        convert_options = pa_csv.ConvertOptions(column_types={name: pa.string() for name in self.column_names})
+        with pa_csv.open_csv(pa.memory_map(str(self.path)), convert_options=convert_options) as reader:
+            rows = (row for record_batch in reader for row in record_batch.to_pylist())
+            yield from iter_batches(rows, batch_size)
+
+
+class JSONLSource(DatasetSource):
+    """
+    File of one JSON object per line, read line by line
+
+    The columns are the keys of the first object.
+    """
+
+    def __init__(self, name: str, path: pathlib.Path):
+        self.name = name
+        self.path = path
+        first = next(self._rows(), {})
+        self.column_names = list(first)
+
+    def _rows(self) -> Iterator[dict]:
+        with self.path.open(encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_batches(self, batch_size: int) -> Iterator[Batch]:
+        yield from iter_batches(self._rows(), batch_size)
+
+
+def open_dataset_source(name: str) -> DatasetSource:
+    """
+    Open a dataset of the HF hub or a CSV, JSONL or Parquet file under `LOCAL_DATASETS_PATH`
+
+    Args:
+    name (str): name on the hub, e.g. `aisuko/squad01`, or file name, e.g. `faq.parquet`
+
+    Returns:
+    DatasetSource: the rows of the dataset
+    """
+    if not is_local_source(name):
+        return HubSource(name)
+
+    path = resolve_local_source(name)
+    match LOCAL_FORMATS[path.suffix.lower()]:
+        case "parquet":
+            return ParquetSource(name, path)
+        case "csv":
+            return CSVSource(name, path)
+        case _:
+            return JSONLSource(name, path)
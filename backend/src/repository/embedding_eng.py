@@ -0,0 +1,375 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import hashlib
+import time
+import typing
+import unicodedata
+from collections.abc import Sequence
+
+import httpx
+import loguru
+import numpy as np
+
+from src.config.manager import settings
+from src.config.settings.const import EMBEDDING_CACHE_SIZE, INGESTION_EMBED_BACKOFF, INGESTION_EMBED_RETRIES
+from src.repository.engine_pool import EnginePool, embedding_pool
+from src.utilities.cache.lru_cache import LRUCache
+from src.utilities.httpkit.httpx_kit import UPSTREAM_EMBEDDING, httpx_kit
+from src.utilities.metrics.registry import metrics
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+# Statuses of an engine that doesn't accept a list of texts, other errors don't say anything about batching
+BATCH_UNSUPPORTED_STATUSES = frozenset({400, 415, 422, 501})
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a question before it is hashed, so trivially different spellings share a cache entry
+
+    Unicode compatibility forms are folded, the case is folded and whitespace is collapsed.
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+class SharedEmbeddingStore:
+    """
+    Cache shared between the workers, behind the in-process cache of `EmbeddingClient`
+
+    The base class stores nothing. A subclass backed by e.g. Redis or memcached implements `get` and `put` with the
+    raw float32 bytes of the vectors, so every worker benefits from the embeddings computed by the others.
+    """
+
+    async def get(self, key: str) -> bytes | None:
+        return None
+
+    async def put(self, key: str, value: bytes, ttl: float) -> None:
+        return None
+
+
+class EmbeddingCountMismatch(ValueError):
+    """
+    The engine answered a different number of vectors than texts, e.g. one pooled vector for a whole batch
+    """
+
+
+def parse_embedding_response(payload: typing.Any, n_texts: int) -> list[np.ndarray]:
+    """
+    Read the vectors of an `/embedding` response, in the order of the texts
+
+    Depending on its version, llama.cpp answers `{"embedding": [...]}` for a single text, and
+    `{"results": [{"embedding": [...]}, ...]}` or `[{"index": 0, "embedding": [...]}, ...]` for a batch.
+
+    Raises:
+    ValueError: the response can't be read
+    EmbeddingCountMismatch: the response doesn't hold one vector per text
+    """
+    if isinstance(payload, dict) and "results" in payload:
+        items = payload["results"]
+    elif isinstance(payload, dict) and "embedding" in payload:
+        items = [payload]
+    elif isinstance(payload, list):
+        items = sorted(payload, key=lambda item: item.get("index", 0))
+    else:
+        raise ValueError("Unknown embedding response")
+
+    vectors = []
+    for item in items:
+        embedding = item["embedding"]
+        # Newer servers nest the pooled vector in a list
+        if embedding and isinstance(embedding[0], list):
+            embedding = embedding[0]
+        vectors.append(np.asarray(embedding, dtype=np.float32))
+    if len(vectors) != n_texts:
+        raise EmbeddingCountMismatch(f"Expected {n_texts} embeddings, got {len(vectors)}")
+    return vectors
+
+
+class EmbeddingBatcher:
+    """
+    Coalesce the texts to embed into batched requests to the embedding engines
+
+    Texts arriving within `max_wait` seconds of the first pending one are sent as one request of up to
+    `max_batch_size` texts, which llama.cpp embeds in one pass, and the vectors are handed back to each caller.
+    If the engine rejects batches, texts are sent one by one from then on.
+
+    Attributes:
+    -----------
+    max_batch_size: int
+        Max number of texts in one request
+    max_wait: float
+        Seconds the first text of a batch waits for others to join it
+    batch_supported: bool
+        False once the engine rejected a batch
+    """
+
+    def __init__(
+        self,
+        pool: EnginePool = embedding_pool,
+        max_batch_size: int = settings.EMBEDDING_BATCH_MAX_SIZE,
+        max_wait: float = settings.EMBEDDING_BATCH_MAX_WAIT_MS / 1000,
+    ):
+        self.pool = pool
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batch_supported = True
+        self._pending: list[tuple[str, asyncio.Future, float]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._requests: set[asyncio.Task] = set()
+        self._batch_size = metrics.histogram("embedding_batch_size", "Texts per embedding request", BATCH_BUCKETS)
+        self._request_seconds = metrics.histogram("embedding_request_seconds", "Duration of the embedding requests")
+        self._wait_seconds = metrics.histogram("embedding_wait_seconds", "Time from queuing a text to its vector")
+
+    async def embed(self, text: str) -> np.ndarray | None:
+        """
+        Embed the text as part of the next batch
+
+        Returns:
+        np.ndarray | None: float32 vector, None if the engine can't be reached
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch, self._pending = self._pending[: self.max_batch_size], self._pending[self.max_batch_size :]
+            request = asyncio.ensure_future(self._send(batch))
+            self._requests.add(request)
+            request.add_done_callback(self._requests.discard)
+
+    async def _send(self, batch: list[tuple[str, asyncio.Future, float]]) -> None:
+        # The same text queued by several callers is embedded once
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        self._batch_size.observe(len(texts))
+        started = time.perf_counter()
+        try:
+            vectors = dict(zip(texts, await self._embed_texts(texts)))
+        except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+            loguru.logger.error(f"Embedding --- Failed to embed {len(texts)} texts: {e!r}")
+            vectors = {}
+        done = time.perf_counter()
+        self._request_seconds.observe(done - started)
+
+        for text, future, queued in batch:
+            # The caller may have been cancelled meanwhile
+            if not future.done():
+                future.set_result(vectors.get(text))
+                self._wait_seconds.observe(done - queued)
+
+    async def _embed_texts(self, texts: list[str]) -> list[np.ndarray]:
+        if len(texts) > 1 and self.batch_supported:
+            try:
+                return await self._post(texts)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in BATCH_UNSUPPORTED_STATUSES:
+                    raise
+                loguru.logger.warning(
+                    f"Embedding --- Batch rejected ({e.response.status_code}), sending texts one by one"
+                )
+                self.batch_supported = False
+            except EmbeddingCountMismatch as e:
+                # The list was read as a single content
+                loguru.logger.warning(f"Embedding --- Batch answered with {e}, sending texts one by one")
+                self.batch_supported = False
+        results = await asyncio.gather(*(self._post([text]) for text in texts))
+        return [vectors[0] for vectors in results]
+
+    async def _post(self, texts: list[str]) -> list[np.ndarray]:
+        backend = self.pool.select()
+        try:
+            with self.pool.lease(backend):
+                res = await httpx_kit.client(UPSTREAM_EMBEDDING).post(
+                    backend.embedding_url,
+                    headers={"Content-Type": "application/json"},
+                    json={"content": texts if len(texts) > 1 else texts[0]},
+                )
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            self.pool.mark_failure(backend, e)
+            raise
+        res.raise_for_status()
+        return parse_embedding_response(res.json(), len(texts))
+
+
+class EmbeddingClient:
+    """
+    Embed texts with the `/embedding` endpoint of the embedding engines
+
+    Vectors are cached as read-only float32 arrays, keyed by the embedding model and the hash of the normalized
+    text. The in-process cache is size-bounded (LRU) and entries expire after `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        pool: EnginePool = embedding_pool,
+        model: str = settings.EMBEDDING_MODEL_NAME,
+        cache_size: int = EMBEDDING_CACHE_SIZE,
+        ttl: float = settings.EMBEDDING_CACHE_TTL,
+        shared: SharedEmbeddingStore | None = None,
+    ):
+        self.pool = pool
+        self.model = model
+        self.ttl = ttl
+        self.cache = LRUCache(maxsize=cache_size, ttl=ttl)
+        self.batcher = EmbeddingBatcher(pool=pool)
+        self.shared = shared or SharedEmbeddingStore()
+        self._hits = metrics.counter("embedding_cache_hits", "Embeddings served from the cache")
+        self._misses = metrics.counter("embedding_cache_misses", "Embeddings requested from the engine")
+
+    def cache_key(self, text: str) -> str:
+        digest = hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+        return f"{self.model}:{digest}"
+
+    async def embed(self, text: str) -> np.ndarray | None:
+        """
+        Get the embedding of the text
+
+        Args:
+        text (str): text to embed
+
+        Returns:
+        np.ndarray | None: read-only float32 vector, None if the engine can't be reached
+        """
+        key = self.cache_key(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            data = await self.shared.get(key)
+            if data is not None:
+                vector = self._from_bytes(data)
+                self.cache.put(key, vector)
+        if vector is not None:
+            self._hits.inc()
+            return vector
+
+        self._misses.inc()
+        vector = await self.request(text)
+        if vector is None:
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        self.cache.put(key, vector)
+        await self.shared.put(key, vector.tobytes(), ttl=self.ttl)
+        return vector
+
+    async def embed_many(self, texts: Sequence[str], use_cache: bool = True) -> list[np.ndarray | None]:
+        """
+        Get the embeddings of many texts, e.g. the rows of a dataset, the cache misses are sent in batches
+
+        Args:
+        texts (Sequence[str]): texts to embed
+        use_cache (bool): False for documents, they are embedded once and would evict the cached questions
+
+        Returns:
+        list[np.ndarray | None]: vector of every text, None for those that couldn't be embedded
+        """
+        embed = self.embed if use_cache else self.request
+        return list(await asyncio.gather(*(embed(text) for text in texts)))
+
+    async def request(self, text: str) -> np.ndarray | None:
+        """
+        Embed the text with the least loaded embedding engine, without the cache
+
+        Concurrent requests are coalesced into batches, see `EmbeddingBatcher`.
+        """
+        return await self.batcher.embed(text)
+
+    @staticmethod
+    def _from_bytes(data: bytes) -> np.ndarray:
+        # `frombuffer` over immutable bytes is already read-only
+        return np.frombuffer(data, dtype=np.float32)
+
+
+embedding_client: EmbeddingClient = EmbeddingClient()
+
+
+class EmbeddingFailed(Exception):
+    """
+    Some texts still had no embedding after all the retries
+    """
+
+
+class DocumentEmbedder:
+    """
+    Embed the documents of a dataset with the same engines and model as the questions
+
+    The texts are split into chunks of `chunk_size`, at most `concurrency` chunks are in flight at once so the
+    ingestion doesn't starve the chat requests of embedding engines. Texts the engines failed to embed, e.g. an
+    engine restarting, are retried `retries` times with an exponential backoff.
+    """
+
+    def __init__(
+        self,
+        client: EmbeddingClient = embedding_client,
+        concurrency: int = settings.INGESTION_EMBED_CONCURRENCY,
+        retries: int = INGESTION_EMBED_RETRIES,
+        chunk_size: int = settings.EMBEDDING_BATCH_MAX_SIZE,
+        backoff: float = INGESTION_EMBED_BACKOFF,
+    ):
+        self.client = client
+        self.concurrency = max(concurrency, 1)
+        self.retries = retries
+        self.chunk_size = max(chunk_size, 1)
+        self.backoff = backoff
+        self._retried = metrics.counter("ingestion_embedding_retries", "Document embeddings retried")
+
+    @property
+    def model(self) -> str:
+        return self.client.model
+
+    async def embed(self, texts: Sequence[str]) -> list[np.ndarray]:
+        """
+        Embed the texts
+
+        Args:
+        texts (Sequence[str]): documents to embed
+
+        Returns:
+        list[np.ndarray]: vector of every text, in order
+
+        Raises:
+        EmbeddingFailed: if a text couldn't be embedded after the retries
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        chunks = [texts[start : start + self.chunk_size] for start in range(0, len(texts), self.chunk_size)]
+        results = await asyncio.gather(*(self._embed_chunk(chunk, semaphore) for chunk in chunks))
+        return [vector for chunk in results for vector in chunk]
+
+    async def _embed_chunk(self, texts: Sequence[str], semaphore: asyncio.Semaphore) -> list[np.ndarray]:
+        vectors: list[np.ndarray | None] = [None] * len(texts)
+        missing = list(range(len(texts)))
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self._retried.inc(len(missing))
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                results = await self.client.embed_many([texts[i] for i in missing], use_cache=False)
+                for i, vector in zip(missing, results):
+                    vectors[i] = vector
+                missing = [i for i in missing if vectors[i] is None]
+                if not missing:
+                    return typing.cast(list[np.ndarray], vectors)
+        raise EmbeddingFailed(f"{len(missing)} of {len(texts)} texts couldn't be embedded after {self.retries} retries")
+
+
+document_embedder: DocumentEmbedder = DocumentEmbedder()
@@ -0,0 +1,186 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import contextlib
+from collections.abc import Iterator
+
+import httpx
+import loguru
+
+from src.config.manager import settings
+from src.config.settings.const import ENGINE_REPROBE_MAX_SECONDS, ENGINE_REPROBE_SECONDS, ENGINE_STICKY_SESSIONS
+from src.repository.slot_allocator import SlotAllocator
+from src.utilities.cache.lru_cache import LRUCache
+from src.utilities.httpkit.httpx_kit import UPSTREAM_EMBEDDING, UPSTREAM_INFERENCE, httpx_kit
+from src.utilities.metrics.registry import metrics
+
+
+def parse_engine_urls(urls: str, default_host: str, default_port: int) -> list[str]:
+    """
+    Parse a comma separated list of `host:port` into base URLs
+
+    Args:
+    urls (str): e.g. `llamacpp-1:8080,llamacpp-2:8080`, empty to use the default engine
+    default_host (str): host of the default engine
+    default_port (int): port of the default engine
+
+    Returns:
+    list[str]: base URLs, e.g. `http://llamacpp-1:8080`
+    """
+    hosts = [url.strip().rstrip("/") for url in urls.split(",") if url.strip()] or [f"{default_host}:{default_port}"]
+    return [host if host.startswith(("http://", "https://")) else f"http://{host}" for host in hosts]
+
+
+class EngineBackend:
+    """
+    One llama.cpp server of the pool
+
+    Attributes:
+    -----------
+    base_url: str
+        e.g. `http://llamacpp:8080`
+    in_flight: int
+        Number of requests currently sent to the server
+    healthy: bool
+        False after a connection error, until the server answers `/health` again
+    slots: SlotAllocator
+        Session to slot mapping of the server
+    """
+
+    def __init__(self, base_url: str, n_slots: int = settings.INFERENCE_ENG_PARALLEL):
+        self.base_url = base_url
+        self.in_flight = 0
+        self.healthy = True
+        self.slots = SlotAllocator(n_slots=n_slots)
+        self._in_flight_gauge = metrics.gauge(f"engine_in_flight:{base_url}", "Requests sent to the engine")
+
+    @property
+    def completion_url(self) -> str:
+        return f"{self.base_url}/completion"
+
+    @property
+    def embedding_url(self) -> str:
+        return f"{self.base_url}/embedding"
+
+    @property
+    def tokenize_url(self) -> str:
+        return f"{self.base_url}/tokenize"
+
+    @property
+    def props_url(self) -> str:
+        return f"{self.base_url}/props"
+
+    @property
+    def health_url(self) -> str:
+        return f"{self.base_url}/health"
+
+    def __repr__(self) -> str:
+        return f"EngineBackend({self.base_url}, in_flight={self.in_flight}, healthy={self.healthy})"
+
+
+class EnginePool:
+    """
+    Route requests to the llama.cpp server with the fewest requests in flight
+
+    A server is ejected when a connection to it fails and probed on `/health` in the background until it is back.
+    When several servers are equally loaded, a session goes back to the server it used last, where its prompt
+    is cached. If every server is ejected, requests are still sent to all of them rather than failing.
+    """
+
+    def __init__(self, base_urls: list[str], name: str, n_slots: int = settings.INFERENCE_ENG_PARALLEL):
+        # `name` is also the upstream of the client in `httpx_kit`
+        if not base_urls:
+            raise ValueError("EnginePool needs at least one engine")
+        self.name = name
+        self.backends = [EngineBackend(base_url=base_url, n_slots=n_slots) for base_url in base_urls]
+        self._sessions = LRUCache(maxsize=ENGINE_STICKY_SESSIONS)
+        self._next = 0
+        self._probes: set[asyncio.Task] = set()
+        self._ejections = metrics.counter(f"{name}_engine_ejections", "Engines ejected after a connection error")
+
+    def select(self, session_id: int | None = None) -> EngineBackend:
+        """
+        Pick the server for the next request
+
+        Args:
+        session_id (int | None): session id, used to break ties
+
+        Returns:
+        EngineBackend: the least loaded healthy server
+        """
+        available = [backend for backend in self.backends if backend.healthy] or self.backends
+        least = min(backend.in_flight for backend in available)
+        candidates = [backend for backend in available if backend.in_flight == least]
+
+        backend = self._sessions.get(session_id) if session_id is not None else None
+        if backend not in candidates:
+            backend = candidates[self._next % len(candidates)]
+            self._next += 1
+        if session_id is not None:
+            self._sessions.put(session_id, backend)
+        return backend
+
+    @contextlib.contextmanager
+    def lease(self, backend: EngineBackend) -> Iterator[EngineBackend]:
+        """
+        Count the request as in flight on the server while the block runs
+        """
+        backend.in_flight += 1
+        backend._in_flight_gauge.inc()
+        try:
+            yield backend
+        finally:
+            backend.in_flight -= 1
+            backend._in_flight_gauge.dec()
+
+    def mark_failure(self, backend: EngineBackend, error: Exception) -> None:
+        """
+        Eject the server after a connection error and probe it until it is back
+        """
+        if not backend.healthy:
+            return
+        loguru.logger.error(f"Engine Pool --- {self.name}: ejecting {backend.base_url}: {error!r}")
+        backend.healthy = False
+        self._ejections.inc()
+        probe = asyncio.create_task(self._reprobe(backend))
+        self._probes.add(probe)
+        probe.add_done_callback(self._probes.discard)
+
+    async def _reprobe(self, backend: EngineBackend) -> None:
+        delay = ENGINE_REPROBE_SECONDS
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                res = await httpx_kit.client(self.name).get(backend.health_url, timeout=delay)
+                if res.status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            delay = min(delay * 2, ENGINE_REPROBE_MAX_SECONDS)
+
+        loguru.logger.info(f"Engine Pool --- {self.name}: {backend.base_url} is back")
+        backend.healthy = True
+
+
+inference_pool: EnginePool = EnginePool(
+    base_urls=parse_engine_urls(settings.INFERENCE_ENG_URLS, settings.INFERENCE_ENG, settings.INFERENCE_ENG_PORT),
+    name=UPSTREAM_INFERENCE,
+)
+embedding_pool: EnginePool = EnginePool(
+    base_urls=parse_engine_urls(settings.EMBEDDING_ENG_URLS, settings.EMBEDDING_ENG, settings.EMBEDDING_ENG_PORT),
+    name=UPSTREAM_EMBEDDING,
+    n_slots=1,
+)
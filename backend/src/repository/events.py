@@ -14,22 +14,37 @@
 # limitations under the License.
 
 
+import pathlib
+
 import fastapi
+import httpx
 import loguru
+import sqlalchemy
+from alembic import command as alembic_command
+from alembic.config import Config as AlembicConfig
 from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.dialects.postgresql.asyncpg import AsyncAdapt_asyncpg_connection
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import AsyncConnection
 from sqlalchemy.pool.base import _ConnectionRecord
 
-from src.config.settings.const import ANONYMOUS_USER, ANONYMOUS_EMAIL, ANONYMOUS_PASS
+from src.config.settings.const import ANONYMOUS_USER, ANONYMOUS_EMAIL, ANONYMOUS_PASS, DB_MIGRATION_LOCK_KEY
 from src.config.manager import settings
 from src.models.db.account import Account
 from src.securities.hashing.password import pwd_generator
+from src.repository.chat_history_writer import chat_history_writer
 from src.repository.database import async_db
-from src.repository.table import Base
+from src.repository.engine_pool import inference_pool
+from src.repository.ingestion_jobs import ingestion_jobs
 from src.repository.vector_database import vector_db
-from src.utilities.httpkit.httpx_kit import httpx_kit
+from src.utilities.httpkit.httpx_kit import UPSTREAM_INFERENCE, httpx_kit
+
+MIGRATIONS_DIR = pathlib.Path(__file__).resolve().parent / "migrations"
+ALEMBIC_INI = MIGRATIONS_DIR.parent.parent.parent / "alembic.ini"
+# Latest revision whose schema the databases created by `create_all` are known to have
+BASELINE_REVISION = "60d1844cb5d3"
 
 
 @event.listens_for(target=async_db.async_engine.sync_engine, identifier="connect")
@@ -48,51 +63,81 @@ def inspect_db_server_on_close(
     loguru.logger.info(f"Closed Connection Record ---\n {connection_record}")
 
 
+def upgrade_db_schema(connection: Connection) -> None:
+    """
+    Run the Alembic migrations up to the latest revision on the connection
+    """
+    config = AlembicConfig(str(ALEMBIC_INI))
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    config.attributes["connection"] = connection
+
+    tables = sqlalchemy.inspect(connection).get_table_names()
+    if "alembic_version" not in tables and "account" in tables:
+        # Created by `create_all` before the migrations were used, with the tables of the models at that time. The
+        # next revisions create what is missing, e.g. the columns added since.
+        loguru.logger.info(f"Database Table Creation --- Existing tables, stamping {BASELINE_REVISION}")
+        alembic_command.stamp(config, BASELINE_REVISION)
+    alembic_command.upgrade(config, "head")
+
+
 async def initialize_db_tables(connection: AsyncConnection) -> None:
     loguru.logger.info("Database Table Creation --- Initializing . . .")
 
-    await connection.run_sync(Base.metadata.drop_all)
-    await connection.run_sync(Base.metadata.create_all)
+    # The workers booting together wait for the first one, then find the schema up to date
+    await connection.execute(sqlalchemy.text("SELECT pg_advisory_xact_lock(:key)"), {"key": DB_MIGRATION_LOCK_KEY})
+    await connection.run_sync(upgrade_db_schema)
 
     loguru.logger.info("Database Table Creation --- Successfully Initialized!")
 
 
-async def initialize_anonymous_user(async_session: AsyncSession) -> None:
-    loguru.logger.info("Anonymous user --- Creating . . .")
-
-    new_account = Account(username=ANONYMOUS_USER, email=ANONYMOUS_EMAIL, is_logged_in=True)
-
-    new_account.set_hash_salt(hash_salt=pwd_generator.generate_salt)
-    new_account.set_hashed_password(
-        hashed_password=pwd_generator.generate_hashed_password(
-            hash_salt=new_account.hash_salt, new_password=ANONYMOUS_PASS
+async def initialize_account(async_session: AsyncSession, username: str, email: str, password: str) -> bool:
+    """
+    Create the account unless it exists, the password is only hashed when the account is created
+
+    Returns:
+    bool: True if the account was created
+    """
+    stmt = sqlalchemy.select(Account.id).where(sqlalchemy.or_(Account.username == username, Account.email == email))
+    if await async_session.scalar(stmt) is not None:
+        return False
+
+    hash_salt = pwd_generator.generate_salt
+    hashed_password = pwd_generator.generate_hashed_password(hash_salt=hash_salt, new_password=password)
+    # Another worker may have created it meanwhile
+    stmt = (
+        postgresql.insert(Account)
+        .values(
+            username=username,
+            email=email,
+            is_logged_in=True,
+            _hash_salt=hash_salt,
+            _hashed_password=hashed_password,
         )
+        .on_conflict_do_nothing()
     )
-
-    async_session.add(instance=new_account)
+    result = await async_session.execute(stmt)
     await async_session.commit()
-    await async_session.refresh(instance=new_account)
-
-    loguru.logger.info("Anonymous user --- Successfully Created!")
+    return result.rowcount > 0
 
 
-async def initialize_admin_user(async_session: AsyncSession) -> None:
-    loguru.logger.info("Admin user --- Creating . . .")
+async def initialize_anonymous_user(async_session: AsyncSession) -> None:
+    loguru.logger.info("Anonymous user --- Creating . . .")
 
-    new_account = Account(username=settings.ADMIN_USERNAME, email=settings.ADMIN_EMAIL, is_logged_in=True)
+    if await initialize_account(async_session, username=ANONYMOUS_USER, email=ANONYMOUS_EMAIL, password=ANONYMOUS_PASS):
+        loguru.logger.info("Anonymous user --- Successfully Created!")
+    else:
+        loguru.logger.info("Anonymous user --- Already exists")
 
-    new_account.set_hash_salt(hash_salt=pwd_generator.generate_salt)
-    new_account.set_hashed_password(
-        hashed_password=pwd_generator.generate_hashed_password(
-            hash_salt=new_account.hash_salt, new_password=settings.ADMIN_USERNAME
-        )
-    )
 
-    async_session.add(instance=new_account)
-    await async_session.commit()
-    await async_session.refresh(instance=new_account)
+async def initialize_admin_user(async_session: AsyncSession) -> None:
+    loguru.logger.info("Admin user --- Creating . . .")
 
-    loguru.logger.info("Admin user --- Successfully Created!")
+    if await initialize_account(
+        async_session, username=settings.ADMIN_USERNAME, email=settings.ADMIN_EMAIL, password=settings.ADMIN_USERNAME
+    ):
+        loguru.logger.info("Admin user --- Successfully Created!")
+    else:
+        loguru.logger.info("Admin user --- Already exists")
 
 
 async def initialize_default_data() -> None:
@@ -116,7 +161,8 @@ async def initialize_vectordb_collection() -> None:
     loguru.logger.info("Vector Database Connection --- Establishing . . .")
     # RAG data can be loaded manually from the frontend
     # https://github.com/SkywardAI/chat-backend/issues/172
-    vector_db.create_collection()
+    # Restarts and the other workers keep the data loaded before
+    vector_db.ensure_collection()
     # Create sample embeddings for testing
     # Sample can be loaded either dataset or directly from strings
     # For network consideration, default method is to use strings
@@ -129,6 +175,58 @@ async def initialize_vectordb_collection() -> None:
     loguru.logger.info("Vector Database Connection --- Successfully Established!")
 
 
+async def initialize_inference_slots() -> None:
+    loguru.logger.info("Inference Engine Slots --- Reading . . .")
+
+    for backend in inference_pool.backends:
+        try:
+            res = await httpx_kit.client(UPSTREAM_INFERENCE).get(backend.props_url)
+            res.raise_for_status()
+            total_slots = res.json().get("total_slots")
+        except (httpx.HTTPError, ValueError) as e:
+            total_slots = None
+            loguru.logger.warning(
+                f"Inference Engine Slots --- Failed to read the properties of {backend.base_url}: {e}"
+            )
+
+        if total_slots:
+            backend.slots.resize(n_slots=total_slots)
+
+        loguru.logger.info(f"Inference Engine Slots --- {backend.base_url}: {backend.slots.n_slots} slots!")
+
+
+async def initialize_chat_history_writer() -> None:
+    loguru.logger.info("Chat History Writer --- Starting . . .")
+
+    chat_history_writer.start()
+
+    loguru.logger.info("Chat History Writer --- Successfully Started!")
+
+
+async def dispose_chat_history_writer() -> None:
+    loguru.logger.info("Chat History Writer --- Flushing . . .")
+
+    await chat_history_writer.stop()
+
+    loguru.logger.info("Chat History Writer --- Successfully Stopped!")
+
+
+async def dispose_ingestion_jobs() -> None:
+    loguru.logger.info("Ingestion Jobs --- Stopping . . .")
+
+    ingestion_jobs.shutdown()
+
+    loguru.logger.info("Ingestion Jobs --- Successfully Stopped!")
+
+
+async def dispose_vectordb_connection() -> None:
+    loguru.logger.info("Vector Database Connection --- Disposing . . .")
+
+    vector_db.shutdown()
+
+    loguru.logger.info("Vector Database Connection --- Successfully Disposed!")
+
+
 async def dispose_db_connection(backend_app: fastapi.FastAPI) -> None:
     loguru.logger.info("Database Connection --- Disposing . . .")
 
@@ -0,0 +1,223 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import dataclasses
+import time
+import typing
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import loguru
+
+from src.config.manager import settings
+from src.config.settings.const import INGESTION_JOBS_KEPT
+from src.repository.ingestion_pipeline import StageStats
+from src.utilities.cache.lru_cache import LRUCache
+from src.utilities.metrics.registry import metrics
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+@dataclasses.dataclass
+class IngestionJob:
+    """
+    Progress of a dataset loaded in the background
+
+    The counters are written by the worker thread and read by the status endpoint.
+
+    Attributes:
+    -----------
+    id: str
+        Job id returned to the client
+    dataset_name: str
+        Name of the dataset to load
+    account_id: int | None
+        Account that started the job, the only one allowed to see it
+    status: str
+        `pending`, `running`, `succeeded` or `failed`
+    rows_read: int
+        Rows read from the source
+    rows_embedded: int
+        Rows whose vectors were computed by the embedding engines, a chunked row counts once per chunk
+    rows_inserted: int
+        Rows inserted into the vector database, a chunked row counts once per chunk
+    rows_unchanged: int
+        Rows already in the collection when the dataset is reloaded, neither embedded nor inserted again
+    rows_duplicate: int
+        Rows with the same content as an earlier row, dropped
+    rows_deleted: int
+        Entities of the rows removed from the dataset or changed since the last load
+    embedding_model: str | None
+        Embedding model that produced the vectors of the collection
+    embedding_dim: int | None
+        Dimension of these vectors
+    stages: dict[str, StageStats]
+        Throughput of every stage of the ingestion pipeline
+    error: str | None
+        Why the job failed
+    """
+
+    dataset_name: str
+    account_id: int | None = None
+    id: str = dataclasses.field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = JOB_PENDING
+    rows_read: int = 0
+    rows_embedded: int = 0
+    rows_inserted: int = 0
+    rows_unchanged: int = 0
+    rows_duplicate: int = 0
+    rows_deleted: int = 0
+    embedding_model: str | None = None
+    embedding_dim: int | None = None
+    stages: dict[str, StageStats] = dataclasses.field(default_factory=dict)
+    error: str | None = None
+    created_at: float = dataclasses.field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    @property
+    def is_done(self) -> bool:
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+    @property
+    def elapsed_seconds(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = self.elapsed_seconds
+        return self.rows_inserted / elapsed if elapsed > 0 else 0.0
+
+
+class IngestionJobConflict(Exception):
+    """
+    Another job is loading the same collection
+
+    Attributes:
+    -----------
+    job: IngestionJob
+        The job that is pending or running
+    """
+
+    def __init__(self, job: IngestionJob):
+        super().__init__(f"Job {job.id} is already loading {job.dataset_name}")
+        self.job = job
+
+
+class IngestionJobManager:
+    """
+    Run the dataset loads on worker threads, so the API workers stay responsive
+
+    At most `max_workers` jobs run at once, the others are pending in the queue of the executor. The last
+    `INGESTION_JOBS_KEPT` jobs can be looked up by id. Jobs submitted with the same key, e.g. the collection they
+    load, never run together: two reloads would compare the dataset with the same entities and both insert it.
+    """
+
+    def __init__(self, max_workers: int = settings.INGESTION_WORKERS, jobs_kept: int = INGESTION_JOBS_KEPT):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+        self.jobs = LRUCache(maxsize=jobs_kept)
+        # Key -> the job pending or running with it
+        self._active: dict[str, IngestionJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._running = metrics.gauge("ingestion_jobs_running", "Dataset loads running")
+        self._failed = metrics.counter("ingestion_jobs_failed", "Dataset loads that failed")
+        self._rows = metrics.counter("ingestion_rows_inserted", "Rows inserted by the dataset loads")
+
+    def submit(
+        self,
+        job: IngestionJob,
+        work: typing.Callable[[IngestionJob], typing.Any],
+        on_success: typing.Callable[[IngestionJob], typing.Awaitable[None]] | None = None,
+        key: str | None = None,
+    ) -> IngestionJob:
+        """
+        Start the job in the background
+
+        Args:
+        job (IngestionJob): the job to report the progress to
+        work (Callable[[IngestionJob], Any]): blocking function loading the dataset, run on a worker thread
+        on_success (Callable[[IngestionJob], Awaitable[None]] | None): run on the event loop after `work` returned
+        key (str | None): the collection loaded, a single job runs per key
+
+        Returns:
+        IngestionJob: the job, also available from `get`
+
+        Raises:
+        IngestionJobConflict: if a job with the same key is pending or running
+        """
+        if key is not None:
+            active = self._active.get(key)
+            if active is not None:
+                raise IngestionJobConflict(active)
+            self._active[key] = job
+        self.jobs.put(job.id, job)
+        task = asyncio.create_task(self._run(job, work, on_success, key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str) -> IngestionJob | None:
+        return self.jobs.get(job_id)
+
+    async def _run(
+        self,
+        job: IngestionJob,
+        work: typing.Callable[[IngestionJob], typing.Any],
+        on_success: typing.Callable[[IngestionJob], typing.Awaitable[None]] | None,
+        key: str | None = None,
+    ) -> None:
+        def run_work():
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+            self._running.inc()
+            try:
+                return work(job)
+            finally:
+                self._running.dec()
+
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, run_work)
+            if on_success is not None:
+                await on_success(job)
+            job.status = JOB_SUCCEEDED
+        except Exception as e:
+            loguru.logger.exception(f"Ingestion --- job {job.id} loading {job.dataset_name} failed")
+            job.error = repr(e)
+            job.status = JOB_FAILED
+            self._failed.inc()
+        finally:
+            job.finished_at = time.time()
+            self._rows.inc(job.rows_inserted)
+            if key is not None:
+                self._active.pop(key, None)
+        loguru.logger.info(
+            f"Ingestion --- job {job.id} {job.status}: {job.rows_inserted} rows of {job.dataset_name} inserted, "
+            f"{job.rows_unchanged} unchanged, {job.rows_deleted} deleted in {job.elapsed_seconds:.1f}s"
+        )
+
+    def shutdown(self) -> None:
+        """
+        Drop the pending jobs, the running ones are finished by their threads
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+ingestion_jobs: IngestionJobManager = IngestionJobManager()
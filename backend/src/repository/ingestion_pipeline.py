@@ -0,0 +1,231 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import dataclasses
+import itertools
+import queue
+import threading
+import time
+import typing
+from collections.abc import Iterable, Iterator, Sequence
+
+from src.config.settings.const import INGESTION_QUEUE_BATCHES
+from src.utilities.metrics.registry import metrics
+
+Batch = list[dict]
+Stage = tuple[str, typing.Callable[[Batch], Batch]]
+
+_DONE = object()
+
+
+def iter_batches(rows: Iterable[dict], batch_size: int) -> Iterator[Batch]:
+    """
+    Group the rows into lists of `batch_size`, the last one can be shorter
+    """
+    iterator = iter(rows)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
+@dataclasses.dataclass
+class StageStats:
+    """
+    Throughput of one stage of the pipeline
+
+    Attributes:
+    -----------
+    rows: int
+        Rows that went through the stage
+    seconds: float
+        Time spent processing them, without the waits for the other stages
+    """
+
+    rows: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+class ContentDiff:
+    """
+    Rows of a reloaded dataset that must be embedded and inserted, and entities that must be deleted
+
+    Rows are compared by their content hash with the entities of the collection. Unchanged rows are kept as is,
+    rows seen earlier in the same load are duplicates and dropped. After the load, the entities whose hash wasn't
+    seen, i.e. rows removed or changed, are stale. The entities sharing a hash are the chunks of one row.
+
+    Attributes:
+    -----------
+    existing: dict[str, list]
+        Ids of the entities of every hash in the collection before the load
+    unchanged: int
+        Rows already in the collection
+    duplicates: int
+        Rows with the content of an earlier row
+    """
+
+    def __init__(self, existing: dict[str, list] | None = None):
+        self.existing = existing or {}
+        self.unchanged = 0
+        self.duplicates = 0
+        self._seen: set[str] = set()
+
+    def new_rows(self, batch: Batch, hash_field: str) -> Batch:
+        """
+        Rows of the batch that aren't in the collection yet
+        """
+        rows = []
+        for row in batch:
+            digest = row[hash_field]
+            if digest in self._seen:
+                self.duplicates += 1
+                continue
+            self._seen.add(digest)
+            if digest in self.existing:
+                self.unchanged += 1
+            else:
+                rows.append(row)
+        return rows
+
+    def stale_ids(self) -> list:
+        """
+        Ids of the entities to delete once the new rows are inserted
+        """
+        return [entity_id for digest, ids in self.existing.items() if digest not in self._seen for entity_id in ids]
+
+
+class _Stopped(Exception):
+    """
+    Another stage failed, this one gives up
+    """
+
+
+class IngestionPipeline:
+    """
+    Move batches of rows through stages, e.g. embed then insert, each stage on its own thread
+
+    Stages are connected by queues of `max_pending` batches. A slow stage blocks the ones before it instead of
+    letting batches pile up, so the memory is bounded by a few batches per stage whatever the size of the dataset.
+    If a stage fails the others stop and `run` raises its error.
+    """
+
+    def __init__(self, stages: Sequence[Stage], max_pending: int = INGESTION_QUEUE_BATCHES):
+        self.stages = list(stages)
+        self.max_pending = max_pending
+        self.stats: dict[str, StageStats] = {name: StageStats() for name in ["read", *(n for n, _ in self.stages)]}
+        self._error: BaseException | None = None
+        self._batch_seconds = {
+            name: metrics.histogram(f"ingestion_{name}_batch_seconds", f"Duration of the ingestion stage {name}")
+            for name in self.stats
+        }
+
+    def run(self, batches: Iterable[Batch]) -> dict[str, StageStats]:
+        """
+        Run the batches through every stage, blocking until the last one is done
+
+        Args:
+        batches (Iterable[Batch]): the source, read lazily
+
+        Returns:
+        dict[str, StageStats]: statistics of `read` and of every stage
+        """
+        queues = [queue.Queue(maxsize=self.max_pending) for _ in self.stages]
+        threads = [threading.Thread(target=self._read, args=(batches, queues[0]), name="ingestion-read", daemon=True)]
+        for i, (name, process) in enumerate(self.stages):
+            output = queues[i + 1] if i + 1 < len(queues) else None
+            threads.append(
+                threading.Thread(
+                    target=self._process,
+                    args=(name, process, queues[i], output),
+                    name=f"ingestion-{name}",
+                    daemon=True,
+                )
+            )
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
+        return self.stats
+
+    def _record(self, name: str, rows: int, seconds: float) -> None:
+        stats = self.stats[name]
+        stats.rows += rows
+        stats.seconds += seconds
+        self._batch_seconds[name].observe(seconds)
+
+    def _fail(self, error: BaseException) -> None:
+        if self._error is None:
+            self._error = error
+
+    def _put(self, output: queue.Queue, item: typing.Any) -> None:
+        while True:
+            if self._error is not None:
+                raise _Stopped
+            try:
+                output.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, input: queue.Queue) -> typing.Any:
+        while True:
+            if self._error is not None:
+                raise _Stopped
+            try:
+                return input.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _read(self, batches: Iterable[Batch], output: queue.Queue) -> None:
+        try:
+            iterator = iter(batches)
+            while True:
+                started = time.perf_counter()
+                batch = next(iterator, None)
+                if batch is None:
+                    break
+                self._record("read", len(batch), time.perf_counter() - started)
+                self._put(output, batch)
+            self._put(output, _DONE)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def _process(
+        self,
+        name: str,
+        process: typing.Callable[[Batch], Batch],
+        input: queue.Queue,
+        output: queue.Queue | None,
+    ) -> None:
+        try:
+            while (batch := self._get(input)) is not _DONE:
+                started = time.perf_counter()
+                batch = process(batch)
+                self._record(name, len(batch), time.perf_counter() - started)
+                if output is not None:
+                    self._put(output, batch)
+            if output is not None:
+                self._put(output, _DONE)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self._fail(e)
@@ -7,14 +7,18 @@ from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.pool import NullPool as SQLAlchemyNullPool
 
-from src.repository.base import Base
+from src.repository.table import Base
 from src.repository.database import async_db
 
 config = context.config
 config.set_main_option(name="sqlalchemy.url", value=str(async_db.set_async_db_uri))
 target_metadata = Base.metadata
 
-if config.config_file_name is not None:
+# The app runs the migrations at startup on its own connection, see `upgrade_db_schema` in `repository/events.py`,
+# and keeps its logging
+external_connection: Connection | None = config.attributes.get("connection")
+
+if config.config_file_name is not None and external_connection is None:
     fileConfig(config.config_file_name)
 
 
@@ -73,5 +77,7 @@ async def run_migrations_online() -> None:
 
 if context.is_offline_mode():
     run_migrations_offline()
+elif external_connection is not None:
+    do_run_migrations(external_connection)
 else:
     asyncio.run(run_migrations_online())
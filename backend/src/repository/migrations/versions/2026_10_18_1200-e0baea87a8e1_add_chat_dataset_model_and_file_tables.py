@@ -0,0 +1,117 @@
+"""add session, chat history, dataset, ai model and uploaded file tables
+
+Revision ID: e0baea87a8e1
+Revises: 60d1844cb5d3
+Create Date: 2026-10-18 12:00:00.000000
+
+Databases created by `create_all` before the migrations were used are stamped at 60d1844cb5d3 and already have
+these tables, without `chat_history.token_count`: only what is missing is created.
+
+"""
+
+import sqlalchemy as sa
+from alembic import context, op
+
+# revision identifiers, used by Alembic.
+revision = "e0baea87a8e1"
+down_revision = "60d1844cb5d3"
+branch_labels = None
+depends_on = None
+
+
+def existing_columns() -> dict[str, set[str]]:
+    """
+    Columns of every existing table, nothing exists when the SQL is only generated
+    """
+    if context.is_offline_mode():
+        return {}
+    inspector = sa.inspect(op.get_bind())
+    return {table: {column["name"] for column in inspector.get_columns(table)} for table in inspector.get_table_names()}
+
+
+def upgrade() -> None:
+    existing = existing_columns()
+    if "session" not in existing:
+        create_session_table()
+    if "chat_history" not in existing:
+        create_chat_history_table()
+    elif "token_count" not in existing["chat_history"]:
+        op.add_column("chat_history", sa.Column("token_count", sa.Integer(), nullable=True))
+    if "data_set" not in existing:
+        create_data_set_table()
+    if "ai_model" not in existing:
+        create_ai_model_table()
+    if "uploaded_file" not in existing:
+        create_uploaded_file_table()
+
+
+def create_session_table() -> None:
+    op.create_table(
+        "session",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("uuid", sa.String(length=36), nullable=False),
+        sa.Column("account_id", sa.Integer(), nullable=True),
+        sa.Column("name", sa.String(length=64), nullable=True),
+        sa.Column("session_type", sa.Enum("rag", "chat", name="session_type"), nullable=False),
+        sa.Column("dataset_name", sa.String(length=256), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def create_chat_history_table() -> None:
+    op.create_table(
+        "chat_history",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("session_id", sa.Integer(), nullable=False),
+        sa.Column("role", sa.Enum("user", "assistant", name="role"), nullable=False),
+        sa.Column("message", sa.String(length=4096), nullable=False),
+        sa.Column("token_count", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def create_data_set_table() -> None:
+    op.create_table(
+        "data_set",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.Column("account_id", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+
+
+def create_ai_model_table() -> None:
+    op.create_table(
+        "ai_model",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.Column("des", sa.String(length=1024), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+
+
+def create_uploaded_file_table() -> None:
+    op.create_table(
+        "uploaded_file",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("uploaded_file")
+    op.drop_table("ai_model")
+    op.drop_table("data_set")
+    op.drop_table("chat_history")
+    op.drop_table("session")
+    sa.Enum(name="role").drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name="session_type").drop(op.get_bind(), checkfirst=True)
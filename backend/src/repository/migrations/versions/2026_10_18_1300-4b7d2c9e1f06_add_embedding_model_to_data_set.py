@@ -0,0 +1,26 @@
+"""add embedding model and dimension to data_set
+
+Revision ID: 4b7d2c9e1f06
+Revises: e0baea87a8e1
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "4b7d2c9e1f06"
+down_revision = "e0baea87a8e1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("data_set", sa.Column("embedding_model", sa.String(length=256), nullable=True))
+    op.add_column("data_set", sa.Column("embedding_dim", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("data_set", "embedding_dim")
+    op.drop_column("data_set", "embedding_model")
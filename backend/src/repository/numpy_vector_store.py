@@ -0,0 +1,398 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import contextlib
+import fcntl
+import json
+import os
+import pathlib
+import shutil
+import threading
+import uuid
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+import loguru
+import numpy as np
+
+from src.config.manager import settings
+from src.config.settings.const import (
+    DEFAULT_COLLECTION,
+    DEFAULT_DIM,
+    IVF_MIN_ROWS,
+    IVF_NPROBE,
+    IVF_RETRAIN_GROWTH,
+    IVF_TRAIN_ITERATIONS,
+)
+from src.repository.rag.chunking import CHUNK_INDEX_FIELD, PASSAGE_FIELD, SOURCE_FIELD
+from src.repository.vector_store import CONTENT_HASH_FIELD, VECTOR_FIELD, BaseVectorStore
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    Scale the rows to unit length, so the dot product is the cosine similarity
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(similarities: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions of the `k` highest similarities, highest first
+    """
+    if k < len(similarities):
+        positions = np.argpartition(-similarities, k - 1)[:k]
+    else:
+        positions = np.arange(len(similarities))
+    return positions[np.argsort(-similarities[positions], kind="stable")]
+
+
+class IVFIndex:
+    """
+    Inverted file index over unit vectors
+
+    The vectors are clustered with spherical k-means into about `sqrt(n)` lists, a query is only compared with the
+    vectors of the `n_probe` lists whose centroids are the closest. Rows inserted after the index was trained are
+    not in any list, the caller compares them by brute force.
+
+    Attributes:
+    -----------
+    n_indexed: int
+        Number of rows covered by the index
+    """
+
+    def __init__(self, vectors: np.ndarray, n_iterations: int = IVF_TRAIN_ITERATIONS, seed: int = 0):
+        self.n_indexed = len(vectors)
+        n_lists = max(int(np.sqrt(self.n_indexed)), 1)
+        rng = np.random.default_rng(seed)
+        # Training on a sample is enough to place the centroids
+        sample = vectors[rng.choice(self.n_indexed, size=min(self.n_indexed, n_lists * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(n_iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = normalize_rows(sums)
+
+        self.centroids = centroids
+        assignment = np.concatenate(
+            [
+                np.argmax(vectors[start : start + 65536] @ centroids.T, axis=1)
+                for start in range(0, self.n_indexed, 65536)
+            ]
+        )
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        self.lists = [order[bounds[i] : bounds[i + 1]] for i in range(n_lists)]
+
+    def candidates(self, query: np.ndarray, n_probe: int = IVF_NPROBE) -> np.ndarray:
+        closest = top_k(self.centroids @ query, min(n_probe, len(self.centroids)))
+        return np.concatenate([self.lists[i] for i in closest])
+
+
+def _file_size(path: pathlib.Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+class _Collection:
+    """
+    Vectors and fields of one collection
+
+    `vectors.f32` holds the unit vectors back to back and is memory-mapped, `rows.jsonl` holds the other fields
+    of every entity, its line number is its id. Both are append-only, the ids of the deleted entities are
+    appended to `deleted.txt` and skipped by the searches.
+    Another worker may append to the files, `refresh` reads what was added since they were last read.
+    """
+
+    def __init__(self, path: pathlib.Path, dimension: int, generation: str = ""):
+        self.path = path
+        self.dimension = dimension
+        self.generation = generation
+        self.rows: list[dict] = []
+        self.vectors = np.empty((0, dimension), dtype=np.float32)
+        self.deleted_ids = np.empty(0, dtype=np.int64)
+        self.index: IVFIndex | None = None
+        # Bytes of `rows.jsonl` and `deleted.txt` already read
+        self.rows_read = 0
+        self.deleted_read = 0
+        self.refresh()
+
+    @property
+    def deleted_path(self) -> pathlib.Path:
+        return self.path / "deleted.txt"
+
+    @property
+    def vectors_path(self) -> pathlib.Path:
+        return self.path / "vectors.f32"
+
+    @property
+    def rows_path(self) -> pathlib.Path:
+        return self.path / "rows.jsonl"
+
+    def _map(self, n_rows: int) -> None:
+        if n_rows:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self.dimension))
+
+    def refresh(self) -> None:
+        """
+        Read the rows and deletions appended to the files since the last read, by this worker or another one
+        """
+        if _file_size(self.rows_path) > self.rows_read:
+            with self.rows_path.open("rb") as file:
+                file.seek(self.rows_read)
+                added = file.read()
+            # A line being written by another worker is read on the next refresh
+            added = added[: added.rfind(b"\n") + 1]
+            if added:
+                self.rows.extend(json.loads(line) for line in added.split(b"\n")[:-1])
+                self.rows_read += len(added)
+                # The vectors are written before the rows
+                self._map(len(self.rows))
+        if _file_size(self.deleted_path) != self.deleted_read:
+            with self.deleted_path.open("rb") as file:
+                content = file.read()
+            content = content[: content.rfind(b"\n") + 1]
+            self.deleted_ids = np.unique(np.array([int(i) for i in content.split()], dtype=np.int64))
+            self.deleted_read = len(content)
+
+    def append(self, vectors: np.ndarray, rows: list[dict]) -> None:
+        """
+        Append entities, the caller holds the write lock of the collection and refreshed it
+        """
+        with self.vectors_path.open("ab") as file:
+            # Drop what a writer that died halfway left behind
+            file.truncate(len(self.rows) * self.dimension * np.dtype(np.float32).itemsize)
+            file.write(normalize_rows(vectors).astype(np.float32).tobytes())
+        with self.rows_path.open("ab") as file:
+            file.truncate(self.rows_read)
+            file.write(
+                b"".join((json.dumps(row, ensure_ascii=False, default=str) + "\n").encode("utf-8") for row in rows)
+            )
+        # Rows first, a concurrent search only looks at the rows of the vectors it sees
+        self.refresh()
+
+    def delete(self, ids: list[int]) -> int:
+        self.refresh()
+        ids = np.setdiff1d(np.asarray(ids, dtype=np.int64), self.deleted_ids)
+        ids = ids[(ids >= 0) & (ids < len(self.rows))]
+        with self.deleted_path.open("a") as file:
+            file.writelines(f"{i}\n" for i in ids)
+        self.refresh()
+        return len(ids)
+
+
+class NumpyVectorStore(BaseVectorStore):
+    """
+    In-process vector store persisted to memory-mapped files
+
+    Every collection is a directory under `path`. Small collections are searched by brute force, a matrix-vector
+    product over the memory-mapped vectors. With `use_ivf`, collections of `IVF_MIN_ROWS` rows or more are searched
+    through an `IVFIndex`, trained in memory on the first search.
+    Searches run on `search_executor`, numpy releases the GIL during the products.
+
+    Several workers can share `path`: every access picks up the rows the others appended. Creates, appends and
+    deletes hold an exclusive `flock` on the `.<collection>.lock` file, so the writes of two workers never
+    interleave. A recreated collection gets a new generation directory named in its `meta.json`, the files of the
+    previous generation are left to the workers still reading them and removed at the next recreate.
+    """
+
+    def __init__(self, path: str, use_ivf: bool = False, search_workers: int = settings.VECTOR_STORE_SEARCH_WORKERS):
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.use_ivf = use_ivf
+        self.search_executor = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="numpy-search")
+        self._collections: dict[str, _Collection] = {}
+        self._lock = threading.RLock()
+        loguru.logger.info(f"Vector Database --- In-process store at {self.path.resolve()}")
+
+    def _collection_path(self, collection_name: str) -> pathlib.Path:
+        return self.path / collection_name
+
+    @contextlib.contextmanager
+    def _write_lock(self, collection_name: str) -> Iterator[None]:
+        """
+        Hold the collection against the writes of the other threads and workers
+        """
+        with self._lock, (self.path / f".{collection_name}.lock").open("a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self, collection_name: str) -> dict | None:
+        try:
+            return json.loads((self._collection_path(collection_name) / "meta.json").read_text())
+        except FileNotFoundError:
+            return None
+
+    def _get(self, collection_name: str) -> _Collection | None:
+        with self._lock:
+            meta = self._read_meta(collection_name)
+            if meta is None:
+                self._collections.pop(collection_name, None)
+                return None
+            # Collections created before the generations keep their files in their directory
+            generation = meta.get("generation", "")
+            collection = self._collections.get(collection_name)
+            if collection is None or collection.generation != generation:
+                collection = self._collections[collection_name] = _Collection(
+                    self._collection_path(collection_name) / generation, meta["dimension"], generation
+                )
+            else:
+                collection.refresh()
+            return collection
+
+    def has_collection(self, collection_name: str) -> bool:
+        return self._get(collection_name) is not None
+
+    def collection_dimension(self, collection_name: str) -> int | None:
+        collection = self._get(collection_name)
+        return None if collection is None else collection.dimension
+
+    def create_collection(self, collection_name=DEFAULT_COLLECTION, dimension=DEFAULT_DIM, recreate=True):
+        with self._write_lock(collection_name):
+            path = self._collection_path(collection_name)
+            previous = self._get(collection_name)
+            if previous is not None:
+                if not recreate:
+                    return
+                loguru.logger.info(f"Vector Database --- {collection_name} exists, dropping..")
+                # Only the generations before the previous one, the other workers may still map its files
+                for child in path.iterdir():
+                    if child.is_dir() and child.name != previous.generation:
+                        shutil.rmtree(child, ignore_errors=True)
+                    elif child.is_file() and previous.generation and child.name != "meta.json":
+                        # Files of a collection created before the generations
+                        child.unlink(missing_ok=True)
+
+            generation = uuid.uuid4().hex
+            (path / generation).mkdir(parents=True)
+            # Renamed into place, the other workers never read a partial meta
+            meta_tmp = path / f"meta.{generation}.tmp"
+            meta_tmp.write_text(json.dumps({"dimension": dimension, "generation": generation}))
+            os.replace(meta_tmp, path / "meta.json")
+            self._collections[collection_name] = _Collection(path / generation, dimension, generation)
+            loguru.logger.info(f"Vector Database --- collection {collection_name} created")
+
+    def insert_list(self, collection_name: str = DEFAULT_COLLECTION, data_list: list = []) -> dict:
+        with self._write_lock(collection_name):
+            # Refreshed under the lock, the rows of the other workers are counted in the ids
+            collection = self._get(collection_name)
+            if collection is None:
+                raise ValueError(f"Collection {collection_name} doesn't exist")
+            vectors = np.asarray([row[VECTOR_FIELD] for row in data_list], dtype=np.float32)
+            if len(data_list) and vectors.shape != (len(data_list), collection.dimension):
+                raise ValueError(f"Expected vectors of dimension {collection.dimension}, got {vectors.shape[1:]}")
+            start = len(collection.rows)
+            collection.append(vectors, [{k: v for k, v in row.items() if k != VECTOR_FIELD} for row in data_list])
+            return {"insert_count": len(data_list), "ids": list(range(start, len(collection.rows)))}
+
+    def delete_ids(self, collection_name: str, ids: list) -> int:
+        with self._write_lock(collection_name):
+            collection = self._get(collection_name)
+            if collection is None:
+                raise ValueError(f"Collection {collection_name} doesn't exist")
+            return collection.delete(ids)
+
+    def content_hashes(self, collection_name: str) -> dict[str, list]:
+        collection = self._get(collection_name)
+        if collection is None:
+            return {}
+        deleted = set(collection.deleted_ids.tolist())
+        hashes: dict[str, list] = {}
+        for i, row in enumerate(collection.rows):
+            if i not in deleted:
+                hashes.setdefault(row.get(CONTENT_HASH_FIELD) or "", []).append(i)
+        return hashes
+
+    def search_hits(self, data, n_results, collection_name=DEFAULT_COLLECTION) -> list[dict] | None:
+        collection = self._get(collection_name)
+        if collection is None:
+            loguru.logger.error(f"Vector Database --- collection {collection_name} doesn't exist")
+            return None
+        vectors, rows = collection.vectors, collection.rows
+        if not len(vectors) or n_results <= 0:
+            return []
+        query = np.asarray(data, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        candidates = self._candidates(collection, vectors, query)
+        deleted = collection.deleted_ids
+        if candidates is None:
+            similarities = vectors @ query
+            if len(deleted):
+                similarities[deleted[deleted < len(vectors)]] = -np.inf
+            positions = top_k(similarities, n_results)
+            ids = positions
+        else:
+            similarities = vectors[candidates] @ query
+            if len(deleted):
+                similarities[np.isin(candidates, deleted)] = -np.inf
+            positions = top_k(similarities, n_results)
+            ids = candidates[positions]
+        return [
+            {
+                "id": int(i),
+                "similarity": float(similarities[p]),
+                "answer": rows[i].get(PASSAGE_FIELD),
+                "source_id": rows[i].get(SOURCE_FIELD),
+                "chunk_index": rows[i].get(CHUNK_INDEX_FIELD),
+            }
+            for i, p in zip(ids, positions)
+            if similarities[p] > -np.inf
+        ]
+
+    async def async_search(self, data, n_results, collection_name=DEFAULT_COLLECTION):
+        """
+        `search` on `search_executor`, the event loop isn't blocked by large collections or IVF training
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.search_executor, self.search, data, n_results, collection_name
+        )
+
+    async def async_search_hits(self, data, n_results, collection_name=DEFAULT_COLLECTION) -> list[dict] | None:
+        """
+        `search_hits` on `search_executor`, see `async_search`
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.search_executor, self.search_hits, data, n_results, collection_name
+        )
+
+    def shutdown(self) -> None:
+        """
+        Stop the search threads, waiting for the running searches
+        """
+        self.search_executor.shutdown(wait=True, cancel_futures=True)
+
+    def _candidates(self, collection: _Collection, vectors: np.ndarray, query: np.ndarray) -> np.ndarray | None:
+        """
+        Rows to compare with the query, None to compare all of them
+        """
+        n_rows = len(vectors)
+        if not self.use_ivf or n_rows < IVF_MIN_ROWS:
+            return None
+        index = collection.index
+        if index is None or n_rows - index.n_indexed > index.n_indexed * IVF_RETRAIN_GROWTH:
+            loguru.logger.info(f"Vector Database --- training the IVF index of {n_rows} rows")
+            index = collection.index = IVFIndex(np.asarray(vectors))
+        return np.concatenate([index.candidates(query), np.arange(index.n_indexed, n_rows)])
@@ -0,0 +1,172 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import dataclasses
+
+import loguru
+import numpy as np
+
+from src.config.manager import settings
+from src.config.settings.const import SEMANTIC_CACHE_MAX_ANSWERS
+from src.utilities.httpkit.sse_kit import CompletionEvent
+from src.utilities.metrics.registry import metrics
+
+
+@dataclasses.dataclass(slots=True)
+class CachedAnswer:
+    """
+    An answer generated before for a similar question
+
+    Attributes:
+    -----------
+    answer: str
+        The generated text
+    similarity: float
+        Cosine similarity between the new question and the cached one
+    generation_seconds: float
+        How long the generation took, saved by serving the answer from the cache
+    """
+
+    answer: str
+    similarity: float
+    generation_seconds: float
+
+    def events(self) -> list[CompletionEvent]:
+        """
+        The answer as completion events, in the format of the llama.cpp stream
+        """
+        return [
+            CompletionEvent.from_payload({"content": self.answer, "stop": False, "cached": True}),
+            CompletionEvent.from_payload({"content": "", "stop": True, "cached": True}),
+        ]
+
+
+class _CollectionAnswers:
+    """
+    Unit question embeddings of one collection in a ring buffer, the oldest answer is replaced when it is full
+
+    `epoch` is the version of the collection the answers were generated from.
+    """
+
+    def __init__(self, capacity: int, dimension: int, epoch: str = ""):
+        self.epoch = epoch
+        self.vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self.answers: list[tuple[str, float]] = []
+        self.next = 0
+
+    def add(self, vector: np.ndarray, answer: str, generation_seconds: float) -> None:
+        self.vectors[self.next] = vector
+        if self.next < len(self.answers):
+            self.answers[self.next] = (answer, generation_seconds)
+        else:
+            self.answers.append((answer, generation_seconds))
+        self.next = (self.next + 1) % len(self.vectors)
+
+    def closest(self, vector: np.ndarray) -> tuple[int, float]:
+        similarities = self.vectors[: len(self.answers)] @ vector
+        index = int(np.argmax(similarities))
+        return index, float(similarities[index])
+
+
+class SemanticAnswerCache:
+    """
+    Serve generated answers again for near-duplicate questions on the same collection
+
+    Questions are compared by the cosine similarity of their embeddings. A lookup is one matrix-vector product over
+    the last `max_answers` answers of the collection.
+
+    Only the answers of the first turn of a session are cached, later turns also depend on the history. Every
+    worker has its own answers: they are versioned by an `epoch` of the collection read from the database, which
+    changes when the dataset is reloaded. `invalidate` only clears the answers of this worker.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = settings.RAG_SEMANTIC_CACHE,
+        threshold: float = settings.RAG_SEMANTIC_CACHE_THRESHOLD,
+        max_answers: int = SEMANTIC_CACHE_MAX_ANSWERS,
+    ):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_answers = max_answers
+        self._collections: dict[str, _CollectionAnswers] = {}
+        self._hits = metrics.counter("semantic_cache_hits", "RAG answers served from the semantic cache")
+        self._misses = metrics.counter("semantic_cache_misses", "RAG questions without a similar cached answer")
+        self._saved_seconds = metrics.counter(
+            "semantic_cache_saved_seconds", "Generation time saved by the semantic cache"
+        )
+
+    @staticmethod
+    def _unit(vector: np.ndarray) -> np.ndarray | None:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else None
+
+    def lookup(self, collection_name: str, embedding: np.ndarray, epoch: str = "") -> CachedAnswer | None:
+        """
+        Find the cached answer of the most similar question
+
+        Args:
+        collection_name (str): collection the question is asked on
+        embedding (np.ndarray): embedding of the question
+        epoch (str): current version of the collection, the answers of another version are dropped
+
+        Returns:
+        CachedAnswer | None: the answer if a question is similar enough
+        """
+        answers = self._collections.get(collection_name)
+        if answers is not None and answers.epoch != epoch:
+            self.invalidate(collection_name)
+            answers = None
+        vector = self._unit(embedding)
+        if answers is None or vector is None or vector.shape[0] != answers.vectors.shape[1]:
+            self._misses.inc()
+            return None
+
+        index, similarity = answers.closest(vector)
+        if similarity < self.threshold:
+            self._misses.inc()
+            return None
+
+        answer, generation_seconds = answers.answers[index]
+        self._hits.inc()
+        self._saved_seconds.inc(generation_seconds)
+        return CachedAnswer(answer=answer, similarity=similarity, generation_seconds=generation_seconds)
+
+    def store(
+        self, collection_name: str, embedding: np.ndarray, answer: str, generation_seconds: float, epoch: str = ""
+    ) -> None:
+        """
+        Cache the answer generated for the question from the `epoch` version of the collection
+        """
+        vector = self._unit(embedding)
+        if vector is None or not answer:
+            return
+        answers = self._collections.get(collection_name)
+        if answers is None or vector.shape[0] != answers.vectors.shape[1] or answers.epoch != epoch:
+            # New collection, reloaded dataset, or the embedding model changed
+            answers = self._collections[collection_name] = _CollectionAnswers(
+                self.max_answers, vector.shape[0], epoch=epoch
+            )
+        answers.add(vector, answer, generation_seconds)
+
+    def invalidate(self, collection_name: str) -> None:
+        """
+        Forget the answers of the collection, e.g. when its dataset is reloaded
+        """
+        if self._collections.pop(collection_name, None) is not None:
+            loguru.logger.info(f"Semantic Cache --- Invalidated the answers of {collection_name}")
+
+
+answer_cache: SemanticAnswerCache = SemanticAnswerCache()
@@ -13,16 +13,58 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Any
-from collections.abc import AsyncGenerator
+import asyncio
+import contextlib
+import time
+from collections.abc import AsyncGenerator, Sequence
 import loguru
 import httpx
+import numpy as np
 
+from src.config.manager import settings
+from src.config.settings.const import (
+    PROMPT_HISTORY_MAX_MESSAGES,
+    PROMPT_HISTORY_PAGE,
+    SEMANTIC_CACHE_EPOCH_COLLECTIONS,
+    SEMANTIC_CACHE_EPOCH_SECONDS,
+)
+from src.repository.crud.chat import ChatHistoryCRUDRepository
+from src.repository.crud.dataset_db import DataSetCRUDRepository
+from src.repository.database import async_db
+from src.repository.rag.answer_cache import answer_cache
 from src.repository.rag.base import BaseRAGRepository
+from src.repository.rag.prompt import PromptBuilder, history_offset
+from src.repository.rag.retrieval import ContextPacker, Passage, format_context, select_passages
+from src.repository.embedding_eng import embedding_client
+from src.repository.engine_pool import EngineBackend, inference_pool
+from src.repository.slot_allocator import ANY_SLOT
 from src.repository.inference_eng import InferenceHelper
-from src.utilities.httpkit.httpx_kit import httpx_kit
+from src.utilities.httpkit.httpx_kit import UPSTREAM_INFERENCE, httpx_kit
+from src.utilities.httpkit.sse_kit import CompletionEvent, CompletionSummary, SSEParseError, iter_completion_events
 from src.repository.vector_database import vector_db
 from src.utilities.formatters.ds_formatter import DatasetFormatter
+from src.utilities.cache.lru_cache import LRUCache
+from src.utilities.metrics.registry import metrics
+
+
+_collection_epochs = LRUCache(maxsize=SEMANTIC_CACHE_EPOCH_COLLECTIONS, ttl=SEMANTIC_CACHE_EPOCH_SECONDS)
+
+
+async def collection_epoch(collection_name: str) -> str:
+    """
+    Version of the collection shared by the workers, the time its dataset was last loaded
+
+    The answers cached by a worker are dropped when it changes, see `SemanticAnswerCache`.
+    """
+    epoch = _collection_epochs.get(collection_name)
+    if epoch is None:
+        async with async_db.async_session_maker() as async_session:
+            updated_at = await DataSetCRUDRepository(async_session=async_session).get_dataset_updated_at(
+                collection_name
+            )
+        epoch = updated_at.isoformat() if updated_at is not None else ""
+        _collection_epochs.put(collection_name, epoch)
+    return epoch
 
 
 class RAGChatModelRepository(BaseRAGRepository):
@@ -50,6 +92,164 @@ class RAGChatModelRepository(BaseRAGRepository):
         """
         return f"### System: {current_context}\n" + f"\n### Human: {prmpt}\n### Assistant:"
 
+    @staticmethod
+    async def read_history(session_id: int) -> list[tuple[str, str, int | None]]:
+        """
+        Recent messages of the session, oldest first
+
+        The oldest message read only moves every `PROMPT_HISTORY_PAGE` messages, see `history_offset`. They are read with a session of their own: the completion is streamed after the dependencies of the request
+        exited, the session of the repository is closed by then.
+
+        Returns:
+        list[tuple[str, str, int | None]]: `(role, message, token_count)` of every message
+        """
+        async with async_db.async_session_maker() as async_session:
+            chat_repo = ChatHistoryCRUDRepository(async_session=async_session)
+            n_messages = await chat_repo.count_chat_history_by_session_id(id=session_id)
+            chats = await chat_repo.read_chat_history_from_offset_by_session_id(
+                id=session_id, offset=history_offset(n_messages, PROMPT_HISTORY_MAX_MESSAGES, PROMPT_HISTORY_PAGE)
+            )
+        return [(chat.role, chat.message, chat.token_count) for chat in chats]
+
+    async def build_prompt(
+        self,
+        session_id: int,
+        input_msg: str,
+        n_predict: int,
+        current_context: str = InferenceHelper.instruction,
+        history: Sequence[tuple[str, str, int | None]] | None = None,
+    ) -> str:
+        """
+        Format the input question together with the previous turns of the session
+
+        The newest turns that fit the context of the inference engine are kept, see `PromptBuilder`.
+
+        Args:
+        session_id (int): session id
+        input_msg (str): input message
+        n_predict (int): tokens reserved for the answer
+        current_context (str): the context we got from the vector database
+        history (Sequence[tuple[str, str, int | None]] | None): the messages of the session, read if None
+
+        Returns:
+        str: formatted prompt
+        """
+        if history is None:
+            history = await self.read_history(session_id)
+        return await PromptBuilder().build(
+            system_prompt=current_context,
+            history=history,
+            input_msg=input_msg,
+            n_predict=n_predict,
+        )
+
+    async def stream_completion(self, session_id: int, data: dict) -> AsyncGenerator[CompletionEvent, None]:
+        """
+        Stream the `/completion` endpoint of the inference engine as typed events
+
+        The raw bytes are parsed incrementally, so a `data:` line split across network chunks is re-assembled
+        before it is handed to the client. The final `stop` event carries `timings` and `tokens_predicted`.
+        The request goes to the least loaded engine of `inference_pool`, preferably the one the session used
+        last, and there to the session's own llama.cpp slot, so the prompt cached there can be reused. `id_slot`
+        and `cache_prompt` are set here, not by the callers. An engine that can't be connected is ejected and the
+        request is sent to the next one.
+
+        Args:
+        session_id (int): session id
+        data (dict): payload of the `/completion` request
+
+        Returns:
+        AsyncGenerator[CompletionEvent, None]: typed events of the completion stream
+        """
+        summary = CompletionSummary()
+        try:
+            for _ in range(len(inference_pool.backends)):
+                backend = inference_pool.select(session_id=session_id)
+                try:
+                    stream = self._stream_from(backend, session_id=session_id, data=data)
+                    async with contextlib.aclosing(stream):
+                        async for event in stream:
+                            summary.add(event)
+                            yield event
+                    break
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    # Nothing was streamed yet, the request can be sent to another engine
+                    inference_pool.mark_failure(backend, e)
+                except httpx.ReadError as e:
+                    loguru.logger.error(f"An error occurred while requesting {e.request.url!r}.")
+                    break
+                except httpx.HTTPStatusError as e:
+                    loguru.logger.error(f"Error response {e.response.status_code} while requesting {e.request.url!r}.")
+                    break
+                except httpx.TimeoutException as e:
+                    loguru.logger.error(f"Timeout {type(e).__name__} while requesting {e.request.url!r}.")
+                    break
+                except SSEParseError as e:
+                    loguru.logger.error(f"Invalid completion stream --- {e}")
+                    break
+            else:
+                loguru.logger.error(f"Completion --- session {session_id}: no inference engine could be connected")
+        except (GeneratorExit, asyncio.CancelledError):
+            # The client went away, the httpx stream is closed on the way out and llama.cpp stops generating
+            self.record_cancellation(summary, n_predict=data.get("n_predict"))
+            raise
+
+        if summary.is_finished:
+            loguru.logger.info(
+                f"Completion --- session {session_id}: {summary.tokens_predicted} tokens, timings {summary.timings}"
+            )
+            self.record_prefill(summary)
+
+    @staticmethod
+    async def _stream_from(
+        backend: EngineBackend, session_id: int, data: dict
+    ) -> AsyncGenerator[CompletionEvent, None]:
+        id_slot = backend.slots.acquire(session_id=session_id)
+        # The prompt is cached when the session holds its own slot, it is reused by the next turn of the session
+        data = {**data, "id_slot": id_slot, "cache_prompt": id_slot != ANY_SLOT}
+        try:
+            with inference_pool.lease(backend):
+                # The read timeout of the inference client bounds the pause between two chunks, not the stream
+                async with httpx_kit.client(UPSTREAM_INFERENCE).stream(
+                    "POST",
+                    backend.completion_url,
+                    headers={"Content-Type": "application/json"},
+                    json=data,
+                ) as response:
+                    response.raise_for_status()
+                    async for event in iter_completion_events(response.aiter_bytes()):
+                        yield event
+        finally:
+            backend.slots.release(slot=id_slot)
+
+    @staticmethod
+    def record_cancellation(summary: CompletionSummary, n_predict: int | None) -> None:
+        """
+        Count the tokens llama.cpp didn't have to generate because the stream was cancelled early
+        """
+        if summary.is_finished:
+            return
+        metrics.counter("completions_cancelled", "Completions cancelled before the end").inc()
+        if n_predict is not None and n_predict > 0:
+            metrics.counter("completion_tokens_saved", "Tokens not generated thanks to early cancellation").inc(
+                max(n_predict - summary.tokens_streamed, 0)
+            )
+
+    @staticmethod
+    def record_prefill(summary: CompletionSummary) -> None:
+        """
+        Count prompt tokens against those llama.cpp really evaluated, the difference was served from the slot cache
+        """
+        prompt_tokens = summary.final.tokens_evaluated
+        evaluated_tokens = (summary.timings or {}).get("prompt_n")
+        if prompt_tokens is None or evaluated_tokens is None:
+            return
+        metrics.counter("prompt_tokens", "Tokens of the prompts sent to the engine").inc(prompt_tokens)
+        metrics.counter("prompt_tokens_evaluated", "Prompt tokens evaluated by the engine").inc(evaluated_tokens)
+        metrics.counter("prompt_tokens_cached", "Prompt tokens reused from the slot cache").inc(
+            max(prompt_tokens - evaluated_tokens, 0)
+        )
+
     async def inference(
         self,
         session_id: int,
@@ -58,7 +258,7 @@ class RAGChatModelRepository(BaseRAGRepository):
         top_k: int = 40,
         top_p: float = 0.9,
         n_predict: int = 128,
-    ) -> AsyncGenerator[Any, None]:
+    ) -> AsyncGenerator[CompletionEvent, None]:
         """
         **Inference using seperate service:(llamacpp)**
 
@@ -72,38 +272,47 @@ class RAGChatModelRepository(BaseRAGRepository):
         - **n_predict (int):** n_predict parameter for inference(int)
 
         **Returns:**
-        AsyncGenerator[Any, None]: response message
+        AsyncGenerator[CompletionEvent, None]: typed events of the completion stream
         """
 
+        n_predict = 128 if n_predict == 0 else n_predict
         data = {
-            "prompt": self.format_prompt(input_msg),
+            "prompt": await self.build_prompt(session_id=session_id, input_msg=input_msg, n_predict=n_predict),
             "temperature": temperature,
             "top_k": top_k,
             "top_p": top_p,
-            "n_keep": 0,  # If the context window is full, we keep 0 tokens
-            "n_predict": 128 if n_predict == 0 else n_predict,
-            "cache_prompt": True,
-            "slot_id": -1,  # for cached prompt
+            "n_keep": 0,  # The prompt is packed to fit the context, see `build_prompt`
+            "n_predict": n_predict,
             "stop": ["\n### Human:"],
             "stream": True,
         }
 
-        try:
-            async with httpx_kit.async_client.stream(
-                "POST",
-                InferenceHelper.instruct_infer_url(),
-                headers={"Content-Type": "application/json"},
-                json=data,
-                # We disable all timeout and trying to fix streaming randomly cutting off
-                timeout=httpx.Timeout(timeout=None),
-            ) as response:
-                response.raise_for_status()
-                async for chunk in response.aiter_text():
-                    yield chunk
-        except httpx.ReadError as e:
-            loguru.logger.error(f"An error occurred while requesting {e.request.url!r}.")
-        except httpx.HTTPStatusError as e:
-            loguru.logger.error(f"Error response {e.response.status_code} while requesting {e.request.url!r}.")
+        async with contextlib.aclosing(self.stream_completion(session_id=session_id, data=data)) as stream:
+            async for event in stream:
+                yield event
+
+    @staticmethod
+    async def retrieve_passages(embedding: np.ndarray | None, collection_name: str) -> list[Passage]:
+        """
+        Get the passages of the collection to answer the question with
+
+        The `RAG_TOP_K` closest entities are fetched, those below `RAG_MIN_SIMILARITY` or near-identical to a better
+        one are dropped, and as many as fit `RAG_CONTEXT_TOKENS` are kept, see `ContextPacker`.
+
+        Args:
+        embedding (np.ndarray | None): embedding of the question
+        collection_name (str): collection to search
+
+        Returns:
+        list[Passage]: the passages to put in the prompt, most similar first
+        """
+        if embedding is None:
+            return []
+        hits = await vector_db.async_search_hits(
+            embedding.tolist(), settings.RAG_TOP_K, collection_name=collection_name
+        )
+        passages = select_passages(hits or [], min_similarity=settings.RAG_MIN_SIMILARITY)
+        return await ContextPacker().pack(passages)
 
     async def inference_with_rag(
         self,
@@ -114,69 +323,73 @@ class RAGChatModelRepository(BaseRAGRepository):
         top_k: int = 40,
         top_p: float = 0.9,
         n_predict: int = 128,
-    ) -> AsyncGenerator[Any, None]:
+    ) -> AsyncGenerator[CompletionEvent, None]:
         """
         Inference using RAG
 
+        The question is answered from the passages of the collection selected by `retrieve_passages`, the final
+        event lists them under `passages`.
+        With `RAG_SEMANTIC_CACHE`, the answer generated for a similar question on the same collection is streamed
+        back without the inference engine, see `SemanticAnswerCache`. Only the first turn of a session is cached,
+        the answers of later turns depend on the history.
+
         Returns:
-        AsyncGenerator[Any, None]: response message
+        AsyncGenerator[CompletionEvent, None]: typed events of the completion stream
         """
 
-        async def get_context_by_question(input_msg: str):
-            """
-            Get the context from v-db by the question
-            """
-
-            try:
-                res = await httpx_kit.async_client.post(
-                    InferenceHelper.instruct_embedding_url(),
-                    headers={"Content-Type": "application/json"},
-                    json={"content": input_msg},
-                    timeout=httpx.Timeout(timeout=None),
-                )
-                res.raise_for_status()
-                embedd_input = res.json().get("embedding")
-            except Exception as e:
-                loguru.logger.error(e)
-            # collection name for testing
-            context = vector_db.search(
-                list(embedd_input), 1, collection_name=DatasetFormatter.format_dataset_by_name(collection_name)
-            )
-            if context and (len(context) > 0):
-                context = f"Please answer the question based on answer {context[0]}"
-            else:
-                context = InferenceHelper.instruction
+        collection = DatasetFormatter.format_dataset_by_name(collection_name)
+        embedding = await embedding_client.embed(input_msg)
+        history = await self.read_history(session_id)
+        use_answer_cache = answer_cache.enabled and embedding is not None and not history
 
-            return context
+        epoch = ""
+        if use_answer_cache:
+            epoch = await collection_epoch(collection)
+            cached = answer_cache.lookup(collection, embedding, epoch=epoch)
+            if cached is not None:
+                loguru.logger.info(f"Semantic Cache --- session {session_id}: similarity {cached.similarity:.3f}")
+                for event in cached.events():
+                    yield event
+                return
 
-        current_context = await get_context_by_question(input_msg)
+        passages = await self.retrieve_passages(embedding, collection_name=collection)
+        current_context = format_context(passages) if passages else InferenceHelper.instruction
+        if passages:
+            loguru.logger.info(f"Retrieval --- session {session_id}: {[p.reference() for p in passages]}")
 
+        n_predict = 128 if n_predict == 0 else n_predict
         data_with_context = {
-            "prompt": self.format_prompt(input_msg, current_context=current_context),
+            "prompt": await self.build_prompt(
+                session_id=session_id,
+                input_msg=input_msg,
+                n_predict=n_predict,
+                current_context=current_context,
+                history=history,
+            ),
             "temperature": temperature,
             "top_k": top_k,
             "top_p": top_p,
-            "n_keep": 0,  # If the context window is full, we keep 0 tokens
-            "n_predict": 128 if n_predict == 0 else n_predict,
-            "cache_prompt": False,
-            "slot_id": -1,  # for cached prompt
+            "n_keep": 0,  # The prompt is packed to fit the context, see `build_prompt`
+            "n_predict": n_predict,
             "stop": ["\n### Human:"],
             "stream": True,
         }
 
-        try:
-            async with httpx_kit.async_client.stream(
-                "POST",
-                InferenceHelper.instruct_infer_url(),
-                headers={"Content-Type": "application/json"},
-                json=data_with_context,
-                # We disable all timeout and trying to fix streaming randomly cutting off
-                timeout=httpx.Timeout(timeout=None),
-            ) as response:
-                response.raise_for_status()
-                async for chunk in response.aiter_text():
-                    yield chunk
-        except httpx.ReadError as e:
-            loguru.logger.error(f"An error occurred while requesting {e.request.url!r}.")
-        except httpx.HTTPStatusError as e:
-            loguru.logger.error(f"Error response {e.response.status_code} while requesting {e.request.url!r}.")
+        summary = CompletionSummary()
+        started = time.perf_counter()
+        stream = self.stream_completion(session_id=session_id, data=data_with_context)
+        async with contextlib.aclosing(stream):
+            async for event in stream:
+                if event.stop and passages:
+                    # Tell the client which passages the answer is based on
+                    event = CompletionEvent.from_payload(
+                        {**event.payload, "passages": [passage.reference() for passage in passages]}
+                    )
+                summary.add(event)
+                yield event
+
+        # Answers cut by `n_predict` are not worth serving again
+        if use_answer_cache and summary.is_finished and not summary.final.payload.get("stopped_limit"):
+            answer_cache.store(
+                collection, embedding, summary.text, generation_seconds=time.perf_counter() - started, epoch=epoch
+            )
@@ -0,0 +1,172 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import typing
+
+from src.config.manager import settings
+from src.repository.tokenizer import TokenCounter
+
+PASSAGE_FIELD = "answer"
+SOURCE_FIELD = "source_id"
+CHUNK_INDEX_FIELD = "chunk_index"
+CHUNK_COUNT_FIELD = "chunk_count"
+
+# End of a sentence, followed by spaces, or a blank line
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?。！？])\s+|\n\s*\n")
+
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+class TextChunker:
+    """
+    Split the long passages of a dataset into overlapping chunks, each embedded and retrieved on its own
+
+    Chunks are made of whole sentences, up to `max_tokens`, and start with the last sentences of the previous
+    chunk, up to `overlap_tokens`, so a fact spanning a boundary is in one of them. A sentence longer than
+    `max_tokens` is split between words. Tokens are estimated from the characters, see `TokenCounter.estimate`,
+    counting them with the inference engines would cost a request per sentence. `max_tokens` 0 disables chunking.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = settings.INGESTION_CHUNK_TOKENS,
+        overlap_tokens: int = settings.INGESTION_CHUNK_OVERLAP,
+        count: typing.Callable[[str], int] = TokenCounter.estimate,
+    ):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        self.count = count
+
+    @property
+    def signature(self) -> str:
+        """
+        Settings of the chunker, part of the content hash so the rows are chunked again when they change
+        """
+        return f"chunks:{self.max_tokens}:{self.overlap_tokens}" if self.max_tokens > 0 else ""
+
+    def chunk(self, text: str) -> list[str]:
+        """
+        Split the text, a text that fits `max_tokens` is its only chunk
+
+        Args:
+        text (str): passage to split
+
+        Returns:
+        list[str]: the chunks, in order
+        """
+        if self.max_tokens <= 0 or self.count(text) <= self.max_tokens:
+            return [text]
+
+        pieces = []
+        for sentence in split_sentences(text):
+            pieces.extend(self._split_words(sentence) if self.count(sentence) > self.max_tokens else [sentence])
+
+        chunks: list[str] = []
+        current: list[tuple[str, int]] = []
+        n_current = 0
+        for piece in pieces:
+            n_piece = self.count(piece)
+            if current and n_current + n_piece > self.max_tokens:
+                chunks.append(" ".join(piece for piece, _ in current))
+                current = self._overlap(current, room=self.max_tokens - n_piece)
+                n_current = sum(n for _, n in current)
+            current.append((piece, n_piece))
+            n_current += n_piece
+        chunks.append(" ".join(piece for piece, _ in current))
+        return chunks
+
+    def _overlap(self, pieces: list[tuple[str, int]], room: int) -> list[tuple[str, int]]:
+        """
+        Last pieces of a chunk repeated at the start of the next one, leaving `room` for its next piece
+        """
+        overlap: list[tuple[str, int]] = []
+        n_overlap = 0
+        for piece, n_piece in reversed(pieces):
+            if n_overlap + n_piece > min(self.overlap_tokens, room):
+                break
+            overlap.insert(0, (piece, n_piece))
+            n_overlap += n_piece
+        return overlap
+
+    def _split_words(self, sentence: str) -> list[str]:
+        pieces, current, n_current = [], [], 0
+        for word in sentence.split():
+            n_word = self.count(word)
+            if n_word > self.max_tokens:
+                # e.g. text without spaces, cut between characters
+                step = max(len(word) * self.max_tokens // n_word, 1)
+                parts = [word[start : start + step] for start in range(0, len(word), step)]
+            else:
+                parts = [word]
+            for part in parts:
+                n_part = self.count(part)
+                if current and n_current + n_part > self.max_tokens:
+                    pieces.append(" ".join(current))
+                    current, n_current = [], 0
+                current.append(part)
+                n_current += n_part
+        if current:
+            pieces.append(" ".join(current))
+        return pieces
+
+    def chunk_row(self, row: dict, text_field: str, source_id: typing.Any = None) -> list[dict]:
+        """
+        Rows of the chunks of a dataset row
+
+        The passage of a row is its `answer`, or its `text_field` for the datasets of documents without answers.
+        Every chunk row holds a chunk as passage, with back-references to its source: `source_id`, `chunk_index`
+        and `chunk_count`. The chunks of a document are embedded as is, the chunks of an answer are embedded
+        together with the question, see `embedding_text`.
+
+        Args:
+        row (dict): row of the dataset
+        text_field (str): column embedded
+        source_id (Any): id of the row, e.g. its content hash
+
+        Returns:
+        list[dict]: the row itself, with its passage, if it fits `max_tokens`, otherwise its chunks
+        """
+        is_document = row.get(PASSAGE_FIELD) is None
+        passage = str(row[text_field] if is_document else row[PASSAGE_FIELD])
+        chunks = self.chunk(passage)
+        if len(chunks) == 1:
+            return [{**row, PASSAGE_FIELD: passage}]
+
+        rows = []
+        for index, chunk in enumerate(chunks):
+            chunk_row = {
+                **row,
+                PASSAGE_FIELD: chunk,
+                SOURCE_FIELD: source_id,
+                CHUNK_INDEX_FIELD: index,
+                CHUNK_COUNT_FIELD: len(chunks),
+            }
+            if is_document:
+                chunk_row[text_field] = chunk
+            rows.append(chunk_row)
+        return rows
+
+    @staticmethod
+    def embedding_text(row: dict, text_field: str) -> str:
+        """
+        Text embedded for a row, a chunk of an answer is prefixed with its question
+        """
+        text = str(row[text_field] or "")
+        if CHUNK_INDEX_FIELD in row and row.get(PASSAGE_FIELD) != text:
+            return f"{text}\n{row[PASSAGE_FIELD]}"
+        return text
@@ -0,0 +1,178 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections.abc import Sequence
+
+import loguru
+
+from src.config.manager import settings
+from src.config.settings.const import PROMPT_TOKEN_MARGIN, PROMPT_WINDOW_STRIDE
+from src.repository.engine_pool import EnginePool, inference_pool
+from src.repository.tokenizer import TokenCounter, token_counter
+
+
+def format_system(context: str) -> str:
+    return f"### System: {context}\n"
+
+
+def format_message(role: str, message: str) -> str:
+    """
+    Format one message of the conversation
+
+    The answer of the assistant is appended as is, it already starts with the space generated by the model.
+    So the prompt of the next turn starts with exactly the text llama.cpp has in its cache.
+    """
+    match role:
+        case "assistant":
+            return f"\n### Assistant:{message}"
+        case _:
+            return f"\n### Human: {message}"
+
+
+def select_history_window(message_tokens: Sequence[int], budget: int, stride: int) -> int:
+    """
+    Select the oldest message to keep so the history fits the token budget
+
+    Keeping the newest messages that fit would move the start of the window on every turn, and every turn would
+    re-evaluate the whole history. Instead the number of dropped tokens is rounded up to a multiple of `stride`,
+    the window only moves once per `stride` tokens of new conversation and the prefix stays identical in between.
+
+    Args:
+    message_tokens (Sequence[int]): token count of every message, oldest first
+    budget (int): tokens available for the history
+    stride (int): granularity of the window moves
+
+    Returns:
+    int: index of the first message to keep, `len(message_tokens)` if none fits
+    """
+    total = sum(message_tokens)
+    if total <= budget:
+        return 0
+    if budget <= 0:
+        return len(message_tokens)
+
+    overflow = total - budget
+    to_drop = -(-overflow // stride) * stride
+    dropped = 0
+    for index, n_tokens in enumerate(message_tokens):
+        if dropped >= to_drop:
+            return index
+        dropped += n_tokens
+    return len(message_tokens)
+
+
+def history_offset(n_messages: int, max_messages: int, page: int) -> int:
+    """
+    Number of the oldest messages of the session left out of the prompt
+
+    Reading the last `max_messages` would move the oldest message on every turn once the session is longer, the
+    window of `select_history_window` would start elsewhere and every turn would re-evaluate the whole history.
+    The offset is rounded down to a multiple of `page` instead, between `max_messages` and
+    `max_messages + page - 1` messages are read and the oldest one only changes every `page` messages.
+
+    Args:
+    n_messages (int): number of messages of the session
+    max_messages (int): min number of messages to read
+    page (int): granularity of the offset, even so the history starts with a question
+
+    Returns:
+    int: number of messages to skip
+    """
+    return max(n_messages - max_messages, 0) // page * page
+
+
+def slot_context_size(pool: EnginePool = inference_pool) -> int:
+    """
+    Tokens of context of one slot, llama.cpp splits its context between its slots
+
+    The slot counts are the ones read from `/props`. The prompt is built before an engine is picked, so the
+    smallest slot of the pool is assumed.
+    """
+    return min(settings.INFERENCE_ENG_CTX_SIZE // max(backend.slots.n_slots, 1) for backend in pool.backends)
+
+
+class PromptBuilder:
+    """
+    Build the prompt of a turn from the chat history of the session
+
+    The prompt is laid out as `system, oldest kept message, ..., newest message, new question`. The history is
+    packed into what is left of the context after the system prompt, the new question and `n_predict`.
+    Without `context_size`, the context of a slot is computed on every build, see `slot_context_size`.
+    Nothing is sent to the tokenizer on the way: the history counts are stored with the messages, the system
+    prompt and the question are estimated, see `TokenCounter.estimate_many`.
+    """
+
+    def __init__(
+        self,
+        counter: TokenCounter = token_counter,
+        context_size: int | None = None,
+        stride: int = PROMPT_WINDOW_STRIDE,
+        margin: int = PROMPT_TOKEN_MARGIN,
+    ):
+        self.counter = counter
+        self.context_size = context_size
+        self.stride = stride
+        self.margin = margin
+
+    async def build(
+        self, system_prompt: str, history: Sequence[tuple[str, str, int | None]], input_msg: str, n_predict: int
+    ) -> str:
+        """
+        Build the prompt
+
+        Args:
+        system_prompt (str): instruction or the context from the vector database
+        history (Sequence[tuple[str, str, int | None]]): `(role, message, token_count)` of the previous messages,
+            oldest first. `token_count` is the count stored with the chat history, None if it isn't known yet
+        input_msg (str): the new question
+        n_predict (int): tokens reserved for the answer
+
+        Returns:
+        str: formatted prompt
+        """
+        system = format_system(system_prompt)
+        question = format_message("user", input_msg) + format_message("assistant", "")
+        segments = [format_message(role, message) for role, message, _ in history]
+
+        n_system, n_question = self.counter.estimate_many([system, question])
+        n_segments = await self.count_history(history, segments)
+        context_size = self.context_size if self.context_size is not None else slot_context_size()
+        budget = context_size - n_predict - n_system - n_question - self.margin
+        if budget < 0:
+            loguru.logger.warning(f"Prompt --- system prompt and question exceed the context by {-budget} tokens")
+
+        start = select_history_window(n_segments, budget, self.stride)
+        # Never start the window with an answer of the assistant
+        while start < len(history) and history[start][0] != "user":
+            start += 1
+
+        return system + "".join(segments[start:]) + question
+
+    async def count_history(self, history: Sequence[tuple[str, str, int | None]], segments: Sequence[str]) -> list[int]:
+        """
+        Token count of every message, from the chat history row or the in-process cache
+
+        Only messages that were never counted, e.g. imported through `/chat/save`, reach the tokenizer.
+        """
+        n_segments = [
+            token_count if token_count is not None else self.counter.cached(segment)
+            for (_, _, token_count), segment in zip(history, segments)
+        ]
+        missing = [index for index, n_tokens in enumerate(n_segments) if n_tokens is None]
+        if missing:
+            counted = await self.counter.count_many([segments[index] for index in missing])
+            for index, n_tokens in zip(missing, counted):
+                n_segments[index] = n_tokens
+        return n_segments
@@ -0,0 +1,150 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import dataclasses
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+from src.config.manager import settings
+from src.config.settings.const import RAG_DEDUPE_SIMILARITY
+from src.repository.embedding_eng import normalize_text
+from src.repository.tokenizer import TokenCounter, token_counter
+
+CONTEXT_HEADER = "Please answer the question based on the following passages:"
+
+
+@dataclasses.dataclass(slots=True)
+class Passage:
+    """
+    A passage retrieved from the vector database
+
+    Attributes:
+    -----------
+    id: Any
+        Primary key of the entity
+    text: str
+        The answer stored with the entity
+    similarity: float
+        Cosine similarity between the question and the entity
+    source_id: Any
+        Row of the dataset the passage is a chunk of, None if the row wasn't chunked
+    chunk_index: int | None
+        Position of the chunk in that row
+    """
+
+    id: Any
+    text: str
+    similarity: float
+    source_id: Any = None
+    chunk_index: int | None = None
+
+    def reference(self) -> dict[str, Any]:
+        """
+        What the client is told about the passage
+        """
+        reference = {"id": self.id, "similarity": round(self.similarity, 4)}
+        if self.source_id is not None:
+            reference.update(source_id=self.source_id, chunk_index=self.chunk_index)
+        return reference
+
+
+def format_passage(passage: Passage) -> str:
+    return f"\n- {passage.text}"
+
+
+def format_context(passages: Sequence[Passage]) -> str:
+    return CONTEXT_HEADER + "".join(format_passage(passage) for passage in passages)
+
+
+def word_overlap(a: frozenset[str], b: frozenset[str]) -> float:
+    """
+    Jaccard similarity of two word sets
+    """
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def select_passages(
+    hits: Iterable[dict[str, Any]], min_similarity: float, dedupe_similarity: float = RAG_DEDUPE_SIMILARITY
+) -> list[Passage]:
+    """
+    Keep the relevant and distinct hits of a search, most similar first
+
+    Args:
+    hits (Iterable[dict[str, Any]]): `{"id", "similarity", "answer", ...}` as returned by `search_hits`
+    min_similarity (float): hits below this cosine similarity are dropped
+    dedupe_similarity (float): a hit whose words overlap this much with a better hit is dropped
+
+    Returns:
+    list[Passage]: the selected passages
+    """
+    passages: list[Passage] = []
+    kept_words: list[frozenset[str]] = []
+    for hit in sorted(hits, key=lambda hit: hit.get("similarity") or 0.0, reverse=True):
+        text, similarity = hit.get("answer"), hit.get("similarity")
+        if not text or similarity is None or similarity < min_similarity:
+            continue
+        words = frozenset(normalize_text(text).split())
+        if any(word_overlap(words, kept) >= dedupe_similarity for kept in kept_words):
+            continue
+        passages.append(
+            Passage(
+                id=hit.get("id"),
+                text=text,
+                similarity=float(similarity),
+                source_id=hit.get("source_id"),
+                chunk_index=hit.get("chunk_index"),
+            )
+        )
+        kept_words.append(words)
+    return passages
+
+
+class ContextPacker:
+    """
+    Pack the retrieved passages into a token budget
+
+    The passages are taken most similar first, a passage that doesn't fit what is left of the budget is skipped
+    and the next, maybe shorter, one is tried. `RAG_CONTEXT_TOKENS` bounds the prefill spent on the context.
+    The passages are counted without the engine, see `TokenCounter.estimate_many`.
+    """
+
+    def __init__(self, counter: TokenCounter = token_counter, budget: int = settings.RAG_CONTEXT_TOKENS):
+        self.counter = counter
+        self.budget = budget
+
+    async def pack(self, passages: Sequence[Passage]) -> list[Passage]:
+        """
+        Select the passages to put in the prompt
+
+        Args:
+        passages (Sequence[Passage]): candidate passages, most similar first
+
+        Returns:
+        list[Passage]: the passages that fit the budget, in the same order
+        """
+        if not passages:
+            return []
+        n_header, *n_passages = self.counter.estimate_many(
+            [CONTEXT_HEADER, *(format_passage(passage) for passage in passages)]
+        )
+        left = self.budget - n_header
+        packed = []
+        for passage, n_tokens in zip(passages, n_passages):
+            if n_tokens <= left:
+                packed.append(passage)
+                left -= n_tokens
+        return packed
@@ -13,9 +13,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from datasets import load_dataset
+import asyncio
+from collections.abc import Iterator
+
+from src.config.manager import settings
+from src.repository.dataset_sources import collection_name, open_dataset_source
+from src.repository.embedding_eng import DocumentEmbedder, document_embedder
+from src.repository.ingestion_jobs import IngestionJob
+from src.repository.ingestion_pipeline import ContentDiff, IngestionPipeline
+from src.repository.rag.answer_cache import answer_cache
+from src.repository.rag.chunking import TextChunker
 from src.repository.vector_database import vector_db
-from src.utilities.formatters.ds_formatter import DatasetFormatter
+from src.repository.vector_store import CONTENT_HASH_FIELD, VECTOR_FIELD, content_hash
 
 
 class DatasetEng:
@@ -29,19 +38,120 @@ class DatasetEng:
         pass
 
     @classmethod
-    def load_dataset(cls, name: str) -> dict:
+    def load_dataset(
+        cls,
+        name: str,
+        loop: asyncio.AbstractEventLoop,
+        job: IngestionJob | None = None,
+        embedder: DocumentEmbedder = document_embedder,
+        text_field: str | None = None,
+        chunker: TextChunker | None = None,
+    ) -> dict:
         """
-        Load dataset from the given name, must connect to the internet
+        Load dataset from the given name, a dataset of the HF hub or a CSV, JSONL or Parquet file
+
+        It blocks, run it on a worker thread, see `IngestionJobManager`. Files ending with `.csv`, `.jsonl` or
+        `.parquet` are read from `LOCAL_DATASETS_PATH` without connecting to the internet, see
+        `open_dataset_source`. The rows are read `INGESTION_BATCH_SIZE` at a time through an `IngestionPipeline`,
+        so the memory doesn't grow with the dataset. The progress is reported to `job`.
+
+        The `text_field` column, `INGESTION_TEXT_FIELD` by default, is embedded by the embedding engines, with the
+        model embedding the questions, so any text dataset can be loaded and the query and document vectors always
+        match. Vectors shipped with the dataset are ignored. The collection is created with the dimension of the
+        model. Passages longer than `INGESTION_CHUNK_TOKENS` are split into overlapping chunks by `chunker`, every
+        chunk is an entity referencing its row, so the searches return short passages and the prompts stay small.
+
+        Reloads are incremental: every row is stored with its `content_hash`, only the rows whose hash isn't in the
+        collection yet are embedded and inserted, then the entities of the removed or changed rows are deleted.
+        A reload costs in proportion to the changes, not to the dataset.
+
+        Args:
+        name (str): name of the dataset on the HF hub or file name under `LOCAL_DATASETS_PATH`
+        loop (asyncio.AbstractEventLoop): event loop of the embedding client, the embeddings are computed there
+        job (IngestionJob | None): where to report the progress, the model and the dimension
+        embedder (DocumentEmbedder): embeds the documents
+        text_field (str | None): column to embed
+        chunker (TextChunker | None): splits the long passages
 
-        No need to consider the memory usage
+        Returns:
+        dict: `{"insert_count": int, "unchanged_count": int, "delete_count": int}`
         """
 
-        ds = load_dataset(name)
-        # TODO: validation isn't make sense, it should be removed
-        ds_list = ds.get("validation").to_list()
+        job = job or IngestionJob(dataset_name=name)
+        source = open_dataset_source(name)
+        text_field = text_field or settings.INGESTION_TEXT_FIELD
+        chunker = chunker or TextChunker()
+        if text_field not in source.column_names:
+            raise ValueError(f"Dataset {name} has no column {text_field}, columns are {source.column_names}")
+
+        name = collection_name(name) if name else None
+        job.embedding_model = embedder.model
+        if vector_db.has_collection(name):
+            job.embedding_dim = vector_db.collection_dimension(name)
+            diff = ContentDiff(existing=vector_db.content_hashes(name))
+        else:
+            diff = ContentDiff()
+        collection_checked = False
+
+        def read_batches() -> Iterator[list[dict]]:
+            for batch in source.iter_batches(settings.INGESTION_BATCH_SIZE):
+                job.rows_read += len(batch)
+                for row in batch:
+                    row[CONTENT_HASH_FIELD] = content_hash(row, embedder.model, chunking=chunker.signature)
+                batch = diff.new_rows(batch, CONTENT_HASH_FIELD)
+                job.rows_unchanged, job.rows_duplicate = diff.unchanged, diff.duplicates
+                if batch:
+                    yield batch
+
+        def chunk(batch: list[dict]) -> list[dict]:
+            # The chunks of a row stay in one batch, they are inserted together
+            return [
+                chunk_row
+                for row in batch
+                for chunk_row in chunker.chunk_row(row, text_field, source_id=row[CONTENT_HASH_FIELD])
+            ]
+
+        def embed(batch: list[dict]) -> list[dict]:
+            texts = [chunker.embedding_text(row, text_field) for row in batch]
+            vectors = asyncio.run_coroutine_threadsafe(embedder.embed(texts), loop).result()
+            for row, vector in zip(batch, vectors):
+                row[VECTOR_FIELD] = vector.tolist()
+            job.rows_embedded += len(batch)
+            return batch
+
+        def insert(batch: list[dict]) -> list[dict]:
+            nonlocal collection_checked
+            if not collection_checked:
+                # The dimension is only known once the model answered
+                dimension = len(batch[0][VECTOR_FIELD])
+                if dimension != job.embedding_dim:
+                    # No collection yet, or vectors of another model: the hashes include the model, nothing was kept
+                    vector_db.create_collection(collection_name=name, dimension=dimension)
+                    diff.existing = {}
+                    job.embedding_dim = dimension
+                collection_checked = True
+            result = vector_db.insert_list(collection_name=name, data_list=batch)
+            inserted = result.get("insert_count", 0) if result else 0
+            job.rows_inserted += inserted
+            if inserted != len(batch):
+                # Fails the job before the stale entities are deleted, a reload inserts the missing rows
+                raise RuntimeError(f"Only {inserted} of {len(batch)} rows were inserted into {name}")
+            return batch
 
-        name = DatasetFormatter.format_dataset_by_name(name) if name else None
+        pipeline = IngestionPipeline(stages=[("chunk", chunk), ("embed", embed), ("insert", insert)])
+        job.stages = pipeline.stats
+        pipeline.run(read_batches())
 
-        vector_db.create_collection(collection_name=name)
+        # Deleted last, once every new row was inserted, the searches never miss a row that is only changed
+        stale_ids = diff.stale_ids()
+        if stale_ids:
+            job.rows_deleted = vector_db.delete_ids(name, stale_ids)
+        if job.rows_inserted or job.rows_deleted:
+            # The cached answers were generated from the previous data
+            answer_cache.invalidate(name)
 
-        return vector_db.insert_list(collection_name=name, data_list=ds_list)
+        return {
+            "insert_count": job.rows_inserted,
+            "unchanged_count": job.rows_unchanged,
+            "delete_count": job.rows_deleted,
+        }
@@ -0,0 +1,107 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+import loguru
+
+from src.config.manager import settings
+from src.utilities.metrics.registry import metrics
+
+# Let llama.cpp pick an idle slot
+ANY_SLOT = -1
+
+
+class SlotAllocator:
+    """
+    Map sessions to llama.cpp slots, so the follow-up turns of a session land on the slot that has its prompt cached
+
+    With `cache_prompt` llama.cpp only re-evaluates the tokens after the common prefix of the new prompt and the
+    one cached in the slot. A session keeps its slot until it is the least recently used one and another session
+    needs a slot. Slots with a running generation are never taken away.
+
+    Attributes:
+    -----------
+    n_slots: int
+        Number of slots of the engine, the `--parallel` argument of llama.cpp
+    """
+
+    def __init__(self, n_slots: int = settings.INFERENCE_ENG_PARALLEL, name: str = "slot"):
+        self.n_slots = n_slots
+        self._sessions: collections.OrderedDict[int, int] = collections.OrderedDict()
+        self._active: collections.Counter[int] = collections.Counter()
+        self._hits = metrics.counter(f"{name}_hits", "Turns routed to the slot caching their session")
+        self._misses = metrics.counter(f"{name}_misses", "Turns routed to a slot without their session")
+        self._evictions = metrics.counter(f"{name}_evictions", "Sessions which lost their slot to another session")
+
+    def resize(self, n_slots: int) -> None:
+        """
+        Change the number of slots, e.g. after reading `total_slots` from the engine
+        """
+        if n_slots == self.n_slots:
+            return
+        loguru.logger.info(f"Slot Allocator --- {self.n_slots} -> {n_slots} slots")
+        self.n_slots = n_slots
+        self._sessions.clear()
+
+    def acquire(self, session_id: int) -> int:
+        """
+        Get the slot for a new generation of the session
+
+        Args:
+        session_id (int): session id
+
+        Returns:
+        int: the slot id, `ANY_SLOT` if every slot is busy
+        """
+        slot = self._sessions.get(session_id)
+        if slot is not None:
+            self._sessions.move_to_end(session_id)
+            if not self._active[slot]:
+                self._hits.inc()
+                self._active[slot] += 1
+                return slot
+            # Another generation of the same session is running, don't queue behind it
+            self._misses.inc()
+            return ANY_SLOT
+
+        self._misses.inc()
+        slot = self._take_slot()
+        if slot == ANY_SLOT:
+            return ANY_SLOT
+        self._sessions[session_id] = slot
+        self._active[slot] += 1
+        return slot
+
+    def release(self, slot: int) -> None:
+        """
+        Mark the generation on the slot as finished
+        """
+        if slot == ANY_SLOT or not self._active[slot]:
+            return
+        self._active[slot] -= 1
+
+    def _take_slot(self) -> int:
+        assigned = set(self._sessions.values())
+        for slot in range(self.n_slots):
+            if slot not in assigned:
+                return slot
+
+        for session_id, slot in self._sessions.items():
+            if not self._active[slot]:
+                del self._sessions[session_id]
+                self._evictions.inc()
+                return slot
+        return ANY_SLOT
@@ -0,0 +1,106 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import hashlib
+from collections.abc import Sequence
+
+import httpx
+import loguru
+
+from src.config.settings.const import TOKEN_COUNT_CACHE_SIZE, TOKENIZE_MAX_CONCURRENCY
+from src.repository.engine_pool import inference_pool
+from src.utilities.cache.lru_cache import LRUCache
+from src.utilities.httpkit.httpx_kit import UPSTREAM_INFERENCE, httpx_kit
+
+
+class TokenCounter:
+    """
+    Count tokens with the `/tokenize` endpoint of the inference engines
+
+    Counts are cached per text, a message is only sent to the engine the first time it is seen.
+    """
+
+    def __init__(self, cache_size: int = TOKEN_COUNT_CACHE_SIZE, max_concurrency: int = TOKENIZE_MAX_CONCURRENCY):
+        self.cache = LRUCache(maxsize=cache_size)
+        self.max_concurrency = max_concurrency
+        self._semaphore: asyncio.Semaphore | None = None
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        """
+        Conservative estimation, 3 characters per token where the models average about 4
+
+        Used when the engine can't be reached or shouldn't be waited for.
+        """
+        return len(text) // 3 + 1
+
+    def cached(self, text: str) -> int | None:
+        return self.cache.get(self.text_hash(text))
+
+    def estimate_many(self, texts: Sequence[str]) -> list[int]:
+        """
+        Count without the engine: the count cached for a text seen before, otherwise `estimate`
+
+        For the hot path of a chat turn, where a `/tokenize` request would delay the first token.
+        """
+        return [n_tokens if (n_tokens := self.cached(text)) is not None else self.estimate(text) for text in texts]
+
+    async def count(self, text: str, fallback: bool = True) -> int | None:
+        """
+        Count the tokens of the text
+
+        Args:
+        text (str): text to count
+        fallback (bool): estimate the count if the engine can't be reached, otherwise return None
+
+        Returns:
+        int | None: number of tokens
+        """
+        key = self.text_hash(text)
+        n_tokens = self.cache.get(key)
+        if n_tokens is not None:
+            return n_tokens
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            async with self._semaphore:
+                res = await httpx_kit.client(UPSTREAM_INFERENCE).post(
+                    inference_pool.select().tokenize_url,
+                    headers={"Content-Type": "application/json"},
+                    json={"content": text},
+                )
+            res.raise_for_status()
+            n_tokens = len(res.json().get("tokens", []))
+        except (httpx.HTTPError, ValueError) as e:
+            loguru.logger.warning(f"Tokenizer --- Failed to count tokens: {e}")
+            return self.estimate(text) if fallback else None
+
+        self.cache.put(key, n_tokens)
+        return n_tokens
+
+    async def count_many(self, texts: Sequence[str], fallback: bool = True) -> list[int | None]:
+        """
+        Count the tokens of many texts, cache misses are requested concurrently
+        """
+        return list(await asyncio.gather(*(self.count(text, fallback=fallback) for text in texts)))
+
+
+token_counter: TokenCounter = TokenCounter()
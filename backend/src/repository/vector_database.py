@@ -1,12 +1,19 @@
+import asyncio
 import time
+from concurrent.futures import ThreadPoolExecutor
+
 import loguru
 
-from pymilvus import MilvusClient
+from pymilvus import DataType, MilvusClient
 from src.config.manager import settings
-from src.config.settings.const import DEFAULT_COLLECTION, DEFAULT_DIM
+from src.config.settings.const import DEFAULT_COLLECTION, DEFAULT_DIM, MILVUS_PAGE_SIZE
+from src.repository.numpy_vector_store import NumpyVectorStore
+from src.repository.rag.chunking import CHUNK_INDEX_FIELD, PASSAGE_FIELD, SOURCE_FIELD
+from src.repository.vector_store import CONTENT_HASH_FIELD, VECTOR_FIELD, BaseVectorStore, IndexConfig
+from src.utilities.metrics.registry import metrics
 
 
-class MilvusHelper:
+class MilvusHelper(BaseVectorStore):
     def __init__(self):
         for _ in range(3):
             try:
@@ -22,6 +29,16 @@ class MilvusHelper:
         else:
             raise Exception(f"Failed to connect to Milvus after 3 attempts:{err}")
 
+        # MilvusClient is blocking, searches run on their own threads instead of the event loop
+        self.search_executor = ThreadPoolExecutor(
+            max_workers=settings.MILVUS_SEARCH_WORKERS, thread_name_prefix="milvus-search"
+        )
+        # Collection name -> its index, to pick the search params
+        self.index_configs: dict[str, IndexConfig] = {}
+        self._search_in_flight = metrics.gauge("vector_search_in_flight", "Vector searches submitted to the threads")
+        self._search_queue_seconds = metrics.histogram("vector_search_queue_seconds", "Wait for a search thread")
+        self._search_seconds = metrics.histogram("vector_search_seconds", "Duration of the vector searches")
+
     async def load_dataset(self, *args, **kwargs):
         return
 
@@ -37,50 +54,182 @@ class MilvusHelper:
 
         return
 
+    def has_collection(self, collection_name: str) -> bool:
+        return self.client.has_collection(collection_name)
+
+    def collection_dimension(self, collection_name: str) -> int | None:
+        fields = self.client.describe_collection(collection_name).get("fields", [])
+        for field in fields:
+            if field.get("name") == VECTOR_FIELD:
+                dimension = field.get("params", {}).get("dim")
+                return None if dimension is None else int(dimension)
+        return None
+
+    def load_collection(self, collection_name: str) -> None:
+        # Loading a loaded collection is a no-op for Milvus
+        self.client.load_collection(collection_name)
+
     def create_collection(self, collection_name=DEFAULT_COLLECTION, dimension=DEFAULT_DIM, recreate=True):
-        if recreate and self.client.has_collection(collection_name):
+        """
+        Create the collection with an explicit ANN index and load it, so it can be searched right away
+
+        The index is built with the parameters of `IndexConfig`, searches use the matching `ef` or `nprobe`.
+        With the `Bounded` consistency level, searches don't wait for the inserts of the last seconds.
+        An existing collection is dropped first, or only loaded without `recreate`.
+        """
+        if self.client.has_collection(collection_name):
+            if not recreate:
+                self.load_collection(collection_name)
+                return
             loguru.logger.info(f"Vector Databse --- Milvus: collection {collection_name} exist, dropping..")
             self.client.drop_collection(collection_name)
 
+        index_config = IndexConfig()
+        schema = self.client.create_schema(auto_id=True, enable_dynamic_field=True)
+        schema.add_field("id", DataType.INT64, is_primary=True)
+        schema.add_field(VECTOR_FIELD, DataType.FLOAT_VECTOR, dim=dimension)
+        index_params = self.client.prepare_index_params()
+        index_params.add_index(
+            field_name=VECTOR_FIELD,
+            index_type=index_config.index_type,
+            index_name=VECTOR_FIELD,
+            metric_type=index_config.metric_type,
+            params=index_config.build_params,
+        )
+        # Creating the collection with its index params also builds the index and loads the collection
         self.client.create_collection(
             collection_name=collection_name,
-            dimension=dimension,
-            auto_id=True,  # enable auto id
-            enable_dynamic_field=True,  # enable dynamic field
-            vector_field_name="question_embedding",  # map vector field name and embedding field name
-            consistency_level="Strong",  # To enable search with latest data
+            schema=schema,
+            index_params=index_params,
+            consistency_level=settings.MILVUS_CONSISTENCY_LEVEL,
         )
-        loguru.logger.info(f"Vector Database --- Milvus: collection {collection_name} created")
+        self.index_configs[collection_name] = index_config
+        loguru.logger.info(
+            f"Vector Database --- Milvus: collection {collection_name} created with {index_config.index_type} index"
+        )
+
+    def index_config(self, collection_name: str) -> IndexConfig:
+        """
+        Index of the collection, described by Milvus for the collections created by another process
+        """
+        index_config = self.index_configs.get(collection_name)
+        if index_config is None:
+            try:
+                index = self.client.describe_index(collection_name, index_name=VECTOR_FIELD)
+                index_config = IndexConfig(index_type=index.get("index_type", "AUTOINDEX"))
+            except Exception as e:
+                # e.g. collections created before the explicit indexes, with an unnamed AUTOINDEX
+                loguru.logger.warning(f"Vector Database --- Milvus: no index {VECTOR_FIELD} on {collection_name}: {e}")
+                index_config = IndexConfig(index_type="AUTOINDEX")
+            self.index_configs[collection_name] = index_config
+        return index_config
 
     def insert_list(self, collection_name: str = DEFAULT_COLLECTION, data_list: list = []) -> dict:
         try:
             return self.client.insert(collection_name=collection_name, data=data_list)
         except Exception as e:
-            loguru.logger.info(f"Vector Databse --- Error: {e}")
+            # The ingestion must fail, it would otherwise delete the entities replaced by these rows
+            loguru.logger.error(f"Vector Databse --- Error: {e}")
+            raise
+
+    def delete_ids(self, collection_name: str, ids: list) -> int:
+        for start in range(0, len(ids), MILVUS_PAGE_SIZE):
+            self.client.delete(collection_name=collection_name, ids=ids[start : start + MILVUS_PAGE_SIZE])
+        return len(ids)
+
+    def content_hashes(self, collection_name: str) -> dict[str, list]:
+        """
+        Read the hashes a page at a time, ordered by primary key
+        """
+        hashes: dict[str, list] = {}
+        last_id = None
+        while True:
+            page = self.client.query(
+                collection_name=collection_name,
+                filter="id >= 0" if last_id is None else f"id > {last_id}",
+                output_fields=["id", CONTENT_HASH_FIELD],
+                limit=MILVUS_PAGE_SIZE,
+                # Reloads must see the rows of the previous load, even if it just finished
+                consistency_level="Strong",
+            )
+            for entity in page:
+                hashes.setdefault(entity.get(CONTENT_HASH_FIELD) or "", []).append(entity["id"])
+            if len(page) < MILVUS_PAGE_SIZE:
+                return hashes
+            last_id = max(entity["id"] for entity in page)
 
-    def search(self, data, n_results, collection_name=DEFAULT_COLLECTION):
-        search_params = {"metric_type": "COSINE", "params": {}}
+    def search_hits(self, data, n_results, collection_name=DEFAULT_COLLECTION) -> list[dict] | None:
         try:
+            search_params = self.index_config(collection_name).search_params(limit=n_results)
             res = self.client.search(
                 collection_name=collection_name,
                 data=[data],
                 limit=n_results,
                 search_params=search_params,
-                output_fields=["answer"],
+                output_fields=[PASSAGE_FIELD, SOURCE_FIELD, CHUNK_INDEX_FIELD],
             )
 
             loguru.logger.info(f"Vector Database --- Result: {res}")
-            sentences = []
-            for hits in res:
-                for hit in hits:
-                    sentences.append(hit.get("entity").get("answer"))
-            return sentences
+            # With the COSINE metric Milvus returns the similarity as the distance
+            return [
+                {
+                    "id": hit.get("id"),
+                    "similarity": hit.get("distance"),
+                    "answer": hit.get("entity").get(PASSAGE_FIELD),
+                    "source_id": hit.get("entity").get(SOURCE_FIELD),
+                    "chunk_index": hit.get("entity").get(CHUNK_INDEX_FIELD),
+                }
+                for hits in res
+                for hit in hits
+            ]
         except Exception as e:
             loguru.logger.error(e)
         return None
 
-    def create_index(self, index_name, index_params, collection_name=DEFAULT_COLLECTION):
-        self.client.create_index(collection_name, index_name, index_params)
+    async def async_search(self, data, n_results, collection_name=DEFAULT_COLLECTION):
+        """
+        Search without blocking the event loop
+
+        The search runs on `search_executor`, at most `MILVUS_SEARCH_WORKERS` at once, the others wait in its queue.
+
+        Args:
+        data (list[float]): query embedding
+        n_results (int): number of results
+        collection_name (str): collection to search
+
+        Returns:
+        list[str] | None: the answers of the closest entities, None on error
+        """
+        return await self._run_search(self.search, data, n_results, collection_name)
+
+    async def async_search_hits(self, data, n_results, collection_name=DEFAULT_COLLECTION) -> list[dict] | None:
+        """
+        `search_hits` without blocking the event loop, see `async_search`
+        """
+        return await self._run_search(self.search_hits, data, n_results, collection_name)
+
+    async def _run_search(self, search, data, n_results, collection_name):
+        submitted = time.perf_counter()
+
+        def timed_search():
+            started = time.perf_counter()
+            self._search_queue_seconds.observe(started - submitted)
+            try:
+                return search(data, n_results, collection_name=collection_name)
+            finally:
+                self._search_seconds.observe(time.perf_counter() - started)
+
+        self._search_in_flight.inc()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.search_executor, timed_search)
+        finally:
+            self._search_in_flight.dec()
+
+    def shutdown(self) -> None:
+        """
+        Stop the search threads, waiting for the running searches
+        """
+        self.search_executor.shutdown(wait=True, cancel_futures=True)
 
     def _get_collection_dimension_(self, collection_name=DEFAULT_COLLECTION):
         # collection_info = self.client.get_collection(collection_name)
@@ -91,4 +240,17 @@ class MilvusHelper:
         self.client.close()
 
 
-vector_db: MilvusHelper = MilvusHelper()
+def create_vector_store(kind: str = settings.VECTOR_STORE) -> BaseVectorStore:
+    """
+    Create the vector store selected by `VECTOR_STORE`, Milvus is only connected when it is selected
+    """
+    match kind:
+        case "numpy":
+            return NumpyVectorStore(path=settings.VECTOR_STORE_PATH, use_ivf=settings.VECTOR_STORE_IVF)
+        case "milvus":
+            return MilvusHelper()
+        case _:
+            raise ValueError(f"Unknown vector store {kind!r}, expected 'milvus' or 'numpy'")
+
+
+vector_db: BaseVectorStore = create_vector_store()
@@ -0,0 +1,205 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import dataclasses
+import hashlib
+import json
+
+import loguru
+
+from src.config.manager import settings
+from src.config.settings.const import DEFAULT_COLLECTION, DEFAULT_DIM
+
+VECTOR_FIELD = "question_embedding"
+CONTENT_HASH_FIELD = "content_hash"
+
+
+def content_hash(row: dict, model: str, chunking: str = "") -> str:
+    """
+    Hash of the fields of a row, of the model embedding it and of the chunking settings, stored with the entity so
+    an unchanged row isn't embedded and inserted again when its dataset is reloaded
+
+    The vector and the hash itself are left out, the fields are serialized with sorted keys. The chunks of a row
+    share its hash.
+    """
+    fields = {k: v for k, v in row.items() if k not in (VECTOR_FIELD, CONTENT_HASH_FIELD)}
+    content = json.dumps([model, chunking, fields], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+@dataclasses.dataclass(frozen=True)
+class IndexConfig:
+    """
+    ANN index of a collection and the matching search parameters
+
+    Attributes:
+    -----------
+    index_type: str
+        `HNSW`, `IVF_FLAT` or `FLAT`
+    metric_type: str
+        Similarity metric, the stores return cosine similarities
+    hnsw_m: int
+        Graph degree of HNSW, more is more accurate and uses more memory
+    hnsw_ef_construction: int
+        Candidates considered while building the HNSW graph
+    hnsw_ef: int
+        Candidates considered while searching the HNSW graph, at least the number of results
+    ivf_nlist: int
+        Clusters of IVF_FLAT
+    ivf_nprobe: int
+        Clusters of IVF_FLAT searched per query
+    """
+
+    index_type: str = settings.MILVUS_INDEX_TYPE
+    metric_type: str = "COSINE"
+    hnsw_m: int = settings.MILVUS_HNSW_M
+    hnsw_ef_construction: int = settings.MILVUS_HNSW_EF_CONSTRUCTION
+    hnsw_ef: int = settings.MILVUS_HNSW_EF
+    ivf_nlist: int = settings.MILVUS_IVF_NLIST
+    ivf_nprobe: int = settings.MILVUS_IVF_NPROBE
+
+    @property
+    def build_params(self) -> dict:
+        match self.index_type:
+            case "HNSW":
+                return {"M": self.hnsw_m, "efConstruction": self.hnsw_ef_construction}
+            case "IVF_FLAT":
+                return {"nlist": self.ivf_nlist}
+            case _:
+                return {}
+
+    def search_params(self, limit: int) -> dict:
+        """
+        Parameters of a search returning `limit` results
+        """
+        match self.index_type:
+            case "HNSW":
+                params = {"ef": max(self.hnsw_ef, limit)}
+            case "IVF_FLAT":
+                params = {"nprobe": min(self.ivf_nprobe, self.ivf_nlist)}
+            case _:
+                params = {}
+        return {"metric_type": self.metric_type, "params": params}
+
+
+class BaseVectorStore:
+    """
+    Interface of the vector stores answering the RAG questions
+
+    Entities are dicts holding the vector under `VECTOR_FIELD` and any other field, e.g. `question` and `answer`.
+    Similarities are cosine similarities, higher is closer.
+    """
+
+    def create_collection(self, collection_name=DEFAULT_COLLECTION, dimension=DEFAULT_DIM, recreate=True):
+        raise NotImplementedError
+
+    def has_collection(self, collection_name: str) -> bool:
+        raise NotImplementedError
+
+    def collection_dimension(self, collection_name: str) -> int | None:
+        """
+        Dimension of the vectors of an existing collection, None if it can't be read
+        """
+        raise NotImplementedError
+
+    def load_collection(self, collection_name: str) -> None:
+        """
+        Make the collection ready to be searched
+        """
+        return None
+
+    def ensure_collection(self, collection_name=DEFAULT_COLLECTION, dimension=DEFAULT_DIM) -> bool:
+        """
+        Create the collection only if it is missing, otherwise load it as is
+
+        Restarts and extra workers keep the loaded data. A collection whose vectors don't have `dimension`, e.g.
+        after the embedding model changed, can't be searched with the new embeddings and is recreated.
+
+        Returns:
+        bool: True if the collection was (re)created
+        """
+        if self.has_collection(collection_name):
+            existing = self.collection_dimension(collection_name)
+            if existing == dimension:
+                self.load_collection(collection_name)
+                loguru.logger.info(f"Vector Database --- collection {collection_name} exists, loaded")
+                return False
+            loguru.logger.error(
+                f"Vector Database --- collection {collection_name} has dimension {existing}, expected {dimension}, "
+                "recreating"
+            )
+            self.create_collection(collection_name, dimension=dimension, recreate=True)
+        else:
+            self.create_collection(collection_name, dimension=dimension, recreate=False)
+        return True
+
+    def insert_list(self, collection_name: str = DEFAULT_COLLECTION, data_list: list = []) -> dict:
+        """
+        Insert entities
+
+        Returns:
+        dict: `{"insert_count": int, "ids": list}`
+        """
+        raise NotImplementedError
+
+    def delete_ids(self, collection_name: str, ids: list) -> int:
+        """
+        Delete entities
+
+        Returns:
+        int: number of entities deleted
+        """
+        raise NotImplementedError
+
+    def content_hashes(self, collection_name: str) -> dict[str, list]:
+        """
+        Ids of the entities of every content hash, see `content_hash`
+
+        Returns:
+        dict[str, list]: hash -> ids, the entities inserted without a hash are under `""`
+        """
+        raise NotImplementedError
+
+    def search_hits(self, data, n_results, collection_name=DEFAULT_COLLECTION) -> list[dict] | None:
+        """
+        Search the closest entities together with their scores
+
+        Returns:
+        list[dict] | None: `{"id", "similarity", "answer", "source_id", "chunk_index"}` of every hit, most similar
+        first, None on error. `source_id` and `chunk_index` are None for the entities that aren't chunks
+        """
+        raise NotImplementedError
+
+    def search(self, data, n_results, collection_name=DEFAULT_COLLECTION):
+        hits = self.search_hits(data, n_results, collection_name=collection_name)
+        return None if hits is None else [hit["answer"] for hit in hits]
+
+    async def async_search(self, data, n_results, collection_name=DEFAULT_COLLECTION):
+        """
+        Search without blocking the event loop
+
+        Returns:
+        list[str] | None: the answers of the closest entities, None on error
+        """
+        return self.search(data, n_results, collection_name=collection_name)
+
+    async def async_search_hits(self, data, n_results, collection_name=DEFAULT_COLLECTION) -> list[dict] | None:
+        """
+        `search_hits` without blocking the event loop
+        """
+        return self.search_hits(data, n_results, collection_name=collection_name)
+
+    def shutdown(self) -> None:
+        return None
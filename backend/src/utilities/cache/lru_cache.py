@@ -0,0 +1,94 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import time
+import typing
+
+
+class LRUCache:
+    """
+    A size-bounded mapping that evicts the least recently used entry
+
+    With a `ttl`, entries also expire that many seconds after they were put. Expired entries are dropped when they
+    are read, or evicted like any other entry.
+
+    It isn't thread safe, all callers run on the event loop.
+
+    Attributes:
+    -----------
+    maxsize: int
+        Max number of entries
+    ttl: float | None
+        Seconds an entry stays valid, None to keep it until it is evicted
+    hits: int
+        Number of `get` calls that found the key
+    misses: int
+        Number of `get` calls that didn't find the key
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None, clock: typing.Callable[[], float] = time.monotonic):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        # key -> (expiry or None, value)
+        self._data: collections.OrderedDict[typing.Hashable, tuple[float | None, typing.Any]] = (
+            collections.OrderedDict()
+        )
+
+    def _expired(self, expires_at: float | None) -> bool:
+        return expires_at is not None and expires_at <= self._clock()
+
+    def get(self, key: typing.Hashable, default: typing.Any = None) -> typing.Any:
+        try:
+            expires_at, value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        if self._expired(expires_at):
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: typing.Hashable, value: typing.Any) -> None:
+        self._data[key] = (None if self.ttl is None else self._clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: typing.Hashable, default: typing.Any = None) -> typing.Any:
+        item = self._data.pop(key, None)
+        if item is None or self._expired(item[0]):
+            return default
+        return item[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: typing.Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and not self._expired(item[0])
+
+    def __len__(self) -> int:
+        return len(self._data)
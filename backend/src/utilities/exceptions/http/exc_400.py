@@ -11,7 +11,9 @@ from src.utilities.messages.exceptions.http.exc_details import (
     http_400_sigin_credentials_details,
     http_400_signup_credentials_details,
     http_400_username_details,
+    http_400_file_format_details,
     http_400_file_name_details,
+    http_400_train_data_details,
 )
 
 
@@ -56,3 +58,17 @@ async def http_400_exc_bad_file_name_request(file_name: str) -> Exception:
         status_code=fastapi.status.HTTP_400_BAD_REQUEST,
         detail=http_400_file_name_details(),
     )
+
+
+async def http_400_exc_no_train_data_request() -> Exception:
+    return fastapi.HTTPException(
+        status_code=fastapi.status.HTTP_400_BAD_REQUEST,
+        detail=http_400_train_data_details(),
+    )
+
+
+async def http_400_exc_bad_file_format_request(file_name: str, formats: list[str]) -> Exception:
+    return fastapi.HTTPException(
+        status_code=fastapi.status.HTTP_400_BAD_REQUEST,
+        detail=http_400_file_format_details(file_name=file_name, formats=formats),
+    )
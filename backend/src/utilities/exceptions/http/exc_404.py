@@ -7,6 +7,7 @@ import fastapi
 from src.utilities.messages.exceptions.http.exc_details import (
     http_404_email_details,
     http_404_id_details,
+    http_404_job_details,
     http_404_username_details,
     http_404_uuid_details,
 )
@@ -38,3 +39,10 @@ async def http_404_exc_uuid_not_found_request(uuid: str) -> Exception:
         status_code=fastapi.status.HTTP_404_NOT_FOUND,
         detail=http_404_uuid_details(uuid=uuid),
     )
+
+
+async def http_404_exc_job_not_found_request(job_id: str) -> Exception:
+    return fastapi.HTTPException(
+        status_code=fastapi.status.HTTP_404_NOT_FOUND,
+        detail=http_404_job_details(job_id=job_id),
+    )
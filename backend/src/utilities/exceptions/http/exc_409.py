@@ -0,0 +1,15 @@
+"""
+The HTTP 409 Conflict response status code indicates a request conflict with the current state of the target
+resource.
+"""
+
+import fastapi
+
+from src.utilities.messages.exceptions.http.exc_details import http_409_dataset_loading_details
+
+
+async def http_409_exc_dataset_loading_request(dataset_name: str, job_id: str) -> Exception:
+    return fastapi.HTTPException(
+        status_code=fastapi.status.HTTP_409_CONFLICT,
+        detail=http_409_dataset_loading_details(dataset_name=dataset_name, job_id=job_id),
+    )
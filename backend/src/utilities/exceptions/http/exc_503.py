@@ -0,0 +1,16 @@
+"""
+The HTTP 503 Service Unavailable server error response code indicates that the server is not ready
+to handle the request, e.g. because it is overloaded.
+"""
+
+import fastapi
+
+from src.utilities.messages.exceptions.http.exc_details import http_503_service_unavailable_details
+
+
+async def http_503_exc_service_unavailable(retry_after: int) -> Exception:
+    return fastapi.HTTPException(
+        status_code=fastapi.status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=http_503_service_unavailable_details(),
+        headers={"Retry-After": str(retry_after)},
+    )
@@ -30,6 +30,14 @@ class DatasetFormatter:
         """
         return name.replace("/", "_")
 
+    @classmethod
+    def format_file_dataset_by_name(cls, name: str):
+        """
+        Replace the "/" and "." in the name of a dataset file with "_", e.g. for `faq.csv`, Milvus rejects "."
+
+        """
+        return cls.format_dataset_by_name(name).replace(".", "_")
+
     @classmethod
     def format_dataset_name_back(cls, name: str):
         """
@@ -14,8 +14,63 @@
 # limitations under the License.
 
 
+import dataclasses
+
 import httpx
 
+from src.config.manager import settings
+
+UPSTREAM_INFERENCE = "inference"
+UPSTREAM_EMBEDDING = "embedding"
+
+
+@dataclasses.dataclass(frozen=True)
+class UpstreamConfig:
+    """
+    Connection pool and timeouts of the client of one upstream
+    """
+
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    connect_timeout: float
+    read_timeout: float
+    pool_timeout: float
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout, read=self.read_timeout, write=self.read_timeout, pool=self.pool_timeout
+        )
+
+
+UPSTREAMS: dict[str, UpstreamConfig] = {
+    UPSTREAM_INFERENCE: UpstreamConfig(
+        max_connections=settings.INFERENCE_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.INFERENCE_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+        read_timeout=settings.INFERENCE_HTTP_READ_TIMEOUT,
+        pool_timeout=settings.HTTP_POOL_TIMEOUT,
+    ),
+    UPSTREAM_EMBEDDING: UpstreamConfig(
+        max_connections=settings.EMBEDDING_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.EMBEDDING_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+        read_timeout=settings.EMBEDDING_HTTP_READ_TIMEOUT,
+        pool_timeout=settings.HTTP_POOL_TIMEOUT,
+    ),
+}
+
 
 class HttpxKit:
     """
@@ -23,14 +78,29 @@ class HttpxKit:
 
     We only create one client every time is efficient and easy to manage
 
-    Note: We don't close client because we want to keep the connection alive, I don't know if it will cause any problem in more bigger scale
+    Every upstream (the inference engines, the embedding engines) gets its own async client with its own connection
+    pool, so short embedding requests never wait for a connection held by a long completion stream. Connections
+    are kept alive between requests, the clients are closed on shutdown.
     """
 
-    def __init__(self):
+    def __init__(self, upstreams: dict[str, UpstreamConfig] = UPSTREAMS):
         self.async_client = self.init_async_client()
         self.sync_client = self.init_sync_client()
+        self.upstream_clients = {name: self.init_async_client(config) for name, config in upstreams.items()}
 
-    def init_async_client(self) -> httpx.AsyncClient:
+    def client(self, upstream: str) -> httpx.AsyncClient:
+        """
+        Get the async client of an upstream
+
+        Args:
+        upstream (str): `UPSTREAM_INFERENCE` or `UPSTREAM_EMBEDDING`
+
+        Returns:
+        httpx.AsyncClient: the client of the upstream, the default client for an unknown upstream
+        """
+        return self.upstream_clients.get(upstream, self.async_client)
+
+    def init_async_client(self, config: UpstreamConfig | None = None) -> httpx.AsyncClient:
         """
         Create async client by using Singleletton pattern
 
@@ -54,10 +124,15 @@ class HttpxKit:
             except httpx.HTTPStatusError as e:
                 loguru.logger.error(f"Error response {e.response.status_code} while requesting {e.request.url!r}.")
 
+        Args:
+        config (UpstreamConfig | None): pool and timeouts of the upstream, the httpx defaults if None
+
         Returns:
         httpx.AsyncClient: An async client
         """
-        return httpx.AsyncClient()
+        if config is None:
+            return httpx.AsyncClient()
+        return httpx.AsyncClient(limits=config.limits, timeout=config.timeout)
 
     def init_sync_client(self):
         """
@@ -70,10 +145,12 @@ class HttpxKit:
 
     async def teardown_async_client(self) -> bool:
         """
-        Close the async client
+        Close the async clients
         """
-        await self.async_client.aclose()
-        return self.async_client.is_closed
+        clients = [self.async_client, *self.upstream_clients.values()]
+        for client in clients:
+            await client.aclose()
+        return all(client.is_closed for client in clients)
 
     def teardown_sync_client(self) -> bool:
         """
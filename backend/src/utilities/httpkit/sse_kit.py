@@ -0,0 +1,366 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import contextlib
+import dataclasses
+import json
+from collections.abc import AsyncGenerator, AsyncIterator
+from typing import Any
+
+from src.config.settings.const import SSE_MAX_BUFFER_SIZE
+
+
+class SSEParseError(Exception):
+    """
+    Throw an exception when the upstream stream can't be parsed as server-sent events.
+    """
+
+
+@dataclasses.dataclass(slots=True)
+class ServerSentEvent:
+    """
+    A single dispatched server-sent event
+
+    Attributes:
+    -----------
+    data: str
+        The data lines of the event joined by "\\n"
+    event: str | None
+        The event type, llama.cpp doesn't set it
+    """
+
+    data: str
+    event: str | None = None
+
+
+class SSEStreamParser:
+    """
+    Incremental parser for `text/event-stream` bodies
+
+    httpx hands back chunks whose boundaries are arbitrary, a `data:` line can be split across several chunks.
+    The parser keeps the unconsumed tail in a bounded buffer and remembers where it stopped scanning, so every
+    byte is only scanned once no matter how the stream is chunked.
+
+    Usage:
+
+        parser = SSEStreamParser()
+        async for chunk in response.aiter_bytes():
+            for sse in parser.feed(chunk):
+                ...
+    """
+
+    def __init__(self, max_buffer_size: int = SSE_MAX_BUFFER_SIZE):
+        self.max_buffer_size = max_buffer_size
+        self._buffer = bytearray()
+        self._scan_pos = 0
+        self._data_lines: list[bytes] = []
+        self._event: str | None = None
+
+    def feed(self, chunk: bytes) -> list[ServerSentEvent]:
+        """
+        Feed raw bytes and return the events completed by them
+
+        Args:
+        chunk (bytes): raw bytes read from the stream
+
+        Returns:
+        list[ServerSentEvent]: events dispatched by this chunk, can be empty
+        """
+        self._buffer += chunk
+        events: list[ServerSentEvent] = []
+        line_start = 0
+
+        while True:
+            line_end = self._buffer.find(b"\n", self._scan_pos)
+            if line_end == -1:
+                break
+            self._scan_pos = line_end + 1
+            line = bytes(self._buffer[line_start:line_end])
+            line_start = self._scan_pos
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            event = self._process_line(line)
+            if event is not None:
+                events.append(event)
+
+        if line_start:
+            del self._buffer[:line_start]
+            self._scan_pos -= line_start
+
+        if len(self._buffer) > self.max_buffer_size:
+            raise SSEParseError(f"SSE line exceeds {self.max_buffer_size} bytes without a line break")
+
+        return events
+
+    def _process_line(self, line: bytes) -> ServerSentEvent | None:
+        if not line:
+            return self._dispatch()
+        if line.startswith(b":"):
+            # Comment line, used as keep-alive by some servers
+            return None
+
+        field, _, value = line.partition(b":")
+        if value.startswith(b" "):
+            value = value[1:]
+
+        match field:
+            case b"data":
+                self._data_lines.append(value)
+            case b"event":
+                self._event = value.decode("utf-8")
+            case _:
+                # `id` and `retry` are not used by llama.cpp
+                pass
+        return None
+
+    def _dispatch(self) -> ServerSentEvent | None:
+        if not self._data_lines:
+            self._event = None
+            return None
+        event = ServerSentEvent(data=b"\n".join(self._data_lines).decode("utf-8"), event=self._event)
+        self._data_lines = []
+        self._event = None
+        return event
+
+
+@dataclasses.dataclass(slots=True)
+class CompletionEvent:
+    """
+    A typed event of the llama.cpp `/completion` stream
+
+    Attributes:
+    -----------
+    content: str
+        The token(s) generated in this event
+    stop: bool
+        Whether the generation has finished, the final event carries `timings` and `tokens_predicted`
+    id_slot: int | None
+        The llama.cpp slot that processed the request
+    payload: dict
+        The decoded event
+    data: str
+        The original JSON text, re-emitted as is to the client
+    """
+
+    content: str
+    stop: bool
+    id_slot: int | None
+    payload: dict[str, Any]
+    data: str
+
+    @classmethod
+    def from_sse(cls, sse: ServerSentEvent) -> "CompletionEvent":
+        """
+        Build a completion event from a dispatched server-sent event
+
+        Raises:
+        SSEParseError: if the event isn't a JSON object
+        """
+        try:
+            payload = json.loads(sse.data)
+        except json.JSONDecodeError as e:
+            raise SSEParseError(f"Invalid JSON in completion event: {e}") from e
+        if not isinstance(payload, dict):
+            raise SSEParseError("Completion event must be a JSON object")
+
+        return cls(
+            content=payload.get("content", ""),
+            stop=bool(payload.get("stop", False)),
+            id_slot=payload.get("id_slot", payload.get("slot_id")),
+            payload=payload,
+            data=sse.data,
+        )
+
+    @classmethod
+    def from_payload(cls, payload: dict[str, Any]) -> "CompletionEvent":
+        """
+        Build a completion event that didn't come from the engine, e.g. an answer served from a cache
+        """
+        return cls(
+            content=payload.get("content", ""),
+            stop=bool(payload.get("stop", False)),
+            id_slot=payload.get("id_slot"),
+            payload=payload,
+            data=json.dumps(payload, separators=(",", ":")),
+        )
+
+    @property
+    def frame(self) -> str:
+        """
+        The well-formed SSE frame sent to the client
+        """
+        return f"data: {self.data}\n\n"
+
+    @property
+    def timings(self) -> dict[str, Any] | None:
+        return self.payload.get("timings")
+
+    @property
+    def tokens_predicted(self) -> int | None:
+        return self.payload.get("tokens_predicted")
+
+    @property
+    def tokens_evaluated(self) -> int | None:
+        return self.payload.get("tokens_evaluated")
+
+
+class CompletionSummary:
+    """
+    Accumulate the streamed completion, so the answer is available without a second pass over the frames
+
+    Attributes:
+    -----------
+    tokens_streamed: int
+        Number of content events seen so far
+    final: CompletionEvent | None
+        The `stop` event with `timings` and `tokens_predicted`
+    """
+
+    def __init__(self):
+        self._parts: list[str] = []
+        self.tokens_streamed: int = 0
+        self.final: CompletionEvent | None = None
+
+    def add(self, event: CompletionEvent) -> None:
+        if event.content:
+            self._parts.append(event.content)
+            self.tokens_streamed += 1
+        if event.stop:
+            self.final = event
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.final is not None
+
+    @property
+    def timings(self) -> dict[str, Any] | None:
+        return self.final.timings if self.final else None
+
+    @property
+    def tokens_predicted(self) -> int:
+        if self.final and self.final.tokens_predicted is not None:
+            return self.final.tokens_predicted
+        return self.tokens_streamed
+
+
+async def iter_completion_events(chunks: AsyncIterator[bytes], parser: SSEStreamParser | None = None):
+    """
+    Turn the raw byte chunks of a `/completion` stream into typed events
+
+    Args:
+    chunks (AsyncIterator[bytes]): usually `response.aiter_bytes()`
+    parser (SSEStreamParser): the parser to use, a new one by default
+
+    Returns:
+    AsyncGenerator[CompletionEvent, None]: typed completion events
+    """
+    parser = parser or SSEStreamParser()
+    async for chunk in chunks:
+        for sse in parser.feed(chunk):
+            yield CompletionEvent.from_sse(sse)
+
+
+async def iter_frames(events: AsyncGenerator[CompletionEvent, None], coalesce_window: float = 0):
+    """
+    Re-emit typed events as SSE frames for `StreamingResponse`
+
+    Every yielded string becomes one write to the client. With a `coalesce_window` the frames arriving within the
+    window after a buffered frame are joined into one write. The first frame and the `stop` frame are always
+    written at once, so the time to the first token and to the end of the answer don't change.
+
+    Args:
+    events (AsyncGenerator[CompletionEvent, None]): typed completion events
+    coalesce_window (float): seconds a frame may wait for the following ones, 0 to write every frame on its own
+
+    Returns:
+    AsyncGenerator[str, None]: SSE frames
+    """
+    # Closing the frames closes the events too, down to the stream of the inference engine
+    async with contextlib.aclosing(events):
+        if coalesce_window <= 0:
+            async for event in events:
+                yield event.frame
+            return
+
+        async for frames in _iter_coalesced_frames(events, coalesce_window):
+            yield frames
+
+
+async def _iter_coalesced_frames(events: AsyncGenerator[CompletionEvent, None], window: float):
+    loop = asyncio.get_running_loop()
+    buffer: list[str] = []
+    # The buffer must be written without waiting for the window: first frame, stop frame
+    urgent = False
+    finished = False
+    # Resolved by the producer or by the window timer, cheaper than a timeout cancelling the wait
+    waiter: asyncio.Future | None = None
+    wait_for_any = False
+
+    def wake() -> None:
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def produce() -> None:
+        # One task reads the whole stream, so waiting for the window never interrupts the upstream generator
+        nonlocal urgent, finished
+        first = True
+        try:
+            async for event in events:
+                buffer.append(event.frame)
+                if first or event.stop:
+                    urgent = True
+                    first = False
+                    wake()
+                elif wait_for_any:
+                    wake()
+        finally:
+            finished = True
+            wake()
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            if not buffer and not finished:
+                wait_for_any = True
+                waiter = loop.create_future()
+                await waiter
+                wait_for_any = False
+            if not urgent and not finished:
+                waiter = loop.create_future()
+                timer = loop.call_later(window, wake)
+                try:
+                    await waiter
+                finally:
+                    timer.cancel()
+
+            frames = "".join(buffer)
+            buffer.clear()
+            urgent = False
+            if frames:
+                yield frames
+            elif finished:
+                break
+        # Re-raise what stopped the events
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await producer
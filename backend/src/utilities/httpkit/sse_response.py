@@ -0,0 +1,77 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import typing
+from functools import partial
+
+import anyio
+import loguru
+from starlette.background import BackgroundTask
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from src.utilities.metrics.registry import metrics
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    `StreamingResponse` for server-sent events which stops producing as soon as the client is gone
+
+    The ASGI receive channel is watched while the frames are sent. On `http.disconnect` the task sending the
+    frames is cancelled and the generator chain is closed, down to the httpx stream of the inference engine,
+    so llama.cpp stops generating and its slot is free for the next request. The background task runs in
+    every case, e.g. to release what the stream was holding.
+    """
+
+    media_type = "text/event-stream"
+
+    def __init__(
+        self,
+        content: typing.AsyncGenerator[str | bytes, None],
+        headers: typing.Mapping[str, str] | None = None,
+        background: BackgroundTask | None = None,
+    ):
+        # Buffering (the real problem) https://serverfault.com/questions/801628/for-server-sent-events-sse-what-nginx-proxy-configuration-is-appropriate/801629#
+        super().__init__(
+            content,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **(headers or {})},
+            background=background,
+        )
+        self.disconnected = False
+
+    async def listen_for_disconnect(self, receive: Receive) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                self.disconnected = True
+                break
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            async with anyio.create_task_group() as task_group:
+
+                async def wrap(func: typing.Callable[[], typing.Awaitable[None]]) -> None:
+                    await func()
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(wrap, partial(self.stream_response, send))
+                await wrap(partial(self.listen_for_disconnect, receive))
+        finally:
+            # Also closes a generator that was never started, e.g. the client left before the first frame
+            await self.body_iterator.aclose()
+            if self.disconnected:
+                metrics.counter("client_disconnects", "Streams stopped because the client disconnected").inc()
+                loguru.logger.info("Event Stream --- Client disconnected, upstream generation cancelled")
+            if self.background is not None:
+                await self.background()
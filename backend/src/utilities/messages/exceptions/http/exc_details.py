@@ -26,6 +26,10 @@ def http_404_uuid_details(uuid: str) -> str:
     return f"Either the session with uuid `{uuid}` doesn't exist, has been deleted, or you are not authorized!"
 
 
+def http_404_job_details(job_id: str) -> str:
+    return f"Either the dataset loading job `{job_id}` doesn't exist, has expired, or you are not authorized!"
+
+
 def http_404_id_details(id: int) -> str:
     return f"Either the account with id `{id}` doesn't exist, has been deleted, or you are not authorized!"
 
@@ -42,3 +46,23 @@ def http_400_file_name_details() -> str:
     return (
         "The file_name already exists. Please refrain from uploading it again, or try uploading with a different name!"
     )
+
+
+def http_400_file_format_details(file_name: str, formats: list[str]) -> str:
+    return f"The file `{file_name}` can't be loaded, only files ending with {', '.join(formats)} are supported!"
+
+
+def http_400_train_data_details() -> str:
+    return "Either `fileID` or `dataSet` is required, please tell which data to train on!"
+
+
+def http_409_dataset_loading_details(dataset_name: str, job_id: str) -> str:
+    return f"The dataset `{dataset_name}` is already being loaded by the job `{job_id}`, please wait for it!"
+
+
+def http_429_too_many_requests_details() -> str:
+    return "Too many chat requests are waiting for the inference engine, please retry later!"
+
+
+def http_503_service_unavailable_details() -> str:
+    return "The inference engine is busy, please retry later!"
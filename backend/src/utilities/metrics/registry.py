@@ -0,0 +1,136 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import threading
+
+# Seconds, from a cache lookup to a full generation
+DEFAULT_BUCKETS: tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    """
+    A monotonically increasing value
+    """
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self.value: float = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """
+    A value that can go up and down
+    """
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self.value: float = 0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+
+class Histogram:
+    """
+    Count observations in cumulative buckets, like Prometheus does
+    """
+
+    def __init__(self, name: str, description: str = "", buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum: float = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+                cumulative += bucket_count
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = self.count
+            return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+class MetricsRegistry:
+    """
+    In-process metrics of this worker
+
+    Metrics are created on first use and shared by name, so modules don't need to import each other to report
+    into the same metric. The values are exposed by `GET /api/metrics`.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Gauge | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, kind: type, name: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = kind(name, **kwargs)
+            elif not isinstance(metric, kind):
+                raise TypeError(f"Metric {name} is already registered as {type(metric).__name__}")
+            return metric
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        return self._get_or_create(Counter, name, description=description)
+
+    def gauge(self, name: str, description: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, description=description)
+
+    def histogram(self, name: str, description: str = "", buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, description=description, buckets=buckets)
+
+    def snapshot(self) -> dict[str, dict]:
+        """
+        Current values grouped by kind
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            "counters": {m.name: m.value for m in metrics if isinstance(m, Counter)},
+            "gauges": {m.name: m.value for m in metrics if isinstance(m, Gauge)},
+            "histograms": {m.name: m.snapshot() for m in metrics if isinstance(m, Histogram)},
+        }
+
+
+metrics: MetricsRegistry = MetricsRegistry()
@@ -1,3 +1,11 @@
+import os
+import tempfile
+
+# The tests that load datasets run on the in-process vector store, without a Milvus server. Set before the
+# settings are read, on the first import of `src`
+os.environ.setdefault("VECTOR_STORE", "numpy")
+os.environ.setdefault("VECTOR_STORE_PATH", tempfile.mkdtemp(prefix="vector_store_"))
+
 # import asgi_lifespan
 # import fastapi
 # import httpx
@@ -0,0 +1,107 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import unittest
+
+from src.repository.admission import AdmissionController, AdmissionRejected, engine_capacity
+from src.repository.engine_pool import EnginePool
+
+
+class TestAdmissionController(unittest.IsolatedAsyncioTestCase):
+    async def test_waiters_are_admitted_in_arrival_order(self):
+        controller = AdmissionController(max_in_flight=1, max_queue=2, max_wait=1, name="test_order")
+        running = await controller.acquire()
+        admitted = []
+
+        async def wait(name: str):
+            lease = await controller.acquire()
+            admitted.append(name)
+            return lease
+
+        first = asyncio.create_task(wait("first"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(wait("second"))
+        await asyncio.sleep(0)
+        self.assertEqual(admitted, [])
+
+        running.release()
+        # Releasing twice must not admit anybody else
+        running.release()
+        (await first).release()
+        (await second).release()
+        self.assertEqual(admitted, ["first", "second"])
+        self.assertEqual(controller._in_flight, 0)
+
+    async def test_full_queue_is_rejected_at_once(self):
+        controller = AdmissionController(max_in_flight=1, max_queue=1, max_wait=1, name="test_full")
+        running = await controller.acquire()
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+
+        with self.assertRaises(AdmissionRejected) as ctx:
+            await controller.acquire()
+        self.assertTrue(ctx.exception.queue_full)
+
+        running.release()
+        (await waiting).release()
+
+    async def test_long_wait_is_rejected(self):
+        controller = AdmissionController(max_in_flight=1, max_queue=1, max_wait=0.01, name="test_timeout")
+        running = await controller.acquire()
+        with self.assertRaises(AdmissionRejected) as ctx:
+            await controller.acquire()
+        self.assertFalse(ctx.exception.queue_full)
+        self.assertEqual(len(controller._waiters), 0)
+
+        running.release()
+        self.assertEqual(controller._in_flight, 0)
+
+    async def test_cancelled_waiter_gives_its_place_away(self):
+        controller = AdmissionController(max_in_flight=1, max_queue=2, max_wait=1, name="test_cancel")
+        running = await controller.acquire()
+        cancelled = asyncio.create_task(controller.acquire())
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        running.release()
+        (await waiting).release()
+        self.assertEqual(controller._in_flight, 0)
+
+    async def test_limit_follows_the_healthy_engines(self):
+        pool = EnginePool(["http://a:8080", "http://b:8080"], name="inference", n_slots=2)
+        controller = AdmissionController(
+            max_in_flight=lambda: engine_capacity(pool, per_engine=0), max_queue=2, max_wait=1, name="test_engines"
+        )
+        self.assertEqual(controller.limit, 4)
+        # The smallest engine sets the limit of every engine
+        pool.backends[1].slots.resize(1)
+        self.assertEqual(controller.limit, 2)
+        pool.backends[1].slots.resize(2)
+
+        pool.backends[1].healthy = False
+        leases = [await controller.acquire(), await controller.acquire()]
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        self.assertFalse(waiting.done())
+
+        # The engine is back, the waiter gets its place without a release
+        pool.backends[1].healthy = True
+        leases.append(await controller.acquire())
+        leases.append(await waiting)
+        for lease in leases:
+            lease.release()
+        self.assertEqual(controller._in_flight, 0)
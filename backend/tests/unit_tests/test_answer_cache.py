@@ -0,0 +1,74 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import unittest
+
+import numpy as np
+
+from src.repository.rag.answer_cache import SemanticAnswerCache
+from src.utilities.httpkit.sse_kit import CompletionSummary
+
+
+class TestSemanticAnswerCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = SemanticAnswerCache(enabled=True, threshold=0.95, max_answers=2)
+        self.question = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+
+    def test_similar_question_hits(self):
+        self.cache.store("ds", self.question, " RMIT is a university", generation_seconds=2.5)
+
+        cached = self.cache.lookup("ds", np.array([0.99, 0.05, 0.0]))
+        self.assertEqual(cached.answer, " RMIT is a university")
+        self.assertEqual(cached.generation_seconds, 2.5)
+        self.assertGreater(cached.similarity, 0.95)
+
+        self.assertIsNone(self.cache.lookup("ds", np.array([0.0, 1.0, 0.0])))
+        # Answers are per collection
+        self.assertIsNone(self.cache.lookup("other", self.question))
+
+    def test_events_have_the_stream_format(self):
+        self.cache.store("ds", self.question, " Yes", generation_seconds=1)
+
+        summary = CompletionSummary()
+        events = self.cache.lookup("ds", self.question).events()
+        for event in events:
+            summary.add(event)
+        self.assertEqual(summary.text, " Yes")
+        self.assertTrue(summary.is_finished)
+        self.assertEqual(
+            json.loads(events[0].frame.removeprefix("data: ")), {"content": " Yes", "stop": False, "cached": True}
+        )
+
+    def test_oldest_answer_is_replaced(self):
+        self.cache.store("ds", np.array([1.0, 0.0, 0.0]), "a", generation_seconds=1)
+        self.cache.store("ds", np.array([0.0, 1.0, 0.0]), "b", generation_seconds=1)
+        self.cache.store("ds", np.array([0.0, 0.0, 1.0]), "c", generation_seconds=1)
+
+        self.assertIsNone(self.cache.lookup("ds", np.array([1.0, 0.0, 0.0])))
+        self.assertEqual(self.cache.lookup("ds", np.array([0.0, 0.0, 1.0])).answer, "c")
+
+    def test_invalidate(self):
+        self.cache.store("ds", self.question, "a", generation_seconds=1)
+        self.cache.invalidate("ds")
+        self.assertIsNone(self.cache.lookup("ds", self.question))
+
+    def test_new_epoch_drops_answers(self):
+        self.cache.store("ds", self.question, "old", generation_seconds=1, epoch="2026-10-18T10:00:00")
+        self.assertEqual(self.cache.lookup("ds", self.question, epoch="2026-10-18T10:00:00").answer, "old")
+
+        # Another worker reloaded the dataset
+        self.assertIsNone(self.cache.lookup("ds", self.question, epoch="2026-10-18T11:00:00"))
+        self.cache.store("ds", self.question, "new", generation_seconds=1, epoch="2026-10-18T11:00:00")
+        self.assertEqual(self.cache.lookup("ds", self.question, epoch="2026-10-18T11:00:00").answer, "new")
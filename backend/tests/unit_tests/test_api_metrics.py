@@ -0,0 +1,45 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import fastapi
+from fastapi.testclient import TestClient
+from src.api.routes import metrics as metrics_route
+from src.utilities.metrics.registry import metrics
+
+
+class TestAPIMetrics(unittest.TestCase):
+    """
+    Test the metrics API
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = fastapi.FastAPI()
+        cls.app.include_router(metrics_route.router)
+        cls.client = TestClient(cls.app)
+
+    def test_api_metrics(self):
+        metrics.counter("test_api_counter").inc(2)
+        metrics.histogram("test_api_latency", buckets=(0.1, 1.0)).observe(0.5)
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["counters"]["test_api_counter"], 2)
+        self.assertEqual(
+            body["histograms"]["test_api_latency"],
+            {"count": 1, "sum": 0.5, "buckets": {"0.1": 0, "1.0": 1, "+Inf": 1}},
+        )
@@ -0,0 +1,71 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from src.repository.chat_history_writer import ChatHistoryWriter
+from src.utilities.httpkit.sse_kit import CompletionEvent
+
+
+def completion_event(content: str, stop: bool = False) -> CompletionEvent:
+    return CompletionEvent(content=content, stop=stop, id_slot=0, payload={}, data="{}")
+
+
+class OverChatHistoryWriter(ChatHistoryWriter):
+    def __init__(self):
+        super().__init__(queue_size=2, batch_size=10)
+        self.written: list[list[dict]] = []
+
+    async def _write(self, rows: list[dict]) -> None:
+        self.written.append(rows)
+
+
+class TestChatHistoryWriter(unittest.IsolatedAsyncioTestCase):
+    async def test_record_saves_turn_after_stream(self):
+        writer = OverChatHistoryWriter()
+        writer.start()
+
+        async def events():
+            yield completion_event(" Hi")
+            yield completion_event(" there")
+            yield completion_event("", stop=True)
+
+        streamed = [event async for event in writer.record(events(), session_id=7, user_message="hello")]
+        await writer.stop()
+
+        self.assertEqual(len(streamed), 3)
+        self.assertEqual(
+            writer.written,
+            [
+                [
+                    {"session_id": 7, "role": "user", "message": "hello"},
+                    {"session_id": 7, "role": "assistant", "message": " Hi there"},
+                ]
+            ],
+        )
+
+    async def test_submit_drops_when_queue_is_full(self):
+        writer = OverChatHistoryWriter()
+        self.assertFalse(writer.submit(session_id=1, user_message="a", assistant_message="b"))
+
+        writer.start()
+        # The worker doesn't run until we yield to the event loop
+        self.assertTrue(writer.submit(session_id=1, user_message="a", assistant_message="b"))
+        self.assertTrue(writer.submit(session_id=1, user_message="a", assistant_message="b"))
+        self.assertFalse(writer.submit(session_id=1, user_message="a", assistant_message="b"))
+        await writer.stop()
+
+        # Both queued turns are written in one batch
+        self.assertEqual(len(writer.written), 1)
+        self.assertEqual(len(writer.written[0]), 4)
@@ -0,0 +1,75 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from src.repository.rag.chunking import TextChunker, split_sentences
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+class TestTextChunker(unittest.TestCase):
+    def test_split_sentences(self):
+        self.assertEqual(split_sentences("One. Two!  Three?\n\nFour"), ["One.", "Two!", "Three?", "Four"])
+
+    def test_short_text_is_one_chunk(self):
+        chunker = TextChunker(max_tokens=10, overlap_tokens=2, count=count_words)
+        self.assertEqual(chunker.chunk("A short text."), ["A short text."])
+        self.assertEqual(TextChunker(max_tokens=0, count=count_words).chunk("a " * 100), ["a " * 100])
+
+    def test_chunks_overlap_by_whole_sentences(self):
+        chunker = TextChunker(max_tokens=6, overlap_tokens=2, count=count_words)
+        chunks = chunker.chunk("One two three. Four five. Six seven eight. Nine ten.")
+
+        self.assertEqual(chunks, ["One two three. Four five.", "Four five. Six seven eight.", "Nine ten."])
+        self.assertTrue(all(count_words(chunk) <= 6 for chunk in chunks))
+
+    def test_long_sentence_is_split_between_words(self):
+        chunker = TextChunker(max_tokens=4, overlap_tokens=0, count=count_words)
+        self.assertEqual(chunker.chunk("a b c d e f g h i j"), ["a b c d", "e f g h", "i j"])
+
+    def test_documents_are_chunked_and_embedded_as_is(self):
+        chunker = TextChunker(max_tokens=3, overlap_tokens=0, count=count_words)
+        rows = chunker.chunk_row({"text": "One two. Three four."}, "text", source_id="abc")
+
+        self.assertEqual(
+            rows,
+            [
+                {"text": "One two.", "answer": "One two.", "source_id": "abc", "chunk_index": 0, "chunk_count": 2},
+                {
+                    "text": "Three four.",
+                    "answer": "Three four.",
+                    "source_id": "abc",
+                    "chunk_index": 1,
+                    "chunk_count": 2,
+                },
+            ],
+        )
+        self.assertEqual(chunker.embedding_text(rows[1], "text"), "Three four.")
+
+    def test_answers_are_embedded_with_their_question(self):
+        chunker = TextChunker(max_tokens=3, overlap_tokens=0, count=count_words)
+        row = {"question": "Where?", "answer": "In Melbourne. Near the river."}
+        rows = chunker.chunk_row(row, "question", source_id="abc")
+
+        self.assertEqual([r["answer"] for r in rows], ["In Melbourne.", "Near the river."])
+        self.assertEqual(chunker.embedding_text(rows[1], "question"), "Where?\nNear the river.")
+        # Rows that fit aren't chunks
+        self.assertEqual(
+            chunker.chunk_row({"question": "Where?", "answer": "Here."}, "question"),
+            [{"question": "Where?", "answer": "Here."}],
+        )
+        self.assertEqual(chunker.embedding_text({"question": "Where?", "answer": "Here."}, "question"), "Where?")
@@ -0,0 +1,88 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import pathlib
+import tempfile
+import unittest
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.repository.dataset_sources import (
+    CSVSource,
+    JSONLSource,
+    ParquetSource,
+    collection_name,
+    is_local_source,
+    resolve_local_source,
+)
+
+ROWS = [{"question": f"question {i}", "answer": f"answer {i}"} for i in range(5)]
+
+
+class TestDatasetSources(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_local_sources_are_recognized_by_extension(self):
+        self.assertTrue(is_local_source("faq.Parquet"))
+        self.assertTrue(is_local_source("faq.jsonl"))
+        self.assertFalse(is_local_source("aisuko/squad01"))
+
+    def test_collection_names(self):
+        self.assertEqual(collection_name("faq.csv"), "faq_csv")
+        # The collections of the hub datasets keep their name
+        self.assertEqual(collection_name("aisuko/squad.v2"), "aisuko_squad.v2")
+
+    def test_files_outside_of_the_root_are_rejected(self):
+        (self.root / "faq.csv").write_text("question,answer\n")
+        self.assertEqual(resolve_local_source("faq.csv", root=self.tmp.name), (self.root / "faq.csv").resolve())
+        with self.assertRaises(FileNotFoundError):
+            resolve_local_source("../faq.csv", root=str(self.root / "sub"))
+        with self.assertRaises(FileNotFoundError):
+            resolve_local_source("missing.csv", root=self.tmp.name)
+
+    def test_parquet(self):
+        path = self.root / "faq.parquet"
+        pq.write_table(pa.Table.from_pylist(ROWS), path, row_group_size=2)
+        source = ParquetSource("faq.parquet", path)
+
+        self.assertEqual(source.column_names, ["question", "answer"])
+        # Batches span the row groups
+        batches = list(source.iter_batches(3))
+        self.assertEqual([len(batch) for batch in batches], [3, 2])
+        self.assertEqual([row for batch in batches for row in batch], ROWS)
+
+    def test_csv_columns_are_read_as_text(self):
+        path = self.root / "faq.csv"
+        path.write_text("question,answer\n" + "".join(f"{i},answer {i}\n" for i in range(5)))
+        source = CSVSource("faq.csv", path)
+
+        self.assertEqual(source.column_names, ["question", "answer"])
+        batches = list(source.iter_batches(2))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[0][1], {"question": "1", "answer": "answer 1"})
+
+    def test_jsonl(self):
+        path = self.root / "faq.jsonl"
+        path.write_text("\n".join(json.dumps(row) for row in ROWS) + "\n\n")
+        source = JSONLSource("faq.jsonl", path)
+
+        self.assertEqual(source.column_names, ["question", "answer"])
+        self.assertEqual([row for batch in source.iter_batches(4) for row in batch], ROWS)
@@ -0,0 +1,214 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import unittest
+
+import httpx
+import numpy as np
+
+from src.repository.embedding_eng import (
+    DocumentEmbedder,
+    EmbeddingBatcher,
+    EmbeddingClient,
+    EmbeddingFailed,
+    SharedEmbeddingStore,
+    normalize_text,
+    parse_embedding_response,
+)
+
+
+class OverEmbeddingClient(EmbeddingClient):
+    """
+    Embeds without the engine and counts the requests
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = []
+
+    async def request(self, text: str) -> np.ndarray | None:
+        self.requests.append(text)
+        return np.array([len(text), 1.0], dtype=np.float64)
+
+
+class OverEmbeddingBatcher(EmbeddingBatcher):
+    """
+    Embeds every text as `[len(text)]` and records the batches sent to the engine
+    """
+
+    def __init__(
+        self, *args, reject_batches: bool = False, reject_status: int = 400, pool_batches: bool = False, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.reject_batches = reject_batches
+        self.reject_status = reject_status
+        self.pool_batches = pool_batches
+        self.batches = []
+
+    async def _post(self, texts: list[str]) -> list[np.ndarray]:
+        self.batches.append(texts)
+        if self.reject_batches and len(texts) > 1:
+            request = httpx.Request("POST", "http://embedding/embedding")
+            raise httpx.HTTPStatusError(
+                "", request=request, response=httpx.Response(self.reject_status, request=request)
+            )
+        await asyncio.sleep(0)
+        if self.pool_batches and len(texts) > 1:
+            # One vector for the whole list, as if it were a single content
+            return parse_embedding_response({"embedding": [float(len("".join(texts)))]}, len(texts))
+        return [np.array([len(text)], dtype=np.float32) for text in texts]
+
+
+class FlakyEmbeddingClient(OverEmbeddingClient):
+    """
+    Fails the first `failures` requests of every text
+    """
+
+    def __init__(self, *args, failures: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = failures
+
+    async def request(self, text: str) -> np.ndarray | None:
+        vector = await super().request(text)
+        return None if self.requests.count(text) <= self.failures else vector
+
+
+class DictStore(SharedEmbeddingStore):
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key: str) -> bytes | None:
+        return self.data.get(key)
+
+    async def put(self, key: str, value: bytes, ttl: float) -> None:
+        self.data[key] = value
+
+
+class TestEmbeddingClient(unittest.IsolatedAsyncioTestCase):
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text("  Do you know\tＲＭＩＴ? "), "do you know rmit?")
+
+    async def test_normalized_questions_share_the_entry(self):
+        client = OverEmbeddingClient(model="test-model", cache_size=8, ttl=60)
+        first = await client.embed("Do you know RMIT?")
+        second = await client.embed("do you  know rmit?")
+
+        self.assertEqual(client.requests, ["Do you know RMIT?"])
+        self.assertIs(first, second)
+        self.assertEqual(first.dtype, np.float32)
+        self.assertFalse(first.flags.writeable)
+
+    async def test_key_depends_on_the_model(self):
+        self.assertNotEqual(
+            OverEmbeddingClient(model="a").cache_key("question"), OverEmbeddingClient(model="b").cache_key("question")
+        )
+
+    async def test_shared_store_is_used_by_other_workers(self):
+        store = DictStore()
+        worker_1 = OverEmbeddingClient(model="test-model", shared=store)
+        worker_2 = OverEmbeddingClient(model="test-model", shared=store)
+
+        vector = await worker_1.embed("question")
+        self.assertTrue(np.array_equal(await worker_2.embed("question"), vector))
+        self.assertEqual(worker_2.requests, [])
+
+
+class TestEmbeddingBatcher(unittest.IsolatedAsyncioTestCase):
+    def test_parse_embedding_response(self):
+        single = parse_embedding_response({"embedding": [0.5, 1.0]}, 1)
+        self.assertEqual(single[0].tolist(), [0.5, 1.0])
+
+        results = parse_embedding_response({"results": [{"embedding": [1.0]}, {"embedding": [2.0]}]}, 2)
+        self.assertEqual([v.tolist() for v in results], [[1.0], [2.0]])
+
+        indexed = parse_embedding_response([{"index": 1, "embedding": [[2.0]]}, {"index": 0, "embedding": [[1.0]]}], 2)
+        self.assertEqual([v.tolist() for v in indexed], [[1.0], [2.0]])
+
+        with self.assertRaises(ValueError):
+            parse_embedding_response({"embedding": [1.0]}, 2)
+
+    async def test_concurrent_texts_share_a_request(self):
+        batcher = OverEmbeddingBatcher(max_batch_size=8, max_wait=0.01)
+        vectors = await asyncio.gather(*(batcher.embed(text) for text in ["a", "bb", "ccc", "bb"]))
+
+        self.assertEqual(batcher.batches, [["a", "bb", "ccc"]])
+        self.assertEqual([v.tolist() for v in vectors], [[1], [2], [3], [2]])
+
+    async def test_full_batch_is_sent_without_waiting(self):
+        batcher = OverEmbeddingBatcher(max_batch_size=2, max_wait=60)
+        vectors = await asyncio.wait_for(asyncio.gather(batcher.embed("a"), batcher.embed("bb")), 0.1)
+
+        self.assertEqual([v.tolist() for v in vectors], [[1], [2]])
+        self.assertEqual(batcher.batches, [["a", "bb"]])
+
+    async def test_falls_back_to_single_texts(self):
+        batcher = OverEmbeddingBatcher(max_batch_size=8, max_wait=0.001, reject_batches=True)
+        vectors = await asyncio.gather(batcher.embed("a"), batcher.embed("bb"))
+
+        self.assertEqual([v.tolist() for v in vectors], [[1], [2]])
+        self.assertFalse(batcher.batch_supported)
+        self.assertEqual(batcher.batches, [["a", "bb"], ["a"], ["bb"]])
+
+    async def test_pooled_batch_falls_back_to_single_texts(self):
+        batcher = OverEmbeddingBatcher(max_batch_size=8, max_wait=0.001, pool_batches=True)
+        vectors = await asyncio.gather(batcher.embed("a"), batcher.embed("bb"))
+
+        self.assertEqual([v.tolist() for v in vectors], [[1], [2]])
+        self.assertFalse(batcher.batch_supported)
+        self.assertEqual(batcher.batches, [["a", "bb"], ["a"], ["bb"]])
+
+    async def test_server_error_keeps_batching(self):
+        batcher = OverEmbeddingBatcher(max_batch_size=8, max_wait=0.001, reject_batches=True, reject_status=503)
+        vectors = await asyncio.gather(batcher.embed("a"), batcher.embed("bb"))
+
+        # The batch failed, its texts aren't sent one by one
+        self.assertEqual(vectors, [None, None])
+        self.assertTrue(batcher.batch_supported)
+        self.assertEqual(batcher.batches, [["a", "bb"]])
+
+    async def test_embed_many_goes_through_the_cache(self):
+        client = EmbeddingClient(model="test-model", cache_size=8, ttl=60)
+        client.batcher = OverEmbeddingBatcher(max_batch_size=8, max_wait=0.001)
+        await client.embed("a")
+        vectors = await client.embed_many(["a", "bb", "ccc"])
+
+        self.assertEqual([v.tolist() for v in vectors], [[1], [2], [3]])
+        self.assertEqual(client.batcher.batches, [["a"], ["bb", "ccc"]])
+
+
+class TestDocumentEmbedder(unittest.IsolatedAsyncioTestCase):
+    async def test_vectors_keep_the_order_of_the_texts(self):
+        client = OverEmbeddingClient(model="test-model")
+        embedder = DocumentEmbedder(client=client, concurrency=2, chunk_size=2, backoff=0)
+        vectors = await embedder.embed(["a", "bbb", "cc", "dddd", "e"])
+
+        self.assertEqual([v[0] for v in vectors], [1, 3, 2, 4, 1])
+        # Documents don't go through the cache of the questions
+        self.assertEqual(len(client.cache), 0)
+
+    async def test_failed_texts_are_retried(self):
+        client = FlakyEmbeddingClient(model="test-model", failures=2)
+        embedder = DocumentEmbedder(client=client, retries=2, chunk_size=4, backoff=0)
+        vectors = await embedder.embed(["a", "bb"])
+
+        self.assertEqual([v[0] for v in vectors], [1, 2])
+        self.assertEqual(client.requests, ["a", "bb"] * 3)
+
+    async def test_gives_up_after_the_retries(self):
+        client = FlakyEmbeddingClient(model="test-model", failures=3)
+        embedder = DocumentEmbedder(client=client, retries=2, backoff=0)
+
+        with self.assertRaises(EmbeddingFailed):
+            await embedder.embed(["a"])
@@ -0,0 +1,80 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import unittest
+
+import httpx
+
+from src.repository.engine_pool import EnginePool, parse_engine_urls
+
+
+class OverEnginePool(EnginePool):
+    """
+    Engines come back when the test says so instead of after a probe
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.back = asyncio.Event()
+
+    async def _reprobe(self, backend) -> None:
+        await self.back.wait()
+        backend.healthy = True
+
+
+class TestEnginePool(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.pool = OverEnginePool(["http://engine-1:8080", "http://engine-2:8080"], name="test_pool", n_slots=1)
+        self.engine_1, self.engine_2 = self.pool.backends
+
+    def test_parse_engine_urls(self):
+        self.assertEqual(parse_engine_urls("", "llamacpp", 8080), ["http://llamacpp:8080"])
+        self.assertEqual(
+            parse_engine_urls(" engine-1:8080, https://engine-2:8443/ ,", "llamacpp", 8080),
+            ["http://engine-1:8080", "https://engine-2:8443"],
+        )
+
+    def test_least_loaded_engine_is_selected(self):
+        with self.pool.lease(self.pool.select(session_id=1)) as busy:
+            idle = self.pool.select(session_id=2)
+            self.assertIsNot(idle, busy)
+        self.assertEqual(busy.in_flight, 0)
+
+    def test_session_sticks_to_its_engine_on_ties(self):
+        first = self.pool.select(session_id=1)
+        self.pool.select(session_id=2)
+        self.assertIs(self.pool.select(session_id=1), first)
+
+        # Load wins over stickiness
+        with self.pool.lease(first):
+            self.assertIsNot(self.pool.select(session_id=1), first)
+
+    async def test_failed_engine_is_ejected_until_it_is_back(self):
+        self.pool.mark_failure(self.engine_1, httpx.ConnectError("refused"))
+        self.assertFalse(self.engine_1.healthy)
+        for session_id in range(4):
+            self.assertIs(self.pool.select(session_id=session_id), self.engine_2)
+
+        self.pool.back.set()
+        await asyncio.sleep(0)
+        self.assertTrue(self.engine_1.healthy)
+
+    async def test_requests_are_still_sent_when_every_engine_failed(self):
+        self.pool.mark_failure(self.engine_1, httpx.ConnectError("refused"))
+        self.pool.mark_failure(self.engine_2, httpx.ConnectError("refused"))
+        self.assertIn(self.pool.select(), self.pool.backends)
+
+        self.pool.back.set()
+        await asyncio.sleep(0)
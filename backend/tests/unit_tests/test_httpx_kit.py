@@ -16,7 +16,7 @@
 
 import unittest
 import pytest
-from src.utilities.httpkit.httpx_kit import httpx_kit
+from src.utilities.httpkit.httpx_kit import UPSTREAMS, UPSTREAM_EMBEDDING, UPSTREAM_INFERENCE, HttpxKit, httpx_kit
 
 
 class TestHttpxKit(unittest.TestCase):
@@ -32,3 +32,18 @@ class TestHttpxKit(unittest.TestCase):
         Test teardown of sync client
         """
         self.assertTrue(httpx_kit.teardown_sync_client())
+
+    def test_upstream_clients(self):
+        """
+        Test every upstream gets its own client with the configured timeouts
+        """
+        kit = HttpxKit()
+        inference = kit.client(UPSTREAM_INFERENCE)
+        embedding = kit.client(UPSTREAM_EMBEDDING)
+
+        self.assertIsNot(inference, embedding)
+        self.assertIs(kit.client("unknown"), kit.async_client)
+        self.assertEqual(inference.timeout.read, UPSTREAMS[UPSTREAM_INFERENCE].read_timeout)
+        self.assertEqual(embedding.timeout.connect, UPSTREAMS[UPSTREAM_EMBEDDING].connect_timeout)
+        self.assertEqual(embedding.timeout.pool, UPSTREAMS[UPSTREAM_EMBEDDING].pool_timeout)
+        kit.teardown_sync_client()
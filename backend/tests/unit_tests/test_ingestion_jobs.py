@@ -0,0 +1,90 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import threading
+import unittest
+
+from src.repository.ingestion_jobs import (
+    JOB_FAILED,
+    JOB_RUNNING,
+    JOB_SUCCEEDED,
+    IngestionJob,
+    IngestionJobConflict,
+    IngestionJobManager,
+)
+
+
+class TestIngestionJobManager(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.manager = IngestionJobManager(max_workers=1, jobs_kept=8)
+
+    def tearDown(self):
+        self.manager.shutdown()
+
+    async def wait_done(self, job: IngestionJob) -> None:
+        while not job.is_done:
+            await asyncio.sleep(0.001)
+
+    async def test_progress_and_success(self):
+        release = threading.Event()
+        bound = []
+
+        def work(job):
+            job.rows_read = 10
+            job.rows_inserted = 4
+            release.wait(timeout=5)
+            job.rows_inserted = 10
+
+        async def on_success(job):
+            bound.append(job.id)
+
+        job = self.manager.submit(IngestionJob(dataset_name="faq", account_id=1), work, on_success=on_success)
+        while job.rows_inserted != 4:
+            await asyncio.sleep(0.001)
+        # The event loop isn't blocked while the dataset loads
+        self.assertEqual(job.status, JOB_RUNNING)
+        self.assertIs(self.manager.get(job.id), job)
+
+        release.set()
+        await self.wait_done(job)
+        self.assertEqual(job.status, JOB_SUCCEEDED)
+        self.assertEqual(bound, [job.id])
+        self.assertGreater(job.rows_per_second, 0)
+
+    async def test_failure_is_reported(self):
+        def work(job):
+            raise RuntimeError("dataset not found")
+
+        job = self.manager.submit(IngestionJob(dataset_name="missing"), work)
+        await self.wait_done(job)
+        self.assertEqual(job.status, JOB_FAILED)
+        self.assertIn("dataset not found", job.error)
+        self.assertIsNone(self.manager.get("unknown"))
+
+    async def test_one_job_per_key(self):
+        release = threading.Event()
+        job = self.manager.submit(IngestionJob(dataset_name="faq"), lambda job: release.wait(timeout=5), key="faq")
+
+        with self.assertRaises(IngestionJobConflict) as conflict:
+            self.manager.submit(IngestionJob(dataset_name="faq"), lambda job: None, key="faq")
+        self.assertIs(conflict.exception.job, job)
+        other = self.manager.submit(IngestionJob(dataset_name="news"), lambda job: None, key="news")
+
+        release.set()
+        await self.wait_done(job)
+        await self.wait_done(other)
+        reload = self.manager.submit(IngestionJob(dataset_name="faq"), lambda job: None, key="faq")
+        await self.wait_done(reload)
+        self.assertEqual(reload.status, JOB_SUCCEEDED)
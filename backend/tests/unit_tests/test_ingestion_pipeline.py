@@ -0,0 +1,89 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+import unittest
+
+from src.repository.ingestion_pipeline import ContentDiff, IngestionPipeline, iter_batches
+
+
+class TestIngestionPipeline(unittest.TestCase):
+    def test_iter_batches(self):
+        self.assertEqual([len(batch) for batch in iter_batches(({"i": i} for i in range(7)), 3)], [3, 3, 1])
+        self.assertEqual(list(iter_batches([], 3)), [])
+
+    def test_stages_run_in_order(self):
+        inserted = []
+
+        def embed(batch):
+            return [{**row, "vector": [row["i"]]} for row in batch]
+
+        def insert(batch):
+            inserted.extend(batch)
+            return batch
+
+        stats = IngestionPipeline(stages=[("embed", embed), ("insert", insert)]).run(
+            iter_batches(({"i": i} for i in range(10)), 4)
+        )
+        self.assertEqual([row["vector"] for row in inserted], [[i] for i in range(10)])
+        self.assertEqual({name: s.rows for name, s in stats.items()}, {"read": 10, "embed": 10, "insert": 10})
+
+    def test_slow_stage_bounds_the_reader(self):
+        progress = {"read": 0, "max_ahead": 0, "inserted": 0}
+
+        def source():
+            for i in range(20):
+                progress["read"] += 1
+                progress["max_ahead"] = max(progress["max_ahead"], progress["read"] - progress["inserted"])
+                yield [{"i": i}]
+
+        def insert(batch):
+            time.sleep(0.002)
+            progress["inserted"] += 1
+            return batch
+
+        IngestionPipeline(stages=[("insert", insert)], max_pending=2).run(source())
+        # One batch being inserted, two queued, one held by the reader
+        self.assertLessEqual(progress["max_ahead"], 4)
+
+    def test_failure_stops_the_pipeline(self):
+        def source():
+            for i in range(1000):
+                yield [{"i": i}]
+
+        def insert(batch):
+            if batch[0]["i"] == 3:
+                raise RuntimeError("vector database down")
+            return batch
+
+        pipeline = IngestionPipeline(stages=[("insert", insert)])
+        with self.assertRaisesRegex(RuntimeError, "vector database down"):
+            pipeline.run(source())
+        self.assertLess(pipeline.stats["read"].rows, 1000)
+
+
+class TestContentDiff(unittest.TestCase):
+    def test_only_new_rows_are_kept(self):
+        diff = ContentDiff(existing={"kept": [1], "changed": [2], "chunked": [3, 4], "": [5]})
+        rows = diff.new_rows([{"h": "kept"}, {"h": "new"}, {"h": "new"}, {"h": "chunked"}], "h")
+
+        self.assertEqual(rows, [{"h": "new"}])
+        self.assertEqual((diff.unchanged, diff.duplicates), (2, 1))
+        # Removed rows and the entities loaded without a hash, all the chunks of a kept row are kept
+        self.assertEqual(sorted(diff.stale_ids()), [2, 5])
+
+    def test_first_load(self):
+        diff = ContentDiff()
+        self.assertEqual(diff.new_rows([{"h": "a"}, {"h": "b"}], "h"), [{"h": "a"}, {"h": "b"}])
+        self.assertEqual(diff.stale_ids(), [])
@@ -0,0 +1,42 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from src.utilities.cache.lru_cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertNotIn("b", cache)
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+
+    def test_entries_expire(self):
+        now = [0.0]
+        cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+        cache.put("a", 1)
+        now[0] = 9
+        self.assertEqual(cache.get("a"), 1)
+
+        now[0] = 10
+        self.assertNotIn("a", cache)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
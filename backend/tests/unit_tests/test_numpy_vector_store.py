@@ -0,0 +1,138 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import multiprocessing
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.repository.numpy_vector_store import IVFIndex, NumpyVectorStore, normalize_rows
+
+
+def insert_from_worker(path: str, worker: int) -> None:
+    store = NumpyVectorStore(path=path)
+    for i in range(20):
+        value = worker * 100 + i
+        store.insert_list("faq", [{"question_embedding": [1.0, float(value)], "answer": str(value)}] * 5)
+
+
+class TestNumpyVectorStore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = NumpyVectorStore(path=self.tmp.name)
+        self.store.create_collection("faq", dimension=2)
+        self.store.insert_list(
+            "faq",
+            [
+                {"question_embedding": [1.0, 0.0], "question": "q1", "answer": "east"},
+                {"question_embedding": [0.0, 2.0], "question": "q2", "answer": "north"},
+                {"question_embedding": [1.0, 1.0], "question": "q3", "answer": "north-east"},
+            ],
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def test_search(self):
+        hits = await self.store.async_search_hits([0.1, 1.0], 2, collection_name="faq")
+        self.assertEqual([hit["answer"] for hit in hits], ["north", "north-east"])
+        self.assertAlmostEqual(hits[0]["similarity"], 1 / np.sqrt(1.01), places=5)
+        self.assertEqual(hits[0]["id"], 1)
+        self.assertEqual(self.store.search([1.0, 0.0], 1, collection_name="faq"), ["east"])
+
+    def test_persisted(self):
+        reopened = NumpyVectorStore(path=self.tmp.name)
+        self.assertEqual(reopened.search([1.0, 0.0], 3, collection_name="faq"), ["east", "north-east", "north"])
+        result = reopened.insert_list("faq", [{"question_embedding": [-1.0, 0.0], "answer": "west"}])
+        self.assertEqual(result, {"insert_count": 1, "ids": [3]})
+
+    def test_recreate(self):
+        self.store.create_collection("faq", dimension=2, recreate=False)
+        self.assertEqual(len(self.store.search([1.0, 0.0], 5, collection_name="faq")), 3)
+        self.store.create_collection("faq", dimension=2)
+        self.assertEqual(self.store.search([1.0, 0.0], 5, collection_name="faq"), [])
+        self.assertIsNone(self.store.search([1.0, 0.0], 5, collection_name="missing"))
+
+    def test_ensure_collection_keeps_the_data(self):
+        self.assertFalse(NumpyVectorStore(path=self.tmp.name).ensure_collection("faq", dimension=2))
+        self.assertEqual(len(self.store.search([1.0, 0.0], 5, collection_name="faq")), 3)
+
+        self.assertTrue(self.store.ensure_collection("new", dimension=2))
+        self.assertEqual(self.store.search([1.0, 0.0], 5, collection_name="new"), [])
+
+    def test_ensure_collection_recreates_another_dimension(self):
+        self.assertTrue(self.store.ensure_collection("faq", dimension=3))
+        self.assertEqual(self.store.collection_dimension("faq"), 3)
+        self.assertEqual(self.store.search([1.0, 0.0, 0.0], 5, collection_name="faq"), [])
+
+    def test_deleted_entities_are_not_found(self):
+        self.assertEqual(self.store.delete_ids("faq", [1, 1, 7]), 1)
+        self.assertEqual(self.store.search([0.0, 1.0], 5, collection_name="faq"), ["north-east", "east"])
+
+        reopened = NumpyVectorStore(path=self.tmp.name)
+        self.assertEqual(reopened.search([0.0, 1.0], 5, collection_name="faq"), ["north-east", "east"])
+        self.assertEqual(reopened.delete_ids("faq", [1]), 0)
+
+    def test_content_hashes(self):
+        self.store.insert_list("faq", [{"question_embedding": [0.0, 1.0], "content_hash": "h1"}])
+        self.store.insert_list("faq", [{"question_embedding": [0.0, 1.0], "content_hash": "h1"}])
+        self.store.delete_ids("faq", [0])
+        self.assertEqual(self.store.content_hashes("faq"), {"": [1, 2], "h1": [3, 4]})
+        self.assertEqual(self.store.content_hashes("missing"), {})
+
+    def test_other_worker_sees_the_changes(self):
+        other = NumpyVectorStore(path=self.tmp.name)
+        self.assertEqual(len(other.search([1.0, 0.0], 5, collection_name="faq")), 3)
+
+        self.store.insert_list("faq", [{"question_embedding": [-1.0, 0.0], "answer": "west"}])
+        self.store.delete_ids("faq", [0])
+        self.assertEqual(other.search([-1.0, 0.0], 1, collection_name="faq"), ["west"])
+        self.assertNotIn("east", other.search([1.0, 0.0], 5, collection_name="faq"))
+
+        self.store.create_collection("faq", dimension=3)
+        self.assertEqual(other.collection_dimension("faq"), 3)
+        self.assertEqual(other.search([1.0, 0.0, 0.0], 5, collection_name="faq"), [])
+
+    def test_workers_append_at_once(self):
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=insert_from_worker, args=(self.tmp.name, w)) for w in (1, 2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual([worker.exitcode for worker in workers], [0, 0])
+
+        collection = NumpyVectorStore(path=self.tmp.name)._get("faq")
+        self.assertEqual(len(collection.rows), 3 + 2 * 20 * 5)
+        # Every vector is still next to its row
+        for vector, row in zip(collection.vectors[3:], collection.rows[3:]):
+            self.assertAlmostEqual(vector[1] / vector[0], float(row["answer"]), places=2)
+
+    def test_wrong_dimension(self):
+        with self.assertRaises(ValueError):
+            self.store.insert_list("faq", [{"question_embedding": [1.0, 0.0, 0.0]}])
+
+
+class TestIVFIndex(unittest.TestCase):
+    def test_finds_the_nearest_cluster(self):
+        rng = np.random.default_rng(1)
+        centers = normalize_rows(rng.normal(size=(16, 8)))
+        vectors = normalize_rows(np.repeat(centers, 64, axis=0) + rng.normal(scale=0.05, size=(1024, 8)))
+        index = IVFIndex(vectors.astype(np.float32))
+
+        query = centers[3]
+        candidates = index.candidates(query, n_probe=4)
+        self.assertLess(len(candidates), len(vectors))
+        self.assertIn(int(np.argmax(vectors @ query)), candidates)
@@ -0,0 +1,146 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from src.config.manager import settings
+from src.repository.engine_pool import EnginePool
+from src.repository.tokenizer import TokenCounter
+from src.repository.rag.prompt import PromptBuilder, history_offset, select_history_window, slot_context_size
+
+
+class OverTokenCounter:
+    """
+    One token per character, no network
+    """
+
+    def __init__(self):
+        self.counted: list[str] = []
+
+    def cached(self, text):
+        return None
+
+    def estimate_many(self, texts):
+        return [len(text) for text in texts]
+
+    async def count_many(self, texts):
+        self.counted.extend(texts)
+        return [len(text) for text in texts]
+
+
+class TestSelectHistoryWindow(unittest.TestCase):
+    def test_everything_fits(self):
+        self.assertEqual(select_history_window([10, 10, 10], budget=30, stride=8), 0)
+
+    def test_nothing_fits(self):
+        self.assertEqual(select_history_window([10, 10], budget=0, stride=8), 2)
+
+    def test_window_moves_by_stride(self):
+        """
+        The start stays put while the conversation grows by less than a stride
+        """
+        messages = [10] * 10
+        starts = [select_history_window(messages[:n], budget=50, stride=30) for n in range(6, 11)]
+        self.assertEqual(starts, [3, 3, 3, 6, 6])
+        for n, start in zip(range(6, 11), starts):
+            self.assertLessEqual(sum(messages[start:n]), 50)
+
+
+class TestEstimateMany(unittest.TestCase):
+    def test_cached_counts_are_exact(self):
+        counter = TokenCounter(cache_size=8)
+        counter.cache.put(counter.text_hash("seen"), 1)
+        self.assertEqual(counter.estimate_many(["seen", "never seen"]), [1, TokenCounter.estimate("never seen")])
+
+
+class TestHistoryOffset(unittest.TestCase):
+    def test_offset_moves_by_page(self):
+        self.assertEqual(history_offset(30, max_messages=50, page=26), 0)
+        self.assertEqual(history_offset(75, max_messages=50, page=26), 0)
+        self.assertEqual(history_offset(76, max_messages=50, page=26), 26)
+        self.assertEqual(history_offset(101, max_messages=50, page=26), 26)
+
+
+class TestSlotContextSize(unittest.TestCase):
+    def test_follows_resized_slots(self):
+        pool = EnginePool(["http://a:8080", "http://b:8080"], name="inference", n_slots=1)
+        self.assertEqual(slot_context_size(pool), settings.INFERENCE_ENG_CTX_SIZE)
+        pool.backends[1].slots.resize(4)
+        self.assertEqual(slot_context_size(pool), settings.INFERENCE_ENG_CTX_SIZE // 4)
+
+
+class TestPromptBuilder(unittest.IsolatedAsyncioTestCase):
+    async def test_build_keeps_newest_turns(self):
+        builder = PromptBuilder(counter=OverTokenCounter(), context_size=120, stride=1, margin=0)
+        history = [("user", "q1", None), ("assistant", " a1", None), ("user", "q2", None), ("assistant", " a2", None)]
+
+        prompt = await builder.build(system_prompt="sys", history=history, input_msg="q3", n_predict=20)
+        self.assertEqual(
+            prompt,
+            "### System: sys\n\n### Human: q2\n### Assistant: a2\n### Human: q3\n### Assistant:",
+        )
+
+    async def test_previous_prompt_is_prefix(self):
+        """
+        The prompt of the next turn starts with the previous prompt and its answer, so llama.cpp reuses its cache
+        """
+        builder = PromptBuilder(counter=OverTokenCounter(), context_size=4096)
+        first = await builder.build(system_prompt="sys", history=[], input_msg="q1", n_predict=128)
+        second = await builder.build(
+            system_prompt="sys",
+            history=[("user", "q1", None), ("assistant", " a1", None)],
+            input_msg="q2",
+            n_predict=128,
+        )
+        self.assertTrue(second.startswith(first + " a1"))
+
+    async def test_stored_token_counts_skip_tokenizer(self):
+        counter = OverTokenCounter()
+        builder = PromptBuilder(counter=counter, context_size=4096)
+        await builder.build(
+            system_prompt="sys", history=[("user", "q1", 5), ("assistant", " a1", 4)], input_msg="q2", n_predict=128
+        )
+        # The system prompt and the new question are estimated, nothing reaches the tokenizer
+        self.assertEqual(counter.counted, [])
+
+    async def test_uncounted_messages_are_tokenized(self):
+        counter = OverTokenCounter()
+        builder = PromptBuilder(counter=counter, context_size=4096)
+        await builder.build(
+            system_prompt="sys", history=[("user", "q1", None), ("assistant", " a1", 4)], input_msg="q2", n_predict=128
+        )
+        # e.g. imported through `/chat/save`, counted once then cached
+        self.assertEqual(counter.counted, ["\n### Human: q1"])
+
+    async def test_prefix_is_stable_in_long_sessions(self):
+        """
+        Past the messages read for a prompt, the prefix only changes when the offset of the history moves
+        """
+        builder = PromptBuilder(counter=OverTokenCounter(), context_size=1 << 20)
+        messages = []
+        previous, previous_offset, prefix_changes = None, 0, 0
+        for turn in range(80):
+            offset = history_offset(len(messages), max_messages=50, page=26)
+            prompt = await builder.build(
+                system_prompt="sys", history=messages[offset:], input_msg=f"q{turn}", n_predict=128
+            )
+            if previous is not None and not prompt.startswith(previous):
+                self.assertNotEqual(offset, previous_offset)
+                prefix_changes += 1
+            answer = f" a{turn}"
+            messages += [("user", f"q{turn}", None), ("assistant", answer, None)]
+            previous, previous_offset = prompt + answer, offset
+
+        # 160 messages, the offset moved at 76, 102, 128 and 154 messages
+        self.assertEqual(prefix_changes, 4)
@@ -0,0 +1,132 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src.config.manager import settings
+from src.repository import rag_datasets_eng
+from src.repository.ingestion_jobs import IngestionJob
+from src.repository.numpy_vector_store import NumpyVectorStore
+from src.repository.rag.answer_cache import answer_cache
+from src.repository.rag.chunking import TextChunker
+from src.repository.rag_datasets_eng import DatasetEng
+
+
+class OverDocumentEmbedder:
+    """
+    Embeds every text as `[len(text), 1, ...]` of `dimension` values and records the texts
+    """
+
+    def __init__(self, model: str = "test-model", dimension: int = 2):
+        self.model = model
+        self.dimension = dimension
+        self.embedded: list[str] = []
+
+    async def embed(self, texts):
+        self.embedded.extend(texts)
+        return [np.array([len(text)] + [1.0] * (self.dimension - 1), dtype=np.float32) for text in texts]
+
+
+class TestLoadDataset(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = pathlib.Path(self.tmp.name)
+        self.dataset = root / "faq.jsonl"
+        self.store = NumpyVectorStore(path=str(root / "store"))
+        for patch in (
+            mock.patch.object(rag_datasets_eng, "vector_db", self.store),
+            mock.patch.object(settings, "LOCAL_DATASETS_PATH", self.tmp.name),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.store.shutdown()
+        self.tmp.cleanup()
+
+    def write_rows(self, answers: dict[str, str]) -> None:
+        self.dataset.write_text(
+            "".join(json.dumps({"question": question, "answer": answer}) + "\n" for question, answer in answers.items())
+        )
+
+    async def load(self, embedder: OverDocumentEmbedder, chunker: TextChunker | None = None) -> IngestionJob:
+        job = IngestionJob(dataset_name="faq.jsonl")
+        await asyncio.to_thread(
+            DatasetEng.load_dataset,
+            "faq.jsonl",
+            loop=asyncio.get_running_loop(),
+            job=job,
+            embedder=embedder,
+            chunker=chunker or TextChunker(max_tokens=0),
+        )
+        return job
+
+    def answers(self) -> list[str]:
+        return sorted(hit["answer"] for hit in self.store.search_hits([1.0, 1.0], 100, collection_name="faq_jsonl"))
+
+    async def test_reload_only_embeds_the_changes(self):
+        self.write_rows({"q1": "a1", "q2": "a2", "q3": "a3"})
+        job = await self.load(OverDocumentEmbedder())
+        self.assertEqual((job.rows_inserted, job.rows_unchanged, job.rows_deleted), (3, 0, 0))
+        self.assertEqual((job.embedding_model, job.embedding_dim), ("test-model", 2))
+
+        # q1 unchanged, q2 changed, q3 removed, q4 added
+        self.write_rows({"q1": "a1", "q2": "a2 changed", "q4": "a4"})
+        answer_cache.store("faq_jsonl", np.array([1.0, 0.0]), "cached", generation_seconds=1)
+        embedder = OverDocumentEmbedder()
+        job = await self.load(embedder)
+
+        self.assertEqual(sorted(embedder.embedded), ["q2", "q4"])
+        self.assertEqual((job.rows_inserted, job.rows_unchanged, job.rows_deleted), (2, 1, 2))
+        self.assertEqual(self.answers(), ["a1", "a2 changed", "a4"])
+        # The answers were generated from the previous rows
+        self.assertIsNone(answer_cache.lookup("faq_jsonl", np.array([1.0, 0.0])))
+
+    async def test_unchanged_reload_changes_nothing(self):
+        self.write_rows({"q1": "a1", "q2": "a2"})
+        await self.load(OverDocumentEmbedder())
+        embedder = OverDocumentEmbedder()
+        job = await self.load(embedder)
+
+        self.assertEqual(embedder.embedded, [])
+        self.assertEqual((job.rows_inserted, job.rows_unchanged, job.rows_deleted), (0, 2, 0))
+        self.assertEqual(self.answers(), ["a1", "a2"])
+
+    async def test_new_dimension_recreates_the_collection(self):
+        self.write_rows({"q1": "a1", "q2": "a2"})
+        await self.load(OverDocumentEmbedder())
+        job = await self.load(OverDocumentEmbedder(model="other-model", dimension=3))
+
+        self.assertEqual((job.rows_inserted, job.rows_unchanged, job.rows_deleted), (2, 0, 0))
+        self.assertEqual(self.store.collection_dimension("faq_jsonl"), 3)
+        hits = self.store.search_hits([1.0, 1.0, 1.0], 10, collection_name="faq_jsonl")
+        self.assertEqual(sorted(hit["answer"] for hit in hits), ["a1", "a2"])
+
+    async def test_long_answers_are_chunked(self):
+        self.write_rows({"q1": "One sentence here. Another sentence there. A third one to finish."})
+        job = await self.load(OverDocumentEmbedder(), chunker=TextChunker(max_tokens=8, overlap_tokens=0))
+
+        hits = self.store.search_hits([1.0, 1.0], 10, collection_name="faq_jsonl")
+        self.assertGreater(len(hits), 1)
+        self.assertEqual(job.rows_inserted, len(hits))
+        self.assertEqual(sorted(hit["chunk_index"] for hit in hits), list(range(len(hits))))
+        self.assertEqual(len({hit["source_id"] for hit in hits}), 1)
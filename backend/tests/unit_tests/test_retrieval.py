@@ -0,0 +1,70 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from src.repository.rag.retrieval import CONTEXT_HEADER, ContextPacker, Passage, format_context, select_passages
+
+
+class OverTokenCounter:
+    """
+    One token per character, no network
+    """
+
+    def estimate_many(self, texts):
+        return [len(text) for text in texts]
+
+
+class TestSelectPassages(unittest.TestCase):
+    def test_floor_and_order(self):
+        hits = [
+            {"id": 1, "similarity": 0.6, "answer": "RMIT is in Melbourne"},
+            {"id": 2, "similarity": 0.3, "answer": "unrelated"},
+            {"id": 3, "similarity": 0.9, "answer": "RMIT is a university"},
+        ]
+        passages = select_passages(hits, min_similarity=0.5)
+        self.assertEqual([passage.id for passage in passages], [3, 1])
+
+    def test_near_duplicates_are_dropped(self):
+        hits = [
+            {"id": 1, "similarity": 0.9, "answer": "RMIT is a university in Melbourne"},
+            {"id": 2, "similarity": 0.8, "answer": "RMIT is a  University in Melbourne"},
+            {"id": 3, "similarity": 0.7, "answer": "RMIT was founded in 1887"},
+        ]
+        passages = select_passages(hits, min_similarity=0.0, dedupe_similarity=0.9)
+        self.assertEqual([passage.id for passage in passages], [1, 3])
+
+    def test_chunks_reference_their_source(self):
+        hits = [
+            {"id": 1, "similarity": 0.9, "answer": "RMIT is in Melbourne", "source_id": "abc", "chunk_index": 2},
+            {"id": 2, "similarity": 0.8, "answer": "RMIT was founded in 1887"},
+        ]
+        passages = select_passages(hits, min_similarity=0.0)
+        self.assertEqual(
+            [passage.reference() for passage in passages],
+            [{"id": 1, "similarity": 0.9, "source_id": "abc", "chunk_index": 2}, {"id": 2, "similarity": 0.8}],
+        )
+
+
+class TestContextPacker(unittest.IsolatedAsyncioTestCase):
+    async def test_packs_what_fits(self):
+        long, short = Passage(1, "x" * 50, 0.9), Passage(2, "y" * 5, 0.8)
+        packer = ContextPacker(counter=OverTokenCounter(), budget=len(CONTEXT_HEADER) + 20)
+
+        self.assertEqual(await packer.pack([long, short]), [short])
+        self.assertEqual(await packer.pack([]), [])
+
+    async def test_format_context(self):
+        context = format_context([Passage(1, "first", 0.9), Passage(2, "second", 0.8)])
+        self.assertEqual(context, f"{CONTEXT_HEADER}\n- first\n- second")
@@ -0,0 +1,52 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from src.repository.slot_allocator import ANY_SLOT, SlotAllocator
+from src.utilities.metrics.registry import metrics
+
+
+class TestSlotAllocator(unittest.TestCase):
+    def test_session_keeps_its_slot(self):
+        allocator = SlotAllocator(n_slots=2, name="test_keep")
+        first = allocator.acquire(session_id=1)
+        allocator.release(first)
+        self.assertEqual(allocator.acquire(session_id=1), first)
+
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["test_keep_hits"], 1)
+        self.assertEqual(counters["test_keep_misses"], 1)
+
+    def test_least_recently_used_idle_slot_is_evicted(self):
+        allocator = SlotAllocator(n_slots=2, name="test_evict")
+        slot_1 = allocator.acquire(session_id=1)
+        slot_2 = allocator.acquire(session_id=2)
+        allocator.release(slot_1)
+        allocator.release(slot_2)
+        # Session 1 is used again, session 2 becomes the least recently used one
+        allocator.release(allocator.acquire(session_id=1))
+
+        self.assertEqual(allocator.acquire(session_id=3), slot_2)
+        self.assertEqual(metrics.snapshot()["counters"]["test_evict_evictions"], 1)
+
+    def test_busy_slots_are_not_taken(self):
+        allocator = SlotAllocator(n_slots=1, name="test_busy")
+        slot = allocator.acquire(session_id=1)
+        self.assertEqual(allocator.acquire(session_id=2), ANY_SLOT)
+        # A second generation of the same session doesn't wait for the first one either
+        self.assertEqual(allocator.acquire(session_id=1), ANY_SLOT)
+
+        allocator.release(slot)
+        self.assertEqual(allocator.acquire(session_id=2), slot)
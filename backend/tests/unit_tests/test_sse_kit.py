@@ -0,0 +1,137 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import unittest
+from src.utilities.httpkit.sse_kit import (
+    CompletionEvent,
+    CompletionSummary,
+    SSEParseError,
+    SSEStreamParser,
+    iter_completion_events,
+    iter_frames,
+)
+
+STREAM = (
+    b'data: {"content":" Yes","stop":false,"id_slot":0,"multimodal":false}\n\n'
+    b'data: {"content":",","stop":false,"id_slot":0,"multimodal":false}\n\n'
+    b'data: {"content":"","stop":true,"id_slot":0,"tokens_predicted":2,"timings":{"predicted_n":2}}\n\n'
+)
+
+
+class TestSSEStreamParser(unittest.TestCase):
+    def test_split_chunks(self):
+        """
+        Frames split at every byte boundary are re-assembled
+        """
+        parser = SSEStreamParser()
+        events = []
+        for i in range(len(STREAM)):
+            events.extend(parser.feed(STREAM[i : i + 1]))
+
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[0].data, '{"content":" Yes","stop":false,"id_slot":0,"multimodal":false}')
+
+    def test_crlf_and_comments(self):
+        parser = SSEStreamParser()
+        events = parser.feed(b': keep-alive\r\ndata: {"a":1}\r\n\r\n')
+        self.assertEqual([e.data for e in events], ['{"a":1}'])
+
+    def test_buffer_is_bounded(self):
+        parser = SSEStreamParser(max_buffer_size=16)
+        with self.assertRaises(SSEParseError):
+            parser.feed(b"data: " + b"x" * 32)
+
+
+class TestCompletionEvents(unittest.IsolatedAsyncioTestCase):
+    async def test_typed_events_and_summary(self):
+        async def chunks():
+            yield STREAM[:30]
+            yield STREAM[30:]
+
+        summary = CompletionSummary()
+        frames = []
+        async for event in iter_completion_events(chunks()):
+            self.assertIsInstance(event, CompletionEvent)
+            summary.add(event)
+            frames.append(event.frame)
+
+        self.assertEqual("".join(frames).encode(), STREAM)
+        self.assertEqual(summary.text, " Yes,")
+        self.assertTrue(summary.is_finished)
+        self.assertEqual(summary.tokens_predicted, 2)
+        self.assertEqual(summary.timings, {"predicted_n": 2})
+
+
+def token(content: str, stop: bool = False) -> CompletionEvent:
+    return CompletionEvent(content=content, stop=stop, id_slot=0, payload={}, data=f'{{"content":"{content}"}}')
+
+
+class TestCoalescedFrames(unittest.IsolatedAsyncioTestCase):
+    async def test_burst_is_written_at_once(self):
+        async def events():
+            yield token("a")
+            await asyncio.sleep(0.001)
+            for content in "bcd":
+                yield token(content)
+            await asyncio.sleep(0.05)
+            yield token("e")
+            yield token("", stop=True)
+
+        writes = [write async for write in iter_frames(events(), coalesce_window=0.01)]
+
+        # First token at once, the burst within the window, then the stop frame without waiting for the window
+        self.assertEqual(len(writes), 3)
+        self.assertEqual(writes[0], token("a").frame)
+        self.assertEqual(writes[1], "".join(token(content).frame for content in "bcd"))
+        self.assertEqual(writes[2], token("e").frame + token("", stop=True).frame)
+
+    async def test_window_expires_while_waiting(self):
+        released = asyncio.Event()
+
+        async def events():
+            yield token("a")
+            await asyncio.sleep(0.001)
+            yield token("b")
+            await released.wait()
+            yield token("c")
+
+        frames = iter_frames(events(), coalesce_window=0.01)
+        self.assertEqual(await anext(frames), token("a").frame)
+        # "b" is written when the window expires, not when "c" arrives
+        self.assertEqual(await asyncio.wait_for(anext(frames), timeout=1), token("b").frame)
+        released.set()
+        self.assertEqual([write async for write in frames], [token("c").frame])
+
+    async def test_closing_closes_the_events(self):
+        closed = asyncio.Event()
+
+        async def events():
+            try:
+                yield token("a")
+                await asyncio.sleep(10)
+            finally:
+                closed.set()
+
+        frames = iter_frames(events(), coalesce_window=0.01)
+        await anext(frames)
+        # The client goes away while the next event is awaited
+        waiting = asyncio.ensure_future(anext(frames))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        await frames.aclose()
+        self.assertTrue(closed.is_set())
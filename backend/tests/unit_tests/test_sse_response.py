@@ -0,0 +1,81 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import unittest
+
+from starlette.background import BackgroundTask
+
+from src.utilities.httpkit.sse_response import EventStreamResponse
+
+
+class TestEventStreamResponse(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.closed = asyncio.Event()
+        self.released = []
+        self.sent = []
+
+    async def frames(self, count: int | None = None):
+        try:
+            n = 0
+            while count is None or n < count:
+                yield f"data: {n}\n\n"
+                n += 1
+                await asyncio.sleep(0.001)
+        finally:
+            self.closed.set()
+
+    async def send(self, message: dict):
+        self.sent.append(message)
+
+    async def test_disconnect_closes_the_generator(self):
+        async def receive():
+            await asyncio.sleep(0.02)
+            return {"type": "http.disconnect"}
+
+        response = EventStreamResponse(self.frames(), background=BackgroundTask(self.released.append, True))
+        await asyncio.wait_for(response({"type": "http"}, receive, self.send), timeout=1)
+
+        self.assertTrue(response.disconnected)
+        self.assertTrue(self.closed.is_set())
+        self.assertEqual(self.released, [True])
+        self.assertTrue(self.sent[-1]["more_body"])
+
+    async def test_finished_stream(self):
+        async def receive():
+            await asyncio.Event().wait()
+
+        response = EventStreamResponse(self.frames(count=3), background=BackgroundTask(self.released.append, True))
+        await response({"type": "http"}, receive, self.send)
+
+        self.assertFalse(response.disconnected)
+        self.assertEqual(
+            [message.get("body") for message in self.sent[1:]], [b"data: 0\n\n", b"data: 1\n\n", b"data: 2\n\n", b""]
+        )
+        self.assertIn((b"x-accel-buffering", b"no"), self.sent[0]["headers"])
+        self.assertEqual(self.released, [True])
+
+    async def test_generator_is_closed_when_sending_fails(self):
+        async def receive():
+            await asyncio.Event().wait()
+
+        async def send(message: dict):
+            if message["type"] == "http.response.body":
+                raise OSError("broken pipe")
+
+        response = EventStreamResponse(self.frames(), background=BackgroundTask(self.released.append, True))
+        with self.assertRaises(Exception):
+            await response({"type": "http"}, receive, send)
+        self.assertTrue(self.closed.is_set())
+        self.assertEqual(self.released, [True])
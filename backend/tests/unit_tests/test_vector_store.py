@@ -0,0 +1,48 @@
+# coding=utf-8
+
+# Copyright [2024] [SkywardAI]
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from src.repository.vector_store import IndexConfig, content_hash
+
+
+class TestIndexConfig(unittest.TestCase):
+    def test_hnsw(self):
+        config = IndexConfig(index_type="HNSW", hnsw_m=16, hnsw_ef_construction=200, hnsw_ef=64)
+        self.assertEqual(config.build_params, {"M": 16, "efConstruction": 200})
+        self.assertEqual(config.search_params(limit=5), {"metric_type": "COSINE", "params": {"ef": 64}})
+        # ef can't be lower than the number of results
+        self.assertEqual(config.search_params(limit=100)["params"], {"ef": 100})
+
+    def test_ivf_flat(self):
+        config = IndexConfig(index_type="IVF_FLAT", ivf_nlist=1024, ivf_nprobe=16)
+        self.assertEqual(config.build_params, {"nlist": 1024})
+        self.assertEqual(config.search_params(limit=5)["params"], {"nprobe": 16})
+
+    def test_other_indexes_use_the_defaults(self):
+        config = IndexConfig(index_type="AUTOINDEX")
+        self.assertEqual(config.build_params, {})
+        self.assertEqual(config.search_params(limit=5), {"metric_type": "COSINE", "params": {}})
+
+
+class TestContentHash(unittest.TestCase):
+    def test_depends_on_the_fields_and_the_model(self):
+        row = {"question": "q", "answer": "a"}
+        digest = content_hash(row, model="m1")
+
+        self.assertEqual(content_hash({"answer": "a", "question": "q"}, model="m1"), digest)
+        # The vector and the hash don't change the content
+        self.assertEqual(content_hash({**row, "question_embedding": [1.0], "content_hash": digest}, model="m1"), digest)
+        self.assertNotEqual(content_hash({**row, "answer": "b"}, model="m1"), digest)
+        self.assertNotEqual(content_hash(row, model="m2"), digest)